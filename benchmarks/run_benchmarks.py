@@ -0,0 +1,168 @@
+# succolib benchmark suite
+# usage: python benchmarks/run_benchmarks.py [--nevs 1000 10000 ...] [--repeat 3] [--tag v2024.3.0] [--history FILE]
+# every run is appended to a JSON history file, together with the environment info, and compared with the previous one
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import succolib as sl
+from synthetic import syntheticEvents, writeAsciiFileset, writeNpzFileset, writeRootFileset
+
+########################################################################################################################
+
+# time a function, best & median over repetitions
+# --> return a dictionary with the timing info, in seconds
+def timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return {"best" : min(times), "median" : float(np.median(times)), "repeat" : repeat}
+
+########################################################################################################################
+
+# package import times, each measured in a fresh interpreter (what e.g. each batch worker process pays)
+# --> return a dictionary { benchmark name : timing info or error string }
+def run_import(repeat):
+    results = {}
+    dictStatements = {
+        "import.package" : "import succolib",
+        "import.math_tools" : "import succolib; succolib.fGaus; succolib.zProj",
+        "import.io" : "import succolib; succolib.cAkDataset",
+        "import.all" : "from succolib import *",
+    }
+    for name, statement in dictStatements.items():
+        code = "import time; t0 = time.perf_counter(); %s; print(time.perf_counter() - t0)" % statement
+        try:
+            times = [float(subprocess.run(
+                [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."),
+            ).stdout) for _ in range(repeat)]
+            results[name] = {"best" : min(times), "median" : float(np.median(times)), "repeat" : repeat}
+        except Exception as e:
+            results[name] = "error: %s: %s" % (type(e).__name__, e)
+        print("  %-48s %s" % (name, ("%.4f s" % results[name]["best"]) if isinstance(results[name], dict) else results[name]))
+    return results
+
+########################################################################################################################
+
+# dataset from a synthetic ROOT fileset, opened via cAkDataset
+def make_dataset(nameFormat, treeName):
+    dataset = sl.cAkDataset("ROOT", nameFormat, ["000000", "000001"], treeName=treeName, varlist=[
+        "xRaw0", "yRaw0", "xRaw1", "yRaw1", "nStrip", "wf",
+    ])
+    dataset.open()
+    return dataset
+
+dictWfParams = {"wf" : {
+    "x0BaseRange" : [0, 20], "bPositive" : False, "samplingRate" : 5e9, "nbit" : 12, "rangeVpp" : 1,
+    "unitX" : 1e-9, "unitY" : 1e-3,
+}}
+dictTrackParams = {"z" : [0, 1000], "dictProjections" : {"Crys" : 1500}}
+
+########################################################################################################################
+
+# all the benchmarks for a certain nr. of events
+# --> return a dictionary { benchmark name : timing info or error string }
+def run_all(nEv, nSamples, repeat, tmpdir):
+    results = {}
+
+    def run(name, func, rep=repeat):
+        try:
+            results[name] = timeit(func, rep)
+        except Exception as e:
+            results[name] = "error: %s: %s" % (type(e).__name__, e)
+        print("  %-48s %s" % (name, ("%.4f s" % results[name]["best"]) if isinstance(results[name], dict) else results[name]))
+
+    # input functions
+    nameFormat, asciiMap = writeAsciiFileset(os.path.join(tmpdir, "ascii_%d" % nEv), nEv=nEv, nSamples=nSamples)
+    run("io.asciiToAkMulti", lambda: sl.asciiToAkMulti(nameFormat, ["000000", "000001"], asciiMap, descFrac={}))
+    nameFormat, npzMap, arrayName = writeNpzFileset(os.path.join(tmpdir, "npz_%d" % nEv), nEv=nEv, nSamples=nSamples)
+    run("io.npzToDfMulti", lambda: sl.npzToDfMulti(nameFormat, ["000000", "000001"], npzMap, arrayName, descFrac={}))
+    run("io.npzToAkMulti", lambda: sl.npzToAkMulti(nameFormat, ["000000", "000001"], npzMap, arrayName, descFrac={}))
+    nameFormat, treeName = writeRootFileset(os.path.join(tmpdir, "root_%d" % nEv), nEv=nEv, nSamples=nSamples)
+    run("io.rootToAkMulti", lambda: sl.rootToAkMulti(nameFormat, ["000000", "000001"], treeName, varlist=None, descFrac={}))
+
+    # collections
+    dataset = make_dataset(nameFormat, treeName)
+    x0 = np.array([dataset.data["xRaw0"], dataset.data["xRaw1"]]).T
+    y0 = np.array([dataset.data["yRaw0"], dataset.data["yRaw1"]]).T
+    collection_tr = sl.cTracksCollection(dataset, x0, y0, dictTrackParams)
+    run("collections.tracks.full_calculations", collection_tr.full_calculations_output, 1)
+    collection_wf = sl.cWaveFormsCollection(dataset, ["wf"], dictWfParams, bOutWfs=True)
+    run("collections.wfs.full_calculations", collection_wf.full_calculations_output, 1)
+
+    # histograms & fits
+    run("collections.create_histo_1d", lambda: collection_tr.create_histo_1d("wf_out_ph", bins=100))
+    run("collections.create_histo_2d", lambda: collection_tr.create_histo_2d("wf_out_ph", "wf_out_peak_time", bins=100))
+    run("collections.analyse_main_distributions.tracks", lambda: collection_tr.analyse_main_distributions())
+    hist = collection_tr.create_histo_1d(np.random.default_rng(0).normal(0, 1, nEv), bins=100)
+    run("collections.fit_gaus", lambda: collection_tr._fit_hist1d_gaus(hist, upar_fit=0, spar_fit=1))
+    hist = collection_tr.create_histo_1d(np.random.default_rng(0).gumbel(0, 1, nEv), bins=100)
+    run("collections.fit_landau", lambda: collection_tr._fit_hist1d_landau(hist, upar_fit=0, spar_fit=1))
+
+    return results
+
+########################################################################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="succolib benchmark suite")
+    parser.add_argument("--nevs", type=int, nargs="+", default=[1000, 10000], help="nr. of events per benchmark run")
+    parser.add_argument("--nsamples", type=int, default=64, help="nr. of samples per waveform")
+    parser.add_argument("--repeat", type=int, default=3, help="nr. of repetitions per benchmark")
+    parser.add_argument("--tag", default="dev", help="label of this run, e.g. the release version")
+    parser.add_argument(
+        "--history", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json"),
+        help="JSON history file to append the results to",
+    )
+    args = parser.parse_args()
+
+    import awkward, uproot
+    run_info = {
+        "tag" : args.tag,
+        "timestamp" : datetime.datetime.now().isoformat(timespec="seconds"),
+        "env" : {
+            "python" : platform.python_version(), "platform" : platform.platform(),
+            "numpy" : np.__version__, "awkward" : awkward.__version__, "uproot" : uproot.__version__,
+        },
+        "nsamples" : args.nsamples,
+        "results" : {},
+    }
+    print("import times")
+    run_info["results"]["import"] = run_import(args.repeat)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for nEv in args.nevs:
+            print("nr. of events: %d" % nEv)
+            run_info["results"][str(nEv)] = run_all(nEv, args.nsamples, args.repeat, tmpdir)
+
+    history = []
+    if os.path.isfile(args.history):
+        with open(args.history, "r") as f:
+            history = json.load(f)
+
+    # comparison with the previous run, if any
+    if len(history) > 0:
+        print("comparison with the previous run (%s, %s), best times ratio:" % (history[-1]["tag"], history[-1]["timestamp"]))
+        for nEv in run_info["results"]:
+            for name, res in run_info["results"][nEv].items():
+                res_old = history[-1]["results"].get(nEv, {}).get(name)
+                if isinstance(res, dict) & isinstance(res_old, dict):
+                    ratio = res["best"] / res_old["best"]
+                    print("  %-8s %-48s %6.2f%s" % (nEv, name, ratio, "  <-- slower" if ratio > 1.2 else ""))
+
+    history.append(run_info)
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent=1)
+    print("results appended to %s" % args.history)
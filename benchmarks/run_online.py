@@ -0,0 +1,58 @@
+# online monitoring check: a stand-in data acquisition writes spill files into a temporary directory while a dataset
+# watches it, with the track & waveform collection calculations run on the new events at each update
+# usage: python benchmarks/run_online.py [--nspills 5] [--nevs 1000] [--period 0.5]
+
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import succolib as sl
+from synthetic import writeRootOnline
+from run_benchmarks import dictWfParams, dictTrackParams
+
+########################################################################################################################
+
+# track collection inputs from a dataset
+def tracks_x0(dataset):
+    return np.array([dataset.data["xRaw0"], dataset.data["xRaw1"]]).T
+def tracks_y0(dataset):
+    return np.array([dataset.data["yRaw0"], dataset.data["yRaw1"]]).T
+
+########################################################################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="succolib online monitoring check")
+    parser.add_argument("--nspills", type=int, default=5, help="nr. of spill files written")
+    parser.add_argument("--nevs", type=int, default=1000, help="nr. of events per spill")
+    parser.add_argument("--period", type=float, default=0.5, help="time between spills, in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        nameFormat, treeName, thread = writeRootOnline(tmpdir, nSpills=args.nspills, nEvPerSpill=args.nevs, period=args.period)
+
+        dataset = sl.cAkDataset("ROOT", nameFormat, ["000000"], treeName=treeName, varlist=[
+            "xRaw0", "yRaw0", "xRaw1", "yRaw1", "nStrip", "wf",
+        ]).open()
+        collection_tr = sl.cTracksCollection(dataset, tracks_x0(dataset), tracks_y0(dataset), dictTrackParams)
+        collection_tr.full_calculations_output()
+        collection_wf = sl.cWaveFormsCollection(dataset, ["wf"], dictWfParams)
+        collection_wf.full_calculations_output()
+        dataset.add_watch_collection(collection_tr, {"x0" : tracks_x0, "y0" : tracks_y0})
+        dataset.add_watch_collection(collection_wf)
+
+        dataset.watch(period=args.period / 2, tMax=args.period * (args.nspills + 2))
+        thread.join()
+        dataset.update()
+
+        nevs = args.nspills * args.nevs
+        print("events: %d (expected %d)" % (dataset.nevs, nevs))
+        print("track & waveform outputs on all the events: %s" % (
+            all([len(dataset.data[s]) == nevs for s in ["thx", "wf_out_ph"]])
+        ))
+        print("index values consecutive: %s" % np.array_equal(np.asarray(dataset.data["index"]), np.arange(nevs)))
+        dataset.profile.print_summary()
@@ -0,0 +1,153 @@
+import numpy as np
+import os
+import threading
+import time
+
+########################################################################################################################
+
+# synthetic tracking + waveform events, the same for all the file formats
+# nEv is the nr. of events, nSamples the nr. of samples per waveform, seed the random generator seed
+# --> return a dictionary { variable name : array }, with scalar variables only (waveform samples as wf_0, wf_1, ...)
+def syntheticEvents(
+        nEv,
+        nSamples = 64,
+        seed = 0,
+):
+
+    rng = np.random.default_rng(seed)
+    dictEv = {
+        "xRaw0" : rng.normal(0, 1, nEv),
+        "yRaw0" : rng.normal(0, 1, nEv),
+        "xRaw1" : rng.normal(0, 1.2, nEv),
+        "yRaw1" : rng.normal(0, 1.2, nEv),
+        "nStrip" : rng.integers(1, 5, nEv).astype(float),
+    }
+    t = np.arange(nSamples)
+    wfs = 2000 + rng.normal(0, 3, (nEv, nSamples))\
+        - 500 * rng.random((nEv, 1)) * np.exp(-0.5 * ((t - 0.6 * nSamples) / (0.05 * nSamples)) ** 2)
+    for i in range(nSamples):
+        dictEv["wf_%d" % i] = np.round(wfs[:, i])
+    return dictEv
+
+########################################################################################################################
+
+# split the events into filesets & files, with names following the XXXXXX/YYYYYY convention, private
+# --> return a list of (file name, first event, last event + 1)
+def _splitFileset(nameFormat, fileIndex, nFilesPerIndex, nEv):
+    names = [nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "%06d" % iFile)
+             for iIndex in fileIndex for iFile in range(nFilesPerIndex)]
+    edges = np.linspace(0, nEv, len(names)+1).astype(int)
+    return [(names[i], edges[i], edges[i+1]) for i in range(len(names))]
+
+########################################################################################################################
+
+# write a synthetic fileset of text files
+# outdir is the destination directory, fileIndex the list of fileset IDs, nFilesPerIndex the nr. of files per fileset
+# nEv the total nr. of events, nLinesEv the nr. of lines per event (variables split evenly among lines)
+# --> return nameFormat, asciiMap (to be used in asciiToAkMulti & co.)
+def writeAsciiFileset(
+        outdir,
+        fileIndex = ("000000", "000001"),
+        nFilesPerIndex = 2,
+        nEv = 10000,
+        nSamples = 64,
+        nLinesEv = 1,
+):
+
+    os.makedirs(outdir, exist_ok=True)
+    dictEv = syntheticEvents(nEv, nSamples)
+    asciiMap = list(dictEv.keys())[:nLinesEv * (len(dictEv) // nLinesEv)]
+    table = np.array([dictEv[s] for s in asciiMap]).T.reshape(nEv * nLinesEv, -1)
+    nameFormat = os.path.join(outdir, "runXXXXXX_spillYYYYYY.dat")
+    for (name, iEv0, iEv1) in _splitFileset(nameFormat, fileIndex, nFilesPerIndex, nEv):
+        np.savetxt(name, table[iEv0*nLinesEv:iEv1*nLinesEv], fmt="%g")
+    return nameFormat, asciiMap
+
+########################################################################################################################
+
+# write a synthetic fileset of (uncompressed) NumPy array files, same arguments as writeAsciiFileset
+# --> return nameFormat, npzMap, arrayName (to be used in npzToDfMulti & co.)
+def writeNpzFileset(
+        outdir,
+        fileIndex = ("000000", "000001"),
+        nFilesPerIndex = 2,
+        nEv = 10000,
+        nSamples = 64,
+        nLinesEv = 1,
+):
+
+    os.makedirs(outdir, exist_ok=True)
+    dictEv = syntheticEvents(nEv, nSamples)
+    npzMap = list(dictEv.keys())[:nLinesEv * (len(dictEv) // nLinesEv)]
+    table = np.array([dictEv[s] for s in npzMap]).T.reshape(nEv * nLinesEv, -1)
+    nameFormat = os.path.join(outdir, "runXXXXXX_spillYYYYYY.npz")
+    for (name, iEv0, iEv1) in _splitFileset(nameFormat, fileIndex, nFilesPerIndex, nEv):
+        np.savez(name, data=table[iEv0*nLinesEv:iEv1*nLinesEv])
+    return nameFormat, npzMap, "data"
+
+########################################################################################################################
+
+# write a synthetic fileset of ROOT files (via uproot), same arguments as writeAsciiFileset but nLinesEv
+# the waveform is stored as a single fixed-size array branch "wf"
+# --> return nameFormat, treeName (to be used in rootToAkMulti & co.)
+def writeRootFileset(
+        outdir,
+        fileIndex = ("000000", "000001"),
+        nFilesPerIndex = 2,
+        nEv = 10000,
+        nSamples = 64,
+):
+
+    import uproot
+    os.makedirs(outdir, exist_ok=True)
+    dictEv = syntheticEvents(nEv, nSamples)
+    dictTree = {s : dictEv[s] for s in dictEv if not s.startswith("wf_")}
+    dictTree["wf"] = np.array([dictEv["wf_%d" % i] for i in range(nSamples)]).T
+    nameFormat = os.path.join(outdir, "runXXXXXX_spillYYYYYY.root")
+    for (name, iEv0, iEv1) in _splitFileset(nameFormat, fileIndex, nFilesPerIndex, nEv):
+        with uproot.recreate(name) as f:
+            f["t"] = {s : dictTree[s][iEv0:iEv1] for s in dictTree}
+    return nameFormat, "t"
+
+########################################################################################################################
+
+# stand-in for a data acquisition writing ROOT files while the run goes on, e.g. to test the online monitoring
+# (cAkDataset.update/watch): a background thread writes a new spill file every period seconds -- each file is written
+# to a temporary name first and then renamed, as it would appear to a reader, complete
+# outdir is the destination directory (e.g. a temporary one), fileIndex the list of fileset IDs
+# nSpills is the nr. of spill files per fileset, nEvPerSpill the nr. of events per file, period the time between files
+# the first spill of each fileset is written before returning, so that the dataset can be opened right away
+# --> return nameFormat, treeName & the writer thread (to be joined at the end)
+def writeRootOnline(
+        outdir,
+        fileIndex = ("000000",),
+        nSpills = 5,
+        nEvPerSpill = 1000,
+        period = 0.5,
+        nSamples = 64,
+):
+
+    import uproot
+    os.makedirs(outdir, exist_ok=True)
+    nameFormat = os.path.join(outdir, "runXXXXXX_spillYYYYYY.root")
+
+    def write_spill(iIndex, iSpill):
+        dictEv = syntheticEvents(nEvPerSpill, nSamples, seed=iSpill)
+        dictTree = {s : dictEv[s] for s in dictEv if not s.startswith("wf_")}
+        dictTree["wf"] = np.array([dictEv["wf_%d" % i] for i in range(nSamples)]).T
+        name = nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "%06d" % iSpill)
+        with uproot.recreate(name + ".tmp") as f:
+            f["t"] = dictTree
+        os.replace(name + ".tmp", name)
+
+    def writer():
+        for iSpill in range(1, nSpills):
+            time.sleep(period)
+            for iIndex in fileIndex:
+                write_spill(iIndex, iSpill)
+
+    for iIndex in fileIndex:
+        write_spill(iIndex, 0)
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    return nameFormat, "t", thread
@@ -1,6 +1,18 @@
-from .io.__init__ import *
-from .math_tools.__init__ import *
-from .tracking.__init__ import *
-from .statistics.__init__ import *
-from .visualisation.__init__ import *
-from .waveforms.__init__ import *
\ No newline at end of file
+import importlib
+
+from .lazy import _lazyGetattr, _lazyDir
+
+# all the objects of the subpackages are available at the package level, but they are only imported (with their
+# dependencies) when first accessed, e.g. succolib.fGaus does not import matplotlib, scipy, pandas, uproot, etc.
+_subpackages = ("io", "math_tools", "tracking", "statistics", "visualisation", "waveforms", "profiling")
+_lazyMap = {}
+for _subpackage in _subpackages:
+    for _name in importlib.import_module("." + _subpackage, __name__).__all__:  # subpackage __init__ only, lightweight
+        _lazyMap[_name] = _subpackage
+__all__ = list(_lazyMap.keys())
+
+def __getattr__(name):
+    return _lazyGetattr(__name__, globals(), _lazyMap, name)
+
+def __dir__():
+    return _lazyDir(globals(), _lazyMap)
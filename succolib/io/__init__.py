@@ -1,5 +1,47 @@
-from .misc import dfMirror, dfReshape, akMirror, akReshape
-from .ascii import asciiToDf, asciiToDfMulti, asciiToAk, asciiToAkMulti
-from .root import rootToDfMulti, rootToAkMulti
-from .npz import npzToDf, npzToDfMulti
-from .datasets import cAkDataset
\ No newline at end of file
+from ..lazy import _lazyGetattr, _lazyDir
+
+# objects of the subpackage, imported only when first accessed (see lazy.py)
+_lazyMap = {
+    "dfMirror" : "misc",
+    "dfReshape" : "misc",
+    "akMirror" : "misc",
+    "akReshape" : "misc",
+    "akTransform" : "misc",
+    "akCategorical" : "misc",
+    "akToCategorical" : "misc",
+    "akCategoryMask" : "misc",
+    "akConcatenate" : "misc",
+    "dfConcatenate" : "misc",
+    "asciiToDf" : "ascii",
+    "asciiToDfMulti" : "ascii",
+    "asciiToAk" : "ascii",
+    "asciiToAkMulti" : "ascii",
+    "rootToDfMulti" : "root",
+    "rootToAkMulti" : "root",
+    "akToRootMulti" : "root",
+    "npzToDf" : "npz",
+    "npzToDfMulti" : "npz",
+    "npzToAk" : "npz",
+    "npzToAkMulti" : "npz",
+    "binaryToAk" : "binary",
+    "binaryToAkMulti" : "binary",
+    "parquetToAk" : "parquet",
+    "parquetToAkMulti" : "parquet",
+    "akToParquet" : "parquet",
+    "akToParquetMulti" : "parquet",
+    "cAkDataset" : "datasets",
+    "cRunCatalog" : "catalog",
+    "cCutEngine" : "cuts",
+    "prefetchIter" : "pipeline",
+    "akToShared" : "shared",
+    "sharedToAk" : "shared",
+    "sharedRelease" : "shared",
+    "sharedMap" : "shared",
+}
+__all__ = list(_lazyMap.keys())
+
+def __getattr__(name):
+    return _lazyGetattr(__name__, globals(), _lazyMap, name)
+
+def __dir__():
+    return _lazyDir(globals(), _lazyMap)
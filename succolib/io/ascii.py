@@ -2,11 +2,54 @@ import numpy as np
 import glob
 import pandas as pd
 import os
+import sys
 import time
+from itertools import islice
 import awkward as ak
 from tqdm.auto import tqdm
 
-from .misc import dfMirror, akMirror
+from .misc import dfMirror, akMirror, akConcatenate, akToCategorical, _akCategoricalFill, _akWithField, dfConcatenate, _dfCategoricalFill
+from .sampling import _descFracClip, _sampleSel, _sampleApply, _sampleBudget
+from ..profiling.profile_report import _profTimer, _profCount
+
+########################################################################################################################
+
+# read the (events * variables) table of a single text file, with the descaling applied, private
+# the events sampled out are not even parsed
+# nEvMax is the maximum nr. of events to return: the file is not read past the last line needed, if known in advance
+# --> return the table, None if the file contains no events
+def _asciiTable(
+        fileName,
+        nLinesEv = 1,
+        descFrac = 1,
+        descMode = "strided",
+        descSeed = 0,
+        profile = None,
+        nEvMax = 10000000000,
+):
+
+    descFrac = _descFracClip(descFrac)
+    # note: no max_rows here, as np.loadtxt preallocates that many rows -- a budget smaller than the nr. of bytes in
+    # the file (i.e. possibly smaller than its nr. of lines) is handled by the line-by-line reading below instead
+    if (descFrac >= 1) & (nLinesEv == 1) & (nEvMax >= os.stat(fileName).st_size):
+        with _profTimer(profile, "parse"):  # file reading & parsing together here
+            dataTableTemp = np.loadtxt(fileName, unpack=False, ndmin=2)
+        return dataTableTemp if len(dataTableTemp) > 0 else None
+    
+    # last line needed, only known in advance if no descaling or strided descaling
+    nLinesMax = min(nEvMax * int(1 / descFrac) * nLinesEv, sys.maxsize)\
+        if ((descFrac >= 1) | (descMode == "strided")) else None
+    with _profTimer(profile, "read"):
+        with open(fileName, "r") as f:
+            lines = [line.strip() for line in islice((line for line in f if len(line.strip()) > 0), nLinesMax)]
+    with _profTimer(profile, "parse"):
+        nEv = len(lines) // nLinesEv
+        if nLinesEv > 1:  # all the lines of each event joined into a single one
+            lines = [" ".join(lines[i:i+nLinesEv]) for i in range(0, nEv * nLinesEv, nLinesEv)]
+        lines = _sampleApply(lines, _sampleBudget(_sampleSel(nEv, descFrac, descMode, descSeed, fileName), nEvMax))
+        if len(lines) == 0:
+            return None
+        return np.loadtxt(lines, unpack=False, ndmin=2)
 
 ########################################################################################################################
 
@@ -19,30 +62,23 @@ def asciiToDf(
         mirrorMap = (),  # this is a tuple here, but a dictionary in asciiToDfMulti() (i.e. the "main" function)
         bVerbose = False,
         bProgress = False,
+        descMode = "strided",
+        descSeed = 0,
 ):
 
     t0 = time.time()  # chronometer start
     names = sorted(glob.glob(nameFormat.replace("YYYYYY", "*")))  # list of all the filenames of the current run
     df = pd.DataFrame()
-    descFrac = 1e-12 if descFrac <= 0 else (descFrac if descFrac <= 1 else 1)
+    lsDf = []
+    descFrac = _descFracClip(descFrac)
     for iName in tqdm((names)) if (bVerbose & bProgress) else names:
         if os.stat(iName).st_size > 0:
-            if nLinesEv == 1:
-                dataTableTemp = np.loadtxt(iName, unpack=False, ndmin=2)
-            else:
-                fileToString0 = open(iName,'r').read()
-                fileToStringSplitted0 = fileToString0.splitlines()
-                fileToString = ""
-                for i, iLine in enumerate(fileToStringSplitted0):
-                    if (i%nLinesEv==nLinesEv-1):
-                        fileToString += iLine + "\n"
-                    else:
-                        fileToString += iLine + " "
-                fileToStringSplitted = fileToString.splitlines()
-                dataTableTemp = np.loadtxt(fileToStringSplitted)
-            dfTemp = pd.DataFrame(dataTableTemp, columns=asciiMap)
-            df = df.append(dfTemp[dfTemp.index % int(1 / descFrac) == 0], ignore_index=True, sort=False)
-            df = dfMirror(df, mirrorMap)
+            dataTableTemp = _asciiTable(iName, nLinesEv, descFrac, descMode, descSeed)
+            if dataTableTemp is None:
+                continue
+            lsDf.append(dfMirror(pd.DataFrame(dataTableTemp, columns=asciiMap), mirrorMap))
+    if len(lsDf) > 0:
+        df = pd.concat(lsDf, ignore_index=True, sort=False)
     t1 = time.time()  # chronometer stop
     dt = t1 - t0
     return df, dt
@@ -59,6 +95,8 @@ def asciiToDfMulti(
         mirrorMap = {},
         bVerbose = False,
         bProgress = False,
+        descMode = "strided",
+        descSeed = 0,
 ):
 
     t0 = time.time()  # chronometer start
@@ -68,7 +106,7 @@ def asciiToDfMulti(
             descFrac.update({iIndex: 1})  # all the undefined descaling factors are trivially set to 1
         if bVerbose:
             print("(%d/%d) %s -- descaling fraction: %14.12f" % (i+1, len(fileIndex), iIndex, descFrac[iIndex]))
-        dfTemp, _ = asciiToDf(nameFormat.replace("XXXXXX", iIndex), asciiMap, nLinesEv, descFrac[iIndex], bVerbose=bVerbose, bProgress=bProgress)
+        dfTemp, _ = asciiToDf(nameFormat.replace("XXXXXX", iIndex), asciiMap, nLinesEv, descFrac[iIndex], bVerbose=bVerbose, bProgress=bProgress, descMode=descMode, descSeed=descSeed)
 
         # data mirroring according to mirrorMap, which differs from iLayer to iLayer
         if iIndex in mirrorMap:
@@ -83,12 +121,13 @@ def asciiToDfMulti(
         if len(fileIndexName)>0:
             if bVerbose:
                 print("%s also added to df" % fileIndexName)
+            # as a categorical column, i.e. integer codes + table of categories
             if not (fileIndexName in dfTemp.columns):
-                dfTemp[fileIndexName] = str(iIndex)
+                dfTemp[fileIndexName] = _dfCategoricalFill(len(dfTemp), iIndex)
             else:
-                dfTemp[fileIndexName] = dfTemp[fileIndexName].astype(str)
+                dfTemp[fileIndexName] = dfTemp[fileIndexName].astype(str).astype("category")
 
-        df = df.append(dfTemp, ignore_index=True, sort=False)
+        df = dfConcatenate((df, dfTemp))
     t1 = time.time()  # chronometer stop
     dt = t1 - t0
     return df, dt
@@ -105,35 +144,33 @@ def asciiToAk(
         mirrorMap = (),  # this is a tuple here, but a dictionary in asciiToAkMulti() (i.e. the "main" function)
         bVerbose = False,
         bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
 ):
 
     t0 = time.time()  # chronometer start
-    names = sorted(glob.glob(nameFormat.replace("YYYYYY", "*")))  # list of all the filenames of the current run
+    with _profTimer(profile, "glob"):
+        names = sorted(glob.glob(nameFormat.replace("YYYYYY", "*")))  # list of all the filenames of the current run
     df = ak.Array([])
-    descFrac = 1e-12 if descFrac <= 0 else (descFrac if descFrac <= 1 else 1)
+    descFrac = _descFracClip(descFrac)
     for iName in tqdm((names)) if (bVerbose & bProgress) else names:
         if os.stat(iName).st_size > 0:
-            if nLinesEv == 1:
-                dataTableTemp = np.loadtxt(iName, unpack=False, ndmin=2)
-            else:
-                fileToString0 = open(iName,'r').read()
-                fileToStringSplitted0 = fileToString0.splitlines()
-                fileToString = ""
-                for i, iLine in enumerate(fileToStringSplitted0):
-                    if (i%nLinesEv==nLinesEv-1):
-                        fileToString += iLine + "\n"
-                    else:
-                        fileToString += iLine + " "
-                fileToStringSplitted = fileToString.splitlines()
-                dataTableTemp = np.loadtxt(fileToStringSplitted)
-            dfTemp = ak.Array(dict(zip(asciiMap, np.array(dataTableTemp).T)))
-            df = df.append(dfTemp[0:int(len(dfTemp) * descFrac)])
-            df = akMirror(df, mirrorMap)
-            if len(df)>nEvMax:
+            _profCount(profile, "bytes_read", os.stat(iName).st_size)
+            dataTableTemp = _asciiTable(iName, nLinesEv, descFrac, descMode, descSeed, profile, nEvMax - len(df))
+            if dataTableTemp is None:
+                continue
+            _profCount(profile, "events_read", len(dataTableTemp))
+            dfTemp = ak.Array(dict(zip(asciiMap, dataTableTemp.T)))
+            with _profTimer(profile, "mirror"):
+                dfTemp = akMirror(dfTemp, mirrorMap)
+            with _profTimer(profile, "concat"):
+                df = dfTemp if len(df) == 0 else ak.concatenate((df, dfTemp))
+            if len(df)>=nEvMax:  # read budget exhausted, the remaining files are not even opened
                 df = df[:nEvMax]
                 if bVerbose:
                     print("event nr. reached nEvMax=%d, breaking" % nEvMax)
-                break            
+                break
     t1 = time.time()  # chronometer stop
     dt = t1 - t0
     return df, dt
@@ -151,6 +188,9 @@ def asciiToAkMulti(
         mirrorMap = {},
         bVerbose = False,
         bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
 ):
 
     t0 = time.time()  # chronometer start
@@ -160,13 +200,14 @@ def asciiToAkMulti(
             descFrac.update({iIndex: 1})  # all the undefined descaling factors are trivially set to 1
         if bVerbose:
             print("(%d/%d) %s -- descaling fraction: %14.12f" % (i+1, len(fileIndex), iIndex, descFrac[iIndex]))
-        dfTemp, _ = asciiToAk(nameFormat.replace("XXXXXX", iIndex), asciiMap, nLinesEv, descFrac[iIndex], nEvMax, bVerbose=bVerbose, bProgress=bProgress)
+        dfTemp, _ = asciiToAk(nameFormat.replace("XXXXXX", iIndex), asciiMap, nLinesEv, descFrac[iIndex], nEvMax - len(df), bVerbose=bVerbose, bProgress=bProgress, profile=profile, descMode=descMode, descSeed=descSeed)
         
         # data mirroring according to mirrorMap, which differs from iLayer to iLayer
         if iIndex in mirrorMap:
             if bVerbose:
                 print("mirroring (from mirror map given) "+str(mirrorMap[iIndex]))
-            dfTemp = akMirror(dfTemp, mirrorMap[iIndex])
+            with _profTimer(profile, "mirror"):
+                dfTemp = akMirror(dfTemp, mirrorMap[iIndex])
         else:
             if bVerbose:
                 print("no variables to mirror")
@@ -175,18 +216,46 @@ def asciiToAkMulti(
         if len(fileIndexName)>0:
             if bVerbose:
                 print("%s also added to df" % fileIndexName)
-            if not (fileIndexName in dfTemp.fields):
-                dfTemp[fileIndexName] = str(iIndex)
-            else:
-                akTemp = ak.to_list(dfTemp[fileIndexName])
-                dfTemp[fileIndexName] = ak.Array([str(ind) for ind in akTemp])
+            if len(dfTemp.fields) > 0:  # as a categorical column, i.e. integer codes + table of levels
+                if not (fileIndexName in dfTemp.fields):
+                    dfTemp = _akWithField(dfTemp, fileIndexName, _akCategoricalFill(len(dfTemp), iIndex))
+                else:
+                    dfTemp = _akWithField(dfTemp, fileIndexName, akToCategorical(dfTemp[fileIndexName]))
 
-        df = ak.concatenate((df, dfTemp))
-        if len(df)>nEvMax:
+        with _profTimer(profile, "concat"):
+            df = akConcatenate((df, dfTemp))
+        _profCount(profile, "bytes_allocated", df.nbytes)
+        if len(df)>=nEvMax:  # read budget exhausted, the remaining filesets are not even globbed
             df = df[:nEvMax]
             if bVerbose:
                 print("event nr. reached nEvMax=%d, breaking" % nEvMax)
             break
     t1 = time.time()  # chronometer stop
     dt = t1 - t0
-    return df, dt
\ No newline at end of file
+    return df, dt
+########################################################################################################################
+
+# read the complete events stored in a single text file after a certain byte, private
+# (used to follow files that keep growing, e.g. during data taking -- incomplete trailing lines/events are skipped)
+# --> return the Awkward Array with the new events and the byte position after the last complete event
+def _asciiToAkFrom(
+        fileName,
+        asciiMap,
+        nLinesEv = 1,
+        byteStart = 0,
+):
+
+    with open(fileName, "rb") as f:
+        f.seek(byteStart)
+        content = f.read()
+    content = content[:content.rfind(b"\n")+1]  # only complete lines
+    lines = content.splitlines(keepends=True)
+    nLinesOk = (len(lines) // nLinesEv) * nLinesEv  # only complete events
+    byteStop = byteStart + sum(len(line) for line in lines[:nLinesOk])
+
+    linesEv = [b" ".join(line.strip() for line in lines[i:i+nLinesEv]) for i in range(0, nLinesOk, nLinesEv)]
+    linesEv = [line for line in linesEv if len(line) > 0]
+    if len(linesEv) == 0:
+        return ak.Array([]), byteStop
+    dataTableTemp = np.loadtxt(linesEv, unpack=False, ndmin=2)
+    return ak.Array(dict(zip(asciiMap, np.array(dataTableTemp).T))), byteStop
@@ -0,0 +1,183 @@
+import numpy as np
+import glob
+import awkward as ak
+import os
+import time
+from tqdm.auto import tqdm
+
+from .misc import akMirror, akConcatenate, akToCategorical, _akCategoricalFill, _akWithField
+from .sampling import _descFracClip, _sampleSel, _sampleApply, _sampleBudget
+from ..profiling.profile_report import _profTimer, _profCount
+
+########################################################################################################################
+
+# nr. of complete records stored in a binary file, private
+# dtype is the (structured) record type, headerSize the nr. of bytes of the file header (before the first record)
+def _binaryNumRecords(fileName, dtype, headerSize=0):
+    return max(os.stat(fileName).st_size - headerSize, 0) // np.dtype(dtype).itemsize
+
+########################################################################################################################
+
+# turn a table of structured records into an Awkward Array, private
+# each (non-padding) field becomes a field of the Awkward Array, subarray fields (e.g. waveform channels) regular
+# arrays -- all views of the table, i.e. no copy is made, but for the fields whose byte order is not the native one
+# --> return the Awkward Array
+def _binaryTableToAk(table):
+    dictFields = {}
+    for s in table.dtype.names:
+        if table.dtype[s].base.kind == "V":  # padding & raw bytes are skipped
+            continue
+        field = table[s]
+        if not field.dtype.isnative:
+            field = field.astype(field.dtype.newbyteorder("="))
+        dictFields[s] = field
+    return ak.Array(dictFields) if len(dictFields) > 0 else ak.Array([])
+
+########################################################################################################################
+
+# read the events stored in a single binary file into an Awkward Array, private
+# the file is memory-mapped (copy-on-write): data are only read from disk when accessed, and the Awkward Array fields
+# are views of the file content (unless the random descaling mode is used, in which case the events kept are copied)
+# dtype is the (structured) record type, headerSize the nr. of bytes of the file header (before the first record)
+# incomplete trailing records (e.g. files still being written) are ignored
+# --> return the Awkward Array
+def _binaryToAkFile(
+        fileName,
+        dtype,
+        headerSize = 0,
+        descFrac = 1,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+        nEvMax = 10000000000,
+):
+
+    nEv = _binaryNumRecords(fileName, dtype, headerSize)
+    if nEv == 0:
+        return ak.Array([])
+    with _profTimer(profile, "read"):
+        table = np.memmap(fileName, dtype=np.dtype(dtype), mode="c", offset=headerSize, shape=(nEv,))
+    with _profTimer(profile, "reshape"):
+        table = _sampleApply(table, _sampleBudget(_sampleSel(nEv, descFrac, descMode, descSeed, fileName), nEvMax))
+        df = _binaryTableToAk(table)
+    _profCount(profile, "events_read", len(table))
+    return df
+
+########################################################################################################################
+
+# it's best to use binaryToAkMulti() (which exploits this binaryToAk()) also for single file opening
+def binaryToAk(
+        nameFormat,
+        dtype,
+        headerSize = 0,
+        descFrac = 1,
+        nEvMax = 10000000000,
+        mirrorMap = (),  # this is a tuple here, but a dictionary in binaryToAkMulti() (i.e. the "main" function)
+        bVerbose = False,
+        bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+):
+
+    t0 = time.time()  # chronometer start
+    with _profTimer(profile, "glob"):
+        names = sorted(glob.glob(nameFormat.replace("YYYYYY", "*")))  # list of all the filenames of the current run
+    df = ak.Array([])
+    descFrac = _descFracClip(descFrac)
+    for iName in tqdm((names)) if (bVerbose & bProgress) else names:
+        if os.stat(iName).st_size > 0:
+            _profCount(profile, "bytes_read", os.stat(iName).st_size)
+            dfTemp = _binaryToAkFile(iName, dtype, headerSize, descFrac, profile, descMode, descSeed, nEvMax - len(df))
+            if len(dfTemp) == 0:
+                continue
+            with _profTimer(profile, "mirror"):
+                dfTemp = akMirror(dfTemp, mirrorMap)
+            with _profTimer(profile, "concat"):
+                df = dfTemp if len(df) == 0 else ak.concatenate((df, dfTemp))
+            if len(df)>=nEvMax:  # read budget exhausted, the remaining files are not even opened
+                df = df[:nEvMax]
+                if bVerbose:
+                    print("event nr. reached nEvMax=%d, breaking" % nEvMax)
+                break
+    t1 = time.time()  # chronometer stop
+    dt = t1 - t0
+    return df, dt
+
+########################################################################################################################
+
+def binaryToAkMulti(
+        nameFormat,
+        fileIndex,
+        dtype,
+        headerSize = 0,
+        fileIndexName = "iIndex",
+        descFrac = {},
+        nEvMax = 10000000000,
+        mirrorMap = {},
+        bVerbose = False,
+        bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+):
+
+    t0 = time.time()  # chronometer start
+    df = ak.Array([])
+    for i, iIndex in enumerate(sorted(fileIndex)):
+        if not (iIndex in descFrac.keys()):
+            descFrac.update({iIndex: 1})  # all the undefined descaling factors are trivially set to 1
+        if bVerbose:
+            print("(%d/%d) %s -- descaling fraction: %14.12f" % (i+1, len(fileIndex), iIndex, descFrac[iIndex]))
+        dfTemp, _ = binaryToAk(nameFormat.replace("XXXXXX", iIndex), dtype, headerSize, descFrac[iIndex], nEvMax - len(df), bVerbose=bVerbose, bProgress=bProgress, profile=profile, descMode=descMode, descSeed=descSeed)
+
+        # data mirroring according to mirrorMap, which differs from iLayer to iLayer
+        if iIndex in mirrorMap:
+            if bVerbose:
+                print("mirroring (from mirror map given) "+str(mirrorMap[iIndex]))
+            with _profTimer(profile, "mirror"):
+                dfTemp = akMirror(dfTemp, mirrorMap[iIndex])
+        else:
+            if bVerbose:
+                print("no variables to mirror")
+
+        # fileIndexName column creation (if requested & not already existing)
+        if len(fileIndexName)>0:
+            if bVerbose:
+                print("%s also added to df" % fileIndexName)
+            if len(dfTemp.fields) > 0:  # as a categorical column, i.e. integer codes + table of levels
+                if not (fileIndexName in dfTemp.fields):
+                    dfTemp = _akWithField(dfTemp, fileIndexName, _akCategoricalFill(len(dfTemp), iIndex))
+                else:
+                    dfTemp = _akWithField(dfTemp, fileIndexName, akToCategorical(dfTemp[fileIndexName]))
+
+        with _profTimer(profile, "concat"):
+            df = akConcatenate((df, dfTemp))
+        _profCount(profile, "bytes_allocated", df.nbytes)
+        if len(df)>=nEvMax:  # read budget exhausted, the remaining filesets are not even globbed
+            df = df[:nEvMax]
+            if bVerbose:
+                print("event nr. reached nEvMax=%d, breaking" % nEvMax)
+            break
+    t1 = time.time()  # chronometer stop
+    dt = t1 - t0
+    return df, dt
+
+########################################################################################################################
+
+# read the complete records stored in a single binary file after a certain byte, private
+# (used to follow files that keep growing, e.g. during data taking -- incomplete trailing records are skipped)
+# --> return the Awkward Array with the new events and the byte position after the last complete record
+def _binaryToAkFrom(
+        fileName,
+        dtype,
+        headerSize = 0,
+        byteStart = 0,
+):
+
+    byteStart = max(byteStart, headerSize)
+    nEv = _binaryNumRecords(fileName, dtype, byteStart)
+    if nEv == 0:
+        return ak.Array([]), byteStart
+    table = np.memmap(fileName, dtype=np.dtype(dtype), mode="c", offset=byteStart, shape=(nEv,))
+    return _binaryTableToAk(table), byteStart + nEv * np.dtype(dtype).itemsize
@@ -0,0 +1,227 @@
+import numpy as np
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .sampling import _descFracClip, _sampleSel, _sampleBudget
+
+########################################################################################################################
+
+# run catalog files: one JSON file per fileset, with, for each input file (in the loaders order)
+#   path, size (bytes), mtime (ns) -- to detect changed files
+#   nevs -- the nr. of events, counted as the loaders do (e.g. non-empty lines // nLinesEv for text files)
+#   schema -- the variables stored in the file (e.g. ROOT branches & types, NumPy array dtype & shape, ...)
+# plus the options the counting depends on (data type, tree/array name, nLinesEv, binary record type & header size)
+
+catalogVersion = 1
+
+########################################################################################################################
+
+# count the events in a single input file & get its schema, private (executed in parallel by cRunCatalog)
+# opts is the dictionary of the counting options (see cRunCatalog.__opts), with the actual binary record type
+# --> return the nr. of events & the schema (JSON-serialisable)
+def _catalogScan(fileName, opts):
+    dataType = opts["dataType"]
+    if dataType == "ROOT":
+        import uproot
+        with uproot.open(fileName) as f:
+            tree = f[opts["treeName"]]
+            return int(tree.num_entries), {s : str(t) for (s, t) in tree.typenames().items()}
+    elif dataType == "ASCII":
+        nLines, nCols = 0, 0
+        with open(fileName, "rb") as f:
+            for line in f:
+                if len(line.strip()) > 0:
+                    if nLines == 0:
+                        nCols = len(line.split())
+                    nLines += 1
+        return nLines // opts["nLinesEv"], {"ncols" : nCols}
+    elif dataType == "NPZ":
+        from .npz import _npzOpen
+        table = _npzOpen(fileName, opts["arrayName"])
+        nLines = table.shape[0] if table.ndim > 0 else 0
+        return nLines // opts["nLinesEv"], {"dtype" : str(table.dtype), "shape" : [int(n) for n in table.shape[1:]]}
+    elif dataType == "BINARY":
+        from .binary import _binaryNumRecords
+        dtype = np.dtype(opts["binaryDtype"])
+        return int(_binaryNumRecords(fileName, dtype, opts["headerSize"])), {"dtype" : str(dtype.descr)}
+    elif dataType == "PARQUET":
+        import pyarrow.parquet as pq
+        metadata = pq.ParquetFile(fileName).metadata
+        schema = metadata.schema
+        return int(metadata.num_rows), {schema.column(j).path : schema.column(j).physical_type for j in range(len(schema))}
+    else:
+        raise ValueError("unknown data type %s" % dataType)
+
+########################################################################################################################
+
+class cRunCatalog:
+    # persistent index of the files of a set of filesets (following the XXXXXX/YYYYYY naming), with the nr. of events
+    # of each file & the global offset of its first event -- built once (files scanned in parallel) and then only
+    # updated for the new & changed files, so that the event counts are known with no need to open all the files
+    def __init__(
+        self,
+        dataType,
+        nameFormat,
+        fileIndex,
+        catalogFormat = None,
+        treeName = "t",
+        arrayName = "",
+        nLinesEv = 1,
+        binaryDtype = None,
+        headerSize = 0,
+        nproc = None,
+        bVerbose = False,
+    ):
+
+        # attributes set via input:
+
+        self.dataType = dataType  # as in cAkDataset
+        self.nameFormat = nameFormat
+        self.fileIndex = fileIndex
+        # catalog file name format, XXXXXX being replaced with each fileset ID -- if None, catalogXXXXXX.json in the
+        # same directory as the input files, if empty the catalog is kept in memory only
+        self.catalogFormat = os.path.join(os.path.dirname(nameFormat), "catalogXXXXXX.json") if catalogFormat is None else catalogFormat
+        self.treeName = treeName
+        self.arrayName = arrayName
+        self.nLinesEv = int(nLinesEv)
+        self.binaryDtype = binaryDtype
+        self.headerSize = int(headerSize)
+        self.nproc = nproc  # nr. of parallel file scans (threads), if None as in concurrent.futures
+        self.bVerbose = bVerbose
+
+        # calculated attributes:
+
+        self.files = []  # catalog entries of all the files, in the loaders order (i.e. by fileset & file name)
+        self.offsets = np.zeros(1, dtype=np.int64)  # global index of the first event of each file, plus the total
+        self.nevs = 0
+        self.buildtime = 0
+
+    # options the counting depends on, as stored in the catalog files (binary record type as string), private
+    def __opts(self):
+        return {
+            "dataType" : self.dataType, "treeName" : self.treeName, "arrayName" : self.arrayName,
+            "nLinesEv" : self.nLinesEv, "headerSize" : self.headerSize,
+            "binaryDtype" : None if self.binaryDtype is None else str(np.dtype(self.binaryDtype).descr),
+        }
+
+    # load the catalog of a fileset, private
+    # --> return the dictionary { path : entry }, empty if not existing or built with different options
+    def __load(self, iIndex):
+        if len(self.catalogFormat) == 0:
+            return {}
+        name = self.catalogFormat.replace("XXXXXX", iIndex)
+        if not os.path.isfile(name):
+            return {}
+        try:
+            with open(name, "r") as f:
+                catalog = json.load(f)
+        except (OSError, ValueError):  # e.g. truncated file, the catalog is built again
+            return {}
+        if (catalog.get("version") != catalogVersion) or (catalog.get("options") != self.__opts()):
+            return {}
+        return {entry["path"] : entry for entry in catalog["files"]}
+
+    # write the catalog of a fileset, private
+    # note: written to a temporary file first, so that an interrupted writing never leaves a corrupted catalog
+    def __write(self, iIndex, lsEntries):
+        if len(self.catalogFormat) == 0:
+            return
+        name = self.catalogFormat.replace("XXXXXX", iIndex)
+        if len(os.path.dirname(name)) > 0:
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+        catalog = {"version" : catalogVersion, "fileIndex" : iIndex, "options" : self.__opts(), "files" : lsEntries}
+        with open(name + ".tmp", "w") as f:
+            json.dump(catalog, f)
+        os.replace(name + ".tmp", name)
+
+    # build the catalog, or update it: only the files not in the catalog files yet, or changed since (size or
+    # modification time), are scanned -- in parallel -- and the files which no longer exist are dropped
+    # bForce is a boolean: if True, all the files are scanned again
+    # --> return the instance
+    def build(self, bForce=False):
+        t0 = time.time()  # chronometer start
+        opts = dict(self.__opts(), binaryDtype=self.binaryDtype)  # the string form is for the catalog files only
+        dictMem = {entry["path"] : entry for entry in self.files}  # catalogs kept in memory only are updated as well
+        self.files = []
+        for iIndex in sorted(self.fileIndex):
+            if bForce:
+                dictOld = {}
+            elif len(self.catalogFormat) == 0:
+                dictOld = {s : dictMem[s] for s in dictMem if dictMem[s]["fileIndex"] == iIndex}
+            else:
+                dictOld = self.__load(iIndex)
+            names = sorted(glob.glob(self.nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "*")))
+            lsEntries, lsScan = [], []
+            for name in names:
+                stat = os.stat(name)
+                entry = {"path" : name, "fileIndex" : iIndex, "size" : stat.st_size, "mtime" : stat.st_mtime_ns}
+                if (name in dictOld) and (dictOld[name]["size"] == entry["size"]) and (dictOld[name]["mtime"] == entry["mtime"]):
+                    entry = dictOld[name]
+                else:
+                    lsScan.append(entry)
+                lsEntries.append(entry)
+
+            if len(lsScan) > 0:
+                with ThreadPoolExecutor(max_workers=self.nproc) as executor:
+                    lsOut = list(executor.map(lambda entry: _catalogScan(entry["path"], opts), lsScan))
+                for entry, (nevs, schema) in zip(lsScan, lsOut):
+                    entry.update({"nevs" : nevs, "schema" : schema})
+            if (len(lsScan) > 0) | (len(lsEntries) != len(dictOld)):
+                self.__write(iIndex, lsEntries)
+            if self.bVerbose:
+                print("%s: %d files, %d scanned" % (iIndex, len(lsEntries), len(lsScan)))
+            self.files += lsEntries
+
+        self.offsets = np.concatenate([[0], np.cumsum([entry["nevs"] for entry in self.files], dtype=np.int64)])
+        self.nevs = int(self.offsets[-1])
+        t1 = time.time()  # chronometer stop
+        self.buildtime = t1 - t0
+        return self
+
+    # find the file containing each of a set of global event indices (i.e. counted over all the files, in the
+    # loaders order, as the index variable of a dataset opened with no descaling)
+    # iEv is a single index or an array of indices
+    # --> return the position(s) of the file(s) in the files attribute & the index (indices) of the event(s) in the
+    # file(s) -- -1 for indices out of range
+    def locate(self, iEv):
+        iEvArr = np.asarray(iEv, dtype=np.int64)
+        iFile = np.searchsorted(self.offsets, iEvArr, side="right") - 1
+        bOut = (iEvArr < 0) | (iEvArr >= self.nevs)
+        iFile = np.where(bOut, -1, iFile)
+        iEvFile = np.where(bOut, -1, iEvArr - self.offsets[np.clip(iFile, 0, None)])
+        if np.ndim(iEv) == 0:
+            return int(iFile), int(iEvFile)
+        return iFile, iEvFile
+
+    # compute the events each file would contribute to a dataset opened with the given sampling & read budget, with
+    # no need to open any file (same selection as the loaders, see sampling.py)
+    # descFrac, nEvMax, descMode & descSeed are as in cAkDataset
+    # --> return the list of dictionaries with the file path, fileset ID, selection (slice or indices array, as in
+    # _sampleSel) & nr. of events selected, in the loaders order -- the files after the read budget being dropped
+    def sampling_plan(self, descFrac={}, nEvMax=10000000000, descMode="strided", descSeed=0):
+        lsPlan = []
+        nEvLeft = int(nEvMax)
+        for entry in self.files:
+            if nEvLeft <= 0:
+                break
+            frac = _descFracClip(descFrac[entry["fileIndex"]] if entry["fileIndex"] in descFrac else 1)
+            sel = _sampleBudget(_sampleSel(entry["nevs"], frac, descMode, descSeed, entry["path"]), nEvLeft)
+            nevs = len(range(entry["nevs"])[sel]) if isinstance(sel, slice) else len(sel)
+            lsPlan.append({"path" : entry["path"], "fileIndex" : entry["fileIndex"], "sel" : sel, "nevs" : nevs})
+            nEvLeft -= nevs
+        return lsPlan
+
+    # split the files into nParts groups of consecutive files with about the same total nr. of events each, e.g. to
+    # balance the work across processes
+    # --> return the list of nParts lists of catalog entries (some possibly empty, if there are fewer files)
+    def partition(self, nParts):
+        nParts = max(int(nParts), 1)
+        if len(self.files) == 0:
+            return [[] for i in range(nParts)]
+        # each file goes to the part containing its central event
+        centres = 0.5 * (self.offsets[:-1] + self.offsets[1:])
+        iPart = np.minimum((centres * nParts / max(self.nevs, 1)).astype(int), nParts - 1)
+        return [[entry for entry, i in zip(self.files, iPart) if i == iPartOut] for iPartOut in range(nParts)]
@@ -0,0 +1,200 @@
+import numpy as np
+import awkward as ak
+import pandas as pd
+import ast
+import operator
+
+from .fetch import cLruCache
+from .misc import akCategoryMask, _akIsCategorical
+from ..profiling.profile_report import _profTimer, _profCount
+
+########################################################################################################################
+
+# cut expressions: Python expressions (strings or ast trees) over the dataset variables, e.g.
+#   "(ch0_out_ph > 50) & (abs(ch0_out_peak_time - 120) < 20) & (iIndex == '000001')"
+# with the comparison, arithmetic, logical (&, |, ~, ^, and, or, not, also chained comparisons) operators, the
+# functions below, and == / != / in on categorical variables (e.g. fileIndexName) compared with labels
+# each boolean sub-expression is evaluated once and memoised (bit-packed) until the variables it depends on change
+
+cutFunctions = {s : getattr(np, s) for s in [
+    "abs", "sqrt", "exp", "log", "log10", "sin", "cos", "tan", "arctan", "arctan2", "hypot", "minimum", "maximum",
+    "isnan", "isfinite",
+]}
+
+_cutBinOps = {
+    ast.Add : operator.add, ast.Sub : operator.sub, ast.Mult : operator.mul, ast.Div : operator.truediv,
+    ast.Pow : operator.pow, ast.Mod : operator.mod, ast.FloorDiv : operator.floordiv,
+    ast.BitAnd : operator.and_, ast.BitOr : operator.or_, ast.BitXor : operator.xor,
+}
+
+_cutCmpOps = {
+    ast.Lt : operator.lt, ast.LtE : operator.le, ast.Gt : operator.gt, ast.GtE : operator.ge,
+    ast.Eq : operator.eq, ast.NotEq : operator.ne,
+}
+
+########################################################################################################################
+
+# parse a cut expression, private
+# --> return the ast expression node
+def _cutParse(expr):
+    if isinstance(expr, str):
+        expr = ast.parse(expr.strip(), mode="eval")
+    return expr.body if isinstance(expr, ast.Expression) else expr
+
+########################################################################################################################
+
+# names of the variables an expression depends on, private
+def _cutNames(node):
+    return sorted(set([n.id for n in ast.walk(node) if isinstance(n, ast.Name) and not (n.id in cutFunctions)]))
+
+########################################################################################################################
+
+# build the cut selecting the events with a variable in the open interval (vMin, vMax), private -- as an ast tree, i.e.
+# with any variable name (e.g. with dots) & value (e.g. infinite)
+# --> return the ast expression node
+def _cutWindow(name, vMin, vMax):
+    lsCmp = [
+        ast.Compare(left=ast.Name(id=name, ctx=ast.Load()), ops=[op], comparators=[ast.Constant(value=float(value))])
+        for op, value in [(ast.Gt(), vMin), (ast.Lt(), vMax)]
+    ]
+    return ast.BinOp(left=lsCmp[0], op=ast.BitAnd(), right=lsCmp[1])
+
+########################################################################################################################
+
+class cCutEngine:
+    # evaluation of cut expressions over the variables of a dataset (see above), with the boolean masks of all the
+    # sub-expressions memoised in a least-recently-used cache, bit-packed (1 bit per event, i.e. 8 times smaller than
+    # NumPy booleans) -- each mask being invalidated when the version of any variable it depends on changes (see
+    # cAkDataset.add_vars)
+    def __init__(
+        self,
+        dataset,
+        cacheSize = 64,
+    ):
+
+        # attributes set via input:
+
+        self.dataset = dataset
+        self.cache = cLruCache(cacheSize)  # { (expression, variable versions) : (packed mask, nr. of events) }
+
+    # cache key of a sub-expression, private
+    def __key(self, node):
+        versions = tuple([(s, self.dataset.field_versions.get(s, 0)) for s in _cutNames(node)])
+        return (ast.dump(node), versions, self.dataset.data_version, len(self.dataset.data))
+
+    # get a variable as a NumPy array, private
+    def __field(self, name):
+        if not (name in self.dataset.data.fields):
+            raise NameError("variable %s not in the dataset" % name)
+        values = self.dataset.data[name]
+        return values if _akIsCategorical(values) else ak.to_numpy(values)
+
+    # evaluate a node, memoising the boolean (i.e. mask) results, private
+    # --> return the NumPy array (or the scalar, for constants)
+    def __eval(self, node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            return self.__field(node.id)
+        if isinstance(node, (ast.Tuple, ast.List)):
+            return [self.__eval(n) for n in node.elts]
+
+        key = self.__key(node)
+        if key in self.cache.items:
+            packed, nEv = self.cache.get(key, None)
+            return np.unpackbits(packed, count=nEv).astype(bool)
+        out = self.__compute(node)
+        if isinstance(out, np.ndarray) and (out.dtype == bool) and (out.ndim == 1):
+            self.cache.get(key, lambda: (np.packbits(out), len(out)))
+        return out
+
+    # compute a (non-leaf) node, private
+    def __compute(self, node):
+        if isinstance(node, ast.BoolOp):  # and, or
+            lsOut = [np.asarray(self.__eval(n), dtype=bool) for n in node.values]
+            out = lsOut[0]
+            for o in lsOut[1:]:
+                out = (out & o) if isinstance(node.op, ast.And) else (out | o)
+            return out
+        elif isinstance(node, ast.UnaryOp):
+            value = self.__eval(node.operand)
+            if isinstance(node.op, (ast.Not, ast.Invert)):
+                return ~np.asarray(value, dtype=bool) if isinstance(node.op, ast.Not) else ~value
+            return -value if isinstance(node.op, ast.USub) else value
+        elif isinstance(node, ast.BinOp) and (type(node.op) in _cutBinOps):
+            return _cutBinOps[type(node.op)](self.__eval(node.left), self.__eval(node.right))
+        elif isinstance(node, ast.Compare):  # chained comparisons are split into pairs, each memoised
+            out = None
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                pair = ast.Compare(left=left, ops=[op], comparators=[right])
+                mask = self.__eval(pair) if len(node.ops) > 1 else self.__compare(left, op, right)
+                out = mask if out is None else (out & mask)
+                left = right
+            return out
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and (node.func.id in cutFunctions):
+            return cutFunctions[node.func.id](*[self.__eval(n) for n in node.args])
+        raise ValueError("unsupported cut expression: %s" % ast.unparse(node))
+
+    # compute a single comparison, private -- categorical variables being compared with labels via their codes
+    def __compare(self, left, op, right):
+        valueLeft, valueRight = self.__eval(left), self.__eval(right)
+        if _akIsCategorical(valueRight):
+            valueLeft, valueRight = valueRight, valueLeft
+        if _akIsCategorical(valueLeft):
+            labels = valueRight if isinstance(valueRight, list) else [valueRight]
+            if isinstance(op, (ast.Eq, ast.In)):
+                return akCategoryMask(valueLeft, labels)
+            elif isinstance(op, (ast.NotEq, ast.NotIn)):
+                return ~akCategoryMask(valueLeft, labels)
+            raise ValueError("unsupported comparison on categorical variable: %s" % ast.unparse(left))
+        if isinstance(op, (ast.In, ast.NotIn)):
+            out = np.isin(valueLeft, valueRight)
+            return out if isinstance(op, ast.In) else ~out
+        return np.asarray(_cutCmpOps[type(op)](valueLeft, valueRight))
+
+    # evaluate a cut expression (string or ast tree)
+    # --> return the NumPy boolean mask, one entry per event
+    def mask(self, expr):
+        node = _cutParse(expr)
+        if len(getattr(self.dataset, "derived_vars", {})) > 0:  # derived variables computed first, if outdated
+            self.dataset.compute_vars([s for s in _cutNames(node) if s in self.dataset.derived_vars])
+        with _profTimer(self.dataset.profile, "cuts"):
+            hits0 = self.cache.hits
+            out = self.__eval(node)
+            _profCount(self.dataset.profile, "cut_cache_hits", self.cache.hits - hits0)
+        if np.ndim(out) == 0:  # e.g. constant expressions
+            return np.full(len(self.dataset.data), bool(out))
+        return np.asarray(out, dtype=bool)
+
+    # compute the cut-flow table of a sequence of cuts, i.e. the events passing each cut and all the previous ones, in
+    # a single pass over the cuts (each mask being evaluated once, or taken from the cache)
+    # cuts is the list of cut expressions, or the dictionary { cut name : cut expression }, in order
+    # --> return the pandas DataFrame with, for each cut (rows), the nr. of events passing it and all the previous
+    # ones (nevs), the nr. of events passing it alone (nevs_single), the efficiency with respect to the previous cut
+    # (eff_step) & to all the events (eff_cumulative) -- the first row being all the events
+    def cutflow(self, cuts):
+        if not isinstance(cuts, dict):
+            cuts = {(c if isinstance(c, str) else ast.unparse(_cutParse(c))) : c for c in cuts}
+        nEv = len(self.dataset.data)
+        mask = np.ones(nEv, dtype=bool)
+        lsRows = [{"cut" : "all", "nevs" : nEv, "nevs_single" : nEv, "eff_step" : 1.0, "eff_cumulative" : 1.0}]
+        for name in cuts:
+            maskCut = self.mask(cuts[name])
+            nPrev = lsRows[-1]["nevs"]
+            mask &= maskCut
+            n = int(np.count_nonzero(mask))
+            lsRows.append({
+                "cut" : name, "nevs" : n, "nevs_single" : int(np.count_nonzero(maskCut)),
+                "eff_step" : n / nPrev if nPrev > 0 else 0.0, "eff_cumulative" : n / nEv if nEv > 0 else 0.0,
+            })
+        return pd.DataFrame(lsRows)
+
+    # --> return the memory taken by the cached masks, in bytes
+    @property
+    def nbytes(self):
+        return sum([self.cache.items[key][0].nbytes for key in self.cache.items])
+
+    # drop all the cached masks
+    def clear(self):
+        self.cache.clear()
@@ -1,9 +1,24 @@
 import awkward as ak
 import numpy as np
+import glob
+import os
+import time
+import ast
 from copy import deepcopy
 
-from .root import rootToAkMulti
-from .ascii import asciiToAkMulti
+from .root import rootToAkMulti, _rootToAkFrom, _rootNumEntries, akToRootMulti
+from .ascii import asciiToAkMulti, _asciiToAkFrom
+from .npz import npzToAkMulti, _npzToAkFile
+from .binary import binaryToAkMulti, _binaryToAkFrom, _binaryNumRecords
+from .parquet import parquetToAkMulti, _parquetToAkFile, akToParquetMulti, _cutsCheck
+from .catalog import cRunCatalog
+from .fetch import cLruCache, _fetchChunk
+from .pipeline import prefetchIter
+from .shared import akToShared, sharedToAk, sharedRelease, _sharedViews
+from .cuts import cCutEngine
+from .sampling import _sampleSelChunk, _sampleStop
+from .misc import akTransform, akConcatenate, akToCategorical, _akCategoricalFill, _akWithField, _akWithFields
+from ..profiling.profile_report import cProfileReport, _profTimer, _profCount
 
 ########################################################################################################################
 
@@ -25,6 +40,15 @@ class cAkDataset:
         mirrorMap = {},
         bVerbose = False,
         bProgress = False,
+        profile = None,
+        npzMap = [],
+        arrayName = "",
+        descMode = "strided",
+        descSeed = 0,
+        binaryDtype = None,
+        headerSize = 0,
+        cuts = [],
+        cacheSize = 16,
     ):
         
         # attributes set via input:
@@ -38,14 +62,23 @@ class cAkDataset:
         self.treeMap = treeMap
         self.treeMap = treeMap
         self.asciiMap = asciiMap
+        self.npzMap = npzMap
+        self.arrayName = arrayName
+        self.binaryDtype = binaryDtype
+        self.headerSize = int(headerSize)
+        self.cuts = cuts
+        self.cacheSize = int(cacheSize)  # nr. of chunks kept in memory by fetch()
         self.chunksize = int(chunksize)
         self.nLinesEv = nLinesEv
         self.fileIndexName = fileIndexName
         self.descFrac = descFrac
+        self.descMode = descMode
+        self.descSeed = descSeed
         self.nEvMax = int(nEvMax)
         self.bVerbose = bVerbose
         self.mirrorMap = mirrorMap
         self.bProgress = bProgress
+        self.profile = cProfileReport("dataset") if profile is None else profile  # timing & counters of all the steps
 
         # calculated attributes:
 
@@ -56,6 +89,19 @@ class cAkDataset:
         self.nevs = 0
         self.shape = [self.nevs, self.nvars]
         
+        self.watch_callbacks = []
+        self.__watch_state = {}  # { filename : nr. of bytes (ASCII, BINARY) or entries (ROOT) already read }
+        self.__watch_nevs = 0  # nr. of events read so far, including the ones not appended to data
+        
+        self.__fetch_state = None  # catalog, event selection & caches for fetch(), set up at the first call
+        self.iterate_stats = {}  # statistics of the last iterate() pipeline
+        self.__shared = None  # shared memory descriptor, segment & data versions, if data is in shared memory (see to_shared)
+        
+        self.data_version = 0  # increased whenever the events in data change (open, update)
+        self.field_versions = {}  # { variable : nr. of times it has been set by add_vars }
+        self.__cut_engine = None  # cut expression engine (see mask), set up at the first call
+        self.derived_vars = {}  # registry of the derived variables, { variable : definition, see define_var }
+        
     # compute nr. of events and variables, private
     def __compute_size(self):
         self.nvars = len(self.data.fields)
@@ -65,38 +111,536 @@ class cAkDataset:
     # open data --> return the instance
     def open(self):
         
+        self.release_shared(False)  # the events are read again, the shared ones are dropped
+        names_before = self.__files_names()  # files existing before the reading starts
+        
         if self.dataType == "ROOT":
             self.data, self.loadtime = rootToAkMulti(
                 self.nameFormat, self.fileIndex, self.treeName, self.varlist, self.treeMap,
                 self.chunksize, self.fileIndexName, self.descFrac, self.nEvMax, self.mirrorMap,
-                self.bVerbose, self.bProgress
+                self.bVerbose, self.bProgress, self.profile, self.descMode, self.descSeed
             )
         elif self.dataType == "ASCII":
             self.data, self.loadtime = asciiToAkMulti(
                 self.nameFormat, self.fileIndex, self.asciiMap,
                 self.nLinesEv, self.fileIndexName, self.descFrac, self.nEvMax, self.mirrorMap,
-                self.bVerbose, self.bProgress
+                self.bVerbose, self.bProgress, self.profile, self.descMode, self.descSeed
+            )
+        elif self.dataType == "NPZ":
+            self.data, self.loadtime = npzToAkMulti(
+                self.nameFormat, self.fileIndex, self.npzMap, self.arrayName,
+                self.nLinesEv, self.fileIndexName, self.descFrac, self.nEvMax, self.mirrorMap,
+                self.bVerbose, self.bProgress, self.profile, self.descMode, self.descSeed
+            )
+        elif self.dataType == "BINARY":
+            self.data, self.loadtime = binaryToAkMulti(
+                self.nameFormat, self.fileIndex, self.binaryDtype, self.headerSize,
+                self.fileIndexName, self.descFrac, self.nEvMax, self.mirrorMap,
+                self.bVerbose, self.bProgress, self.profile, self.descMode, self.descSeed
+            )
+        elif self.dataType == "PARQUET":
+            self.data, self.loadtime = parquetToAkMulti(
+                self.nameFormat, self.fileIndex, self.varlist, self.cuts,
+                self.fileIndexName, self.descFrac, self.nEvMax, self.mirrorMap,
+                self.bVerbose, self.bProgress, self.profile, self.descMode, self.descSeed
             )
                 
+        self.data_version += 1
         self.__compute_size()
         self.add_vars({"index" : ak.Array(range(self.nevs))})
         self.__compute_size()
+        
+        # all the files existing before open() are considered as fully read by the watcher, whereas those created while
+        # open() was running are left to update() -- as they might have been missed by the reading
+        # note: events appended to the existing files while open() is running might be skipped by update()
+        self.__watch_state = {name : pos for (name, pos) in self.__files_state().items() if name in names_before}
+        self.__watch_nevs = self.nevs
+                
+        return self
+    
+    # list all the input files and their current size, in bytes (ASCII, BINARY) or entries (ROOT), private
+    # note: for binary files, only the complete records are counted
+    # --> return a dictionary { filename : (fileset ID, size) }
+    def __files_state(self):
+        state = {}
+        for iIndex in sorted(self.fileIndex):
+            for name in self.__files_names(iIndex):
+                if self.dataType == "ROOT":
+                    try:
+                        state[name] = _rootNumEntries(name, self.treeName)
+                    except Exception:  # e.g. file still being created
+                        continue
+                elif self.dataType == "BINARY":
+                    nEv = _binaryNumRecords(name, self.binaryDtype, self.headerSize)
+                    state[name] = self.headerSize + nEv * np.dtype(self.binaryDtype).itemsize
+                else:
+                    state[name] = os.stat(name).st_size
+        return state
+    
+    # list all the input files, of a single fileset if iIndex is not None, private
+    def __files_names(self, iIndex=None):
+        return [
+            name for i in (sorted(self.fileIndex) if iIndex is None else [iIndex])
+            for name in sorted(glob.glob(self.nameFormat.replace("XXXXXX", i).replace("YYYYYY", "*")))
+        ]
+    
+    # add a function to be called on the new events found by update()
+    # func must take a single argument, i.e. the dataset with the new events, and can e.g. run collection
+    # calculations (adding their output variables to it) or fill histograms -- callbacks are run in order
+    def add_watch_callback(self, func):
+        self.watch_callbacks.append(func)
+    
+    # run the calculations of a collection on the new events found by update(), i.e. register a watch callback calling
+    # collection.update_output -- the collection output variables are added to the new events, hence appended to data
+    # together with them (the collection calculations should have been run on data already, so that the records match)
+    # dict_attrs = { collection attribute : value, or function of the new-events dataset } with the event-by-event
+    # inputs of the collection to be replaced for the new events, e.g. x0 & y0 for the tracks collection
+    def add_watch_collection(self, collection, dict_attrs={}):
+        self.add_watch_callback(lambda dataset_new: collection.update_output(dataset_new, dict_attrs))
+    
+    # look for events added to the input files since the last update (or open), either in new files or appended to
+    # existing ones, read them (and only them), run the watch callbacks on them and append them to data
+    # bAppend is a boolean: if False, the new events are not appended to data (memory and latency stay constant)
+    # note: descFrac and nEvMax are ignored here
+    # --> return a copy of the instance containing the new events only
+    def update(self, bAppend=True):
+        dataset_new = self.__copy_with(ak.Array([]))
+        dataset_new.watch_callbacks = []
+        
+        for iIndex in sorted(self.fileIndex):
+            names = sorted(glob.glob(self.nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "*")))
+            for name in names:
+                pos_start = self.__watch_state.get(name, 0)
+                try:
+                    if self.dataType == "ROOT":
+                        with _profTimer(self.profile, "read"):
+                            df_temp, pos_stop = _rootToAkFrom(name, self.treeName, self.varlist, pos_start)
+                    elif self.dataType == "ASCII":
+                        if os.stat(name).st_size <= pos_start:
+                            continue
+                        with _profTimer(self.profile, "parse"):
+                            df_temp, pos_stop = _asciiToAkFrom(name, self.asciiMap, self.nLinesEv, pos_start)
+                        _profCount(self.profile, "bytes_read", pos_stop - pos_start)
+                    elif self.dataType == "NPZ":
+                        if name in self.__watch_state:  # NumPy files are written at once, only new files are read
+                            continue
+                        df_temp = _npzToAkFile(name, self.npzMap, self.arrayName, self.nLinesEv, 1, self.profile)
+                        pos_stop = os.stat(name).st_size
+                        _profCount(self.profile, "bytes_read", pos_stop)
+                    elif self.dataType == "PARQUET":
+                        if name in self.__watch_state:  # Parquet files are written at once, only new files are read
+                            continue
+                        _cutsCheck(self.cuts)
+                        df_temp = _parquetToAkFile(name, self.varlist, self.cuts, 1, self.profile)
+                        pos_stop = os.stat(name).st_size
+                        _profCount(self.profile, "bytes_read", pos_stop)
+                    elif self.dataType == "BINARY":
+                        with _profTimer(self.profile, "read"):
+                            df_temp, pos_stop = _binaryToAkFrom(name, self.binaryDtype, self.headerSize, pos_start)
+                        _profCount(self.profile, "bytes_read", pos_stop - max(pos_start, self.headerSize))
+                except Exception as e:  # e.g. file still being created, it will be retried at the next update
+                    if self.bVerbose:
+                        print("cannot read %s (%s), skipping it for now" % (name, e))
+                    continue
+                self.__watch_state[name] = pos_stop
+                if len(df_temp) == 0:
+                    continue
+                _profCount(self.profile, "events_read", len(df_temp))
+                if self.bVerbose:
+                    print("%s: %d new events" % (name, len(df_temp)))
+                    
+                # same data conditioning as in the input functions
+                with _profTimer(self.profile, "reshape"):
+                    df_temp = akTransform(
+                        df_temp, self.treeMap if self.dataType == "ROOT" else {},
+                        (self.dataType == "ROOT") & (len(self.treeMap) > 0),
+                        self.mirrorMap[iIndex] if iIndex in self.mirrorMap else (),
+                    )
+                if len(self.fileIndexName) > 0:  # categorical, as in the input functions
+                    df_temp = _akWithField(df_temp, self.fileIndexName, _akCategoricalFill(len(df_temp), iIndex))
+                dataset_new.data = akConcatenate((dataset_new.data, df_temp))
+        
+        dataset_new.__compute_size()
+        if dataset_new.nevs > 0:
+            dataset_new.add_vars({"index" : ak.Array(range(self.__watch_nevs, self.__watch_nevs + dataset_new.nevs))})
+            self.__watch_nevs += dataset_new.nevs
+            
+            for func in self.watch_callbacks:
+                func(dataset_new)
+            if bAppend:
+                # derived variables already in data are computed on the new events too, so that the records match --
+                # those up to date stay so after the concatenation
+                ls_derived = [s for s in self.derived_vars if s in self.data.fields]
+                ls_derived_ok = [s for s in ls_derived if self.derived_vars[s]["key"] == self.__derived_key(s)]
+                dataset_new.compute_vars(ls_derived)
+                self.release_shared()  # data changes, other processes keep the shared events
+                with _profTimer(self.profile, "concat"):
+                    self.data = dataset_new.data if self.nevs==0 else akConcatenate((self.data, dataset_new.data))
+                self.data_version += 1
+                for s in ls_derived_ok:
+                    self.derived_vars[s]["key"] = self.__derived_key(s)
+                self.__compute_size()
                 
+        return dataset_new
+    
+    # keep looking for new events, calling update() periodically
+    # period is the time between successive updates, in seconds
+    # nUpdatesMax (tMax) is the maximum nr. of updates (time, in seconds) after which to stop, None for no limit
+    # bAppend is as in update()
+    # note: the loop can also be stopped with a keyboard interrupt
+    # --> return the instance
+    def watch(self, period=1, nUpdatesMax=None, tMax=None, bAppend=True):
+        t0 = time.time()
+        nUpdates = 0
+        try:
+            while True:
+                dataset_new = self.update(bAppend)
+                nUpdates += 1
+                if self.bVerbose:
+                    print("update #%d: %d new events, %d events so far" % (nUpdates, dataset_new.nevs, self.__watch_nevs))
+                if (not (nUpdatesMax is None)) and (nUpdates >= nUpdatesMax):
+                    break
+                if (not (tMax is None)) and (time.time() - t0 + period > tMax):
+                    break
+                time.sleep(period)
+        except KeyboardInterrupt:
+            if self.bVerbose:
+                print("watching interrupted")
         return self
     
-    # add new variable(s)
+    # add new variable(s), all at once (i.e. with a single rebuild of the event records)
     # dict_vars = { variable name (string) : actual variable (array) }
     def add_vars(self, dict_vars):
         
+        self.release_shared()  # data changes, other processes keep the shared variables
+        self.data = _akWithFields(self.data, dict_vars)
         for varname in dict_vars:
-            self.data[varname] = dict_vars[varname]
+            self.field_versions[varname] = self.field_versions.get(varname, 0) + 1  # cached masks on it are outdated
             
         self.__compute_size()
         
+    # register a derived variable, i.e. computed from other variables as func(*[data[s] for s in inputs], **params)
+    # -- it is computed only when first accessed (see compute_vars & the [] operator) and then recomputed only if any of
+    # its inputs (derived variables included) or parameters change, or the events change (open, update)
+    # name is the variable name, func the function returning the array with the variable, one entry per event
+    # inputs is the list of the input variables, params the dictionary of the function keyword parameters
+    def define_var(self, name, func, inputs=[], params={}):
+        self.derived_vars[name] = {
+            "func" : func, "inputs" : list(inputs), "params" : dict(params),
+            "params_version" : 0, "key" : None,  # key of the inputs & parameters of the last computation
+        }
+        
+    # change (some of) the parameters of a derived variable, which is recomputed at its next access only if they
+    # actually differ from the current ones
+    # name is the variable name, params the keyword parameters to change
+    def set_var_params(self, name, **params):
+        definition = self.derived_vars[name]
+        params_new = dict(definition["params"], **params)
+        try:
+            bSame = bool(params_new == definition["params"])
+        except (ValueError, TypeError):  # e.g. array parameters, always considered as changed
+            bSame = False
+        if not bSame:
+            definition["params"] = params_new
+            definition["params_version"] += 1
+        
+    # current key of the inputs & parameters of a derived variable, private
+    def __derived_key(self, name):
+        definition = self.derived_vars[name]
+        return (
+            self.data_version, definition["params_version"],
+            tuple([(s, self.field_versions.get(s, 0)) for s in definition["inputs"]]),
+        )
+    
+    # derived variables to be computed to get the requested ones, in dependency order, private
+    def __derived_order(self, names):
+        ls_order = []
+        def visit(name, ls_path):
+            if name in ls_path:
+                raise ValueError("circular dependency among derived variables: %s" % " -> ".join(ls_path + [name]))
+            if (name in ls_order) or not (name in self.derived_vars):
+                return
+            for s in self.derived_vars[name]["inputs"]:
+                visit(s, ls_path + [name])
+            ls_order.append(name)
+        for name in names:
+            visit(name, [])
+        return ls_order
+        
+    # compute the derived variables that are missing or outdated, all added to data at once
+    # names is the list of the requested variables (their derived inputs are computed as well), all if None
+    # --> return the list of the variables computed
+    def compute_vars(self, names=None):
+        ls_order = self.__derived_order(list(self.derived_vars) if names is None else names)
+        dict_vars = {}
+        for name in ls_order:
+            definition = self.derived_vars[name]
+            b_stale = (not (name in self.data.fields)) or (definition["key"] != self.__derived_key(name)) or\
+                any([s in dict_vars for s in definition["inputs"]])
+            if b_stale:
+                with _profTimer(self.profile, "compute"):
+                    dict_vars[name] = definition["func"](
+                        *[dict_vars[s] if s in dict_vars else self.data[s] for s in definition["inputs"]],
+                        **definition["params"]
+                    )
+        if len(dict_vars) > 0:
+            self.add_vars(dict_vars)
+            for name in dict_vars:
+                self.derived_vars[name]["key"] = self.__derived_key(name)
+        return list(dict_vars)
+        
+    # get a variable, computing it first if it is a derived one which is missing or outdated (see define_var)
+    # --> return the variable array
+    def __getitem__(self, name):
+        if name in self.derived_vars:
+            self.compute_vars([name])
+        return self.data[name]
+        
+    # save the dataset (variables added by the collections included) to a set of Parquet files, to be opened again with
+    # dataType = "PARQUET" -- nameFormat follows the XXXXXX/YYYYYY naming, with the events split into the filesets
+    # according to fileIndexName (see akToParquetMulti)
+    # chunksize is the nr. of events per row group, i.e. per reading chunk (as in akToParquet)
+    # nEvPerFile is the maximum nr. of events per file, if None a single file per fileset
+    # varlist is the list of variables to be saved, all of them if empty
+    # --> return the list of the files written
+    def save(self, nameFormat, chunksize=100000, nEvPerFile=None, varlist=[]):
+        self.compute_vars()
+        with _profTimer(self.profile, "write"):
+            lsNames = akToParquetMulti(
+                self.data, nameFormat, self.fileIndex, self.fileIndexName,
+                chunksize, nEvPerFile, varlist,
+            )
+        _profCount(self.profile, "bytes_written", sum([os.stat(name).st_size for name in lsNames]))
+        return lsNames
+        
+    # write the dataset (variables added by the collections included) to the tree of a set of ROOT files, chunk by
+    # chunk -- nameFormat follows the XXXXXX/YYYYYY naming, with the events split into the filesets according to
+    # fileIndexName (see akToRootMulti)
+    # treeName is the output tree name, if None the dataset treeName
+    # chunksize, nEvPerFile, varlist, compression & compressionLevel are as in akToRootMulti
+    # --> return the list of the files written
+    def to_root(self, nameFormat, treeName=None, chunksize=100000, nEvPerFile=None, varlist=[], compression="ZLIB", compressionLevel=1):
+        self.compute_vars()
+        return akToRootMulti(
+            self.data, nameFormat, self.fileIndex, self.treeName if treeName is None else treeName, self.fileIndexName,
+            chunksize, nEvPerFile, varlist, compression, compressionLevel,
+            self.bVerbose, self.profile,
+        )
+        
+    # evaluate a cut expression on the dataset, e.g. "(ch0_out_ph > 50) & (ch0_out_peak_time < 200)" (see cuts.py),
+    # with the masks of all its sub-expressions cached (bit-packed) & reused by the following calls, until the
+    # variables they depend on are changed by add_vars or the events by open/update
+    # condition is the cut expression (string or ast tree) -- an array of booleans is returned as it is
+    # --> return the NumPy array of booleans, one per event
+    def mask(self, condition):
+        if not (isinstance(condition, str) or isinstance(condition, ast.AST)):
+            return condition
+        if self.__cut_engine is None:
+            self.__cut_engine = cCutEngine(self)
+        return self.__cut_engine.mask(condition)
+    
+    # compute the cut-flow table of a sequence of cut expressions, in a single pass (see cCutEngine.cutflow)
+    # cuts is the list of cut expressions, or the dictionary { cut name : cut expression }, in order
+    # --> return the pandas DataFrame with the nr. of events & the efficiencies after each cut
+    def cutflow(self, cuts):
+        if self.__cut_engine is None:
+            self.__cut_engine = cCutEngine(self)
+        return self.__cut_engine.cutflow(cuts)
+        
     # cut dataset --> return a copy of the instance with the cut applied
-    # condition is the array of booleans
+    # condition is the array of booleans, or the cut expression (see mask)
     def cut_copy(self, condition):
+        condition = self.mask(condition)
+        dataset_new = self.__copy_with(self.data if np.isscalar(condition) else self.data[condition])
+        dataset_new.__compute_size()
+        return dataset_new
+    
+    # copy of the instance with different data, private
+    # neither the data nor the fetch() state nor the cached cut masks are copied, the profile is shared
+    def __copy_with(self, data):
+        data_old, fetch_state_old, shared_old, cut_engine_old = self.data, self.__fetch_state, self.__shared, self.__cut_engine
+        self.data, self.__fetch_state, self.__shared, self.__cut_engine = ak.Array([]), None, None, None
         dataset_new = deepcopy(self)
-        dataset_new.data = self.data if np.isscalar(condition) else self.data[condition]
+        self.data, self.__fetch_state, self.__shared, self.__cut_engine = data_old, fetch_state_old, shared_old, cut_engine_old
+        dataset_new.profile = self.profile  # shared, not copied
+        dataset_new.data = data
+        return dataset_new
+    
+    # move the data into a shared memory segment, so that other processes can access it with no copy nor
+    # serialisation: data is replaced with views of the segment, and a lightweight descriptor is returned, to be sent
+    # to the other processes & turned back into a dataset there with cAkDataset.from_shared (see also sharedMap)
+    # note: the segment is destroyed with release_shared(), or at exit at the latest -- also when data changes (open,
+    # update, add_vars), the next call sharing data again
+    # --> return the descriptor, a picklable dictionary (see shared.py), with a copy of the instance with no data
+    def to_shared(self):
+        if (not (self.__shared is None)) and (self.__shared[2:] != (self.data_version, self.field_versions)):
+            self.release_shared()  # outdated descriptor
+        if self.__shared is None:
+            self.compute_vars()  # derived variables are shared as computed
+            descriptor, shm = akToShared(self.data)
+            dataset_new = self.__copy_with(ak.Array([]))
+            dataset_new.profile = cProfileReport("dataset")  # hooks, callbacks & derived variables might not be picklable
+            dataset_new.watch_callbacks = []
+            dataset_new.derived_vars = {}
+            descriptor["dataset"] = dataset_new
+            self.data = _sharedViews(descriptor, shm)
+            self.__shared = (descriptor, shm, self.data_version, dict(self.field_versions))
+        return self.__shared[0]
+    
+    # rebuild a dataset from its shared memory descriptor (from to_shared), in another process, as views of the
+    # segment -- the segment stays attached to until sharedRelease(descriptor) is called in the process
+    # --> return the new instance
+    @staticmethod
+    def from_shared(descriptor):
+        dataset_new = deepcopy(descriptor["dataset"])
+        dataset_new.data = sharedToAk(descriptor)
         dataset_new.__compute_size()
         return dataset_new
+    
+    # destroy the shared memory segment created by to_shared(), after all the other processes are done with it
+    # bCopy is a boolean: if True data is copied back to private memory first, otherwise it is emptied
+    def release_shared(self, bCopy=True):
+        if self.__shared is None:
+            return
+        self.data = ak.copy(self.data) if bCopy else ak.Array([])
+        if not bCopy:
+            self.data_version += 1
+        sharedRelease(*self.__shared[:2], bUnlink=True)
+        self.__shared = None
+        self.__compute_size()
+    
+    # set up (or refresh, e.g. after new events have been written) the event fetching: the catalog of the input files
+    # (kept in memory) & the events selected in each file, as in open(), private
+    def __fetch_setup(self):
+        if self.__fetch_state is None:
+            self.__fetch_state = {
+                "catalog" : cRunCatalog(
+                    self.dataType, self.nameFormat, self.fileIndex, "", self.treeName, self.arrayName, self.nLinesEv,
+                    self.binaryDtype, self.headerSize,
+                ),
+                "chunks" : cLruCache(self.cacheSize),  # decoded chunks
+                "files" : cLruCache(self.cacheSize),  # file-level objects, e.g. text file event offsets
+            }
+        with _profTimer(self.profile, "glob"):
+            self.__fetch_state["catalog"].build()
+        plan = self.__fetch_state["catalog"].sampling_plan(self.descFrac, self.nEvMax, self.descMode, self.descSeed)
+        self.__fetch_state["plan"] = plan
+        self.__fetch_state["offsets"] = np.concatenate([[0], np.cumsum([p["nevs"] for p in plan], dtype=np.int64)])
+    
+    # reading options of the input files, for _fetchChunk, private
+    def __read_opts(self):
+        return {
+            "dataType" : self.dataType, "treeName" : self.treeName, "varlist" : self.varlist, "asciiMap" : self.asciiMap,
+            "npzMap" : self.npzMap, "arrayName" : self.arrayName, "nLinesEv" : self.nLinesEv,
+            "binaryDtype" : self.binaryDtype, "headerSize" : self.headerSize,
+        }
+    
+    # same data conditioning as in the input functions, for the events read by fetch() & iterate(), private
+    # iIndex is the fileset ID of the events, index the array of their index values
+    # --> return the conditioned Awkward Array
+    def __condition(self, df_temp, iIndex, index):
+        df_temp = akTransform(
+            df_temp, self.treeMap if self.dataType == "ROOT" else {},
+            (self.dataType == "ROOT") & (len(self.treeMap) > 0),
+            self.mirrorMap[iIndex] if iIndex in self.mirrorMap else (),
+        )
+        if len(self.fileIndexName) > 0:  # categorical, as in the input functions
+            if self.fileIndexName in df_temp.fields:
+                df_temp = _akWithField(df_temp, self.fileIndexName, akToCategorical(df_temp[self.fileIndexName]))
+            else:
+                df_temp = _akWithField(df_temp, self.fileIndexName, _akCategoricalFill(len(df_temp), iIndex))
+        return _akWithField(df_temp, "index", ak.Array(index))
+    
+    # read single events (or a few of them) directly from the input files, e.g. for event displays, with no need to
+    # open() the whole dataset -- only the chunks (chunksize events each) containing the requested events are read and
+    # decoded, and the last cacheSize chunks are kept in memory, so that nearby events are then fetched with no reading
+    # index is the value (or array of values) of the index variable of the requested events, as in open()
+    # note: the same data conditioning as in open() is applied, but the variables added afterwards (e.g. by the
+    # collections) are missing -- events appended by update() are indexed as if open() was called again
+    # --> return a copy of the instance containing the requested events only (in the requested order)
+    def fetch(self, index):
+        if (self.dataType == "PARQUET") & (len(self.cuts) > 0):
+            raise ValueError("events cannot be fetched by index with cuts")
+        indices = np.atleast_1d(np.asarray(index, dtype=np.int64))
+        if (self.__fetch_state is None) or np.any(indices >= self.__fetch_state["offsets"][-1]):
+            self.__fetch_setup()
+        offsets = self.__fetch_state["offsets"]
+        if np.any((indices < 0) | (indices >= offsets[-1])):
+            raise IndexError("event index out of range, %d events available" % offsets[-1])
+        opts = self.__read_opts()
+        
+        iPlan = np.searchsorted(offsets, indices, side="right") - 1
+        lsPos, lsParts = [], []
+        for i in np.unique(iPlan):
+            plan = self.__fetch_state["plan"][i]
+            nEvFile = self.__fetch_state["catalog"].files[i]["nevs"]
+            bFile = iPlan == i
+            k = indices[bFile] - offsets[i]  # position among the events selected in the file
+            sel = plan["sel"]
+            entries = (sel.start + k * (1 if sel.step is None else sel.step)) if isinstance(sel, slice) else sel[k]
+            chunks = entries // self.chunksize
+            for iChunk in np.unique(chunks):
+                iStart, iStop = iChunk * self.chunksize, min((iChunk + 1) * self.chunksize, nEvFile)
+                with _profTimer(self.profile, "read"):
+                    chunk = self.__fetch_state["chunks"].get(
+                        (plan["path"], iStart),
+                        lambda: _fetchChunk(plan["path"], iStart, iStop, opts, self.__fetch_state["files"]),
+                    )
+                bChunk = chunks == iChunk
+                with _profTimer(self.profile, "reshape"):
+                    df_temp = self.__condition(chunk[entries[bChunk] - iStart], plan["fileIndex"], indices[bFile][bChunk])
+                lsPos.append(np.flatnonzero(bFile)[bChunk])
+                lsParts.append(df_temp)
+        
+        data = akConcatenate(lsParts)
+        data = data[np.argsort(np.concatenate(lsPos), kind="stable")]  # in the requested order
+        dataset_new = self.__copy_with(data)
+        dataset_new.__compute_size()
+        return dataset_new
+    
+    # read the dataset chunk by chunk, the events selected in each chunk of chunksize events of each file (i.e. as in
+    # open(), with the same descaling, read budget & data conditioning), to be iterated over, private
+    # profile is the cProfileReport in which to record the reading ("read") & conditioning ("reshape") times
+    # --> yield the Awkward Arrays
+    def __iter_chunks(self, chunksize, profile):
+        opts = self.__read_opts()
+        cache_files = cLruCache(1)  # file-level objects of the current file only
+        offsets = self.__fetch_state["offsets"]
+        for i, plan in enumerate(self.__fetch_state["plan"]):
+            nEvFile = self.__fetch_state["catalog"].files[i]["nevs"]
+            if plan["nevs"] == 0:
+                continue
+            for iStart in range(0, _sampleStop(plan["sel"], nEvFile), chunksize):
+                iStop = min(iStart + chunksize, nEvFile)
+                selChunk = _sampleSelChunk(plan["sel"], iStart, iStop)
+                rows = np.arange(iStop - iStart)[selChunk]
+                if len(rows) == 0:
+                    continue
+                with _profTimer(profile, "read"):
+                    chunk = _fetchChunk(plan["path"], iStart, iStop, opts, cache_files)
+                iFirst = offsets[i] + (len(range(iStart)[plan["sel"]]) if isinstance(plan["sel"], slice) else np.searchsorted(plan["sel"], iStart))
+                with _profTimer(profile, "reshape"):
+                    yield self.__condition(chunk[rows], plan["fileIndex"], np.arange(iFirst, iFirst + len(rows)))
+    
+    # iterate over the dataset chunk by chunk, with no need to open() it all: the next chunks are read & decoded in a
+    # background thread while the current one is processed (e.g. with collection calculations & histogram filling),
+    # up to depth chunks ahead -- the memory used being capped to about depth + 2 chunks (see prefetchIter)
+    # chunksize is the nr. of events of each file read at once, if None the dataset chunksize
+    # note: the events, their order & their index values are the same as in open(), the pipeline statistics (e.g.
+    # the fraction of reading time hidden behind the processing) being stored into iterate_stats at the end
+    # --> yield copies of the instance, each containing the events of a chunk
+    def iterate(self, chunksize=None, depth=2):
+        if (self.dataType == "PARQUET") & (len(self.cuts) > 0):
+            raise ValueError("datasets with cuts cannot be iterated over chunk by chunk")
+        self.__fetch_setup()
+        chunksize = self.chunksize if chunksize is None else int(chunksize)
+        profile_producer = cProfileReport("prefetch")  # filled in the background thread, merged at the end
+        self.iterate_stats = {}
+        try:
+            for df_temp in prefetchIter(self.__iter_chunks(chunksize, profile_producer), depth, self.profile, self.iterate_stats):
+                dataset_new = self.__copy_with(df_temp)
+                dataset_new.__compute_size()
+                _profCount(self.profile, "events_read", dataset_new.nevs)
+                yield dataset_new
+        finally:
+            self.profile.merge(profile_producer)
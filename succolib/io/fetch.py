@@ -0,0 +1,114 @@
+import numpy as np
+import awkward as ak
+from collections import OrderedDict
+
+########################################################################################################################
+
+class cLruCache:
+    # least-recently-used cache, e.g. of the chunks decoded from the input files by cAkDataset.fetch(): once full,
+    # the item accessed least recently is dropped at each insertion
+    def __init__(
+        self,
+        nmax = 16,
+    ):
+
+        # attributes set via input:
+
+        self.nmax = int(nmax)  # maximum nr. of items
+
+        # calculated attributes:
+
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # --> return the nr. of items
+    def __len__(self):
+        return len(self.items)
+
+    # get an item, computing it (and storing it) if not available
+    # key is the item key, func the function computing the item (with no arguments)
+    # --> return the item
+    def get(self, key, func):
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+        self.misses += 1
+        item = func()
+        if self.nmax > 0:
+            self.items[key] = item
+            while len(self.items) > self.nmax:
+                self.items.popitem(last=False)
+        return item
+
+    # drop all the items
+    def clear(self):
+        self.items.clear()
+
+########################################################################################################################
+
+# byte offsets of the events in a text file, i.e. of the first line of each (complete) event, plus the end of the last
+# one -- empty lines being skipped, as in the input functions, private
+# --> return the NumPy array of offsets
+def _fetchAsciiOffsets(fileName, nLinesEv=1):
+    lsOffsets = []
+    pos = 0
+    with open(fileName, "rb") as f:
+        for line in f:
+            if len(line.strip()) > 0:
+                lsOffsets.append(pos)
+            pos += len(line)
+    offsets = np.array(lsOffsets + [pos], dtype=np.int64)
+    nEv = len(lsOffsets) // nLinesEv
+    return offsets[:nEv * nLinesEv + 1:nLinesEv]
+
+########################################################################################################################
+
+# read the events of a single input file between iStart (included) & iStop (excluded), i.e. a chunk, into an Awkward
+# Array -- with no data conditioning (mapping, mirroring), private
+# opts is the dictionary of the reading options (dataType & the format-specific ones, as in cAkDataset)
+# cache is the cLruCache for the file-level objects (text file event offsets, NumPy tables, Parquet metadata)
+# --> return the Awkward Array
+def _fetchChunk(fileName, iStart, iStop, opts, cache):
+    dataType = opts["dataType"]
+    if dataType == "ROOT":
+        import uproot
+        varlist = opts["varlist"]
+        with uproot.open(fileName) as f:
+            return f[opts["treeName"]].arrays(
+                None if (varlist is None) or (len(varlist)==0) else varlist, entry_start=iStart, entry_stop=iStop
+            )
+    elif dataType == "ASCII":
+        offsets = cache.get(("offsets", fileName), lambda: _fetchAsciiOffsets(fileName, opts["nLinesEv"]))
+        with open(fileName, "rb") as f:
+            f.seek(offsets[iStart])
+            lines = [line.strip() for line in f.read(offsets[iStop] - offsets[iStart]).splitlines() if len(line.strip()) > 0]
+        nLinesEv = opts["nLinesEv"]
+        lines = [b" ".join(lines[i:i+nLinesEv]) for i in range(0, (len(lines) // nLinesEv) * nLinesEv, nLinesEv)]
+        return ak.Array(dict(zip(opts["asciiMap"], np.loadtxt(lines, unpack=False, ndmin=2).T)))
+    elif dataType == "NPZ":
+        from .npz import _npzOpen, _npzTable
+        table = cache.get(("table", fileName), lambda: _npzTable(_npzOpen(fileName, opts["arrayName"]), opts["nLinesEv"]))
+        return ak.Array(dict(zip(opts["npzMap"], np.asarray(table[iStart:iStop]).T)))
+    elif dataType == "BINARY":
+        from .binary import _binaryNumRecords, _binaryTableToAk
+        nEv = _binaryNumRecords(fileName, opts["binaryDtype"], opts["headerSize"])
+        table = np.memmap(fileName, dtype=np.dtype(opts["binaryDtype"]), mode="c", offset=opts["headerSize"], shape=(nEv,))
+        return _binaryTableToAk(table[iStart:iStop])
+    elif dataType == "PARQUET":
+        import pyarrow.parquet as pq
+        def offsets_rg():
+            metadata = pq.ParquetFile(fileName).metadata
+            return np.cumsum([0] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+        offsets = cache.get(("row_groups", fileName), offsets_rg)
+        iRgStart = np.searchsorted(offsets, iStart, side="right") - 1
+        iRgStop = np.searchsorted(offsets, iStop, side="left")
+        varlist = opts["varlist"]
+        df = ak.from_parquet(
+            fileName, columns=None if (varlist is None) or (len(varlist)==0) else list(varlist),
+            row_groups=list(range(iRgStart, iRgStop)),
+        )
+        return df[iStart - offsets[iRgStart]:iStop - offsets[iRgStart]]
+    else:
+        raise ValueError("unknown data type %s" % dataType)
@@ -1,3 +1,8 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import awkward as ak
+
 ########################################################################################################################
 
 def dfMirror(
@@ -5,9 +10,9 @@ def dfMirror(
         map
 ):
 
-    for iVar in map:
-        if iVar in df.columns:
-            df[iVar] = -df[iVar]
+    ls_var = [iVar for iVar in map if iVar in df.columns]
+    if len(ls_var) > 0:
+        df[ls_var] = -df[ls_var]  # all the columns at once
     return df
 
 ########################################################################################################################
@@ -18,21 +23,71 @@ def dfReshape(
         bBrackets = True,
 ):
 
-    # remove square brackets from the variable names (if required)
-    if bBrackets:
-        df = df.rename(columns = dict(zip(
-            [s for s in df.columns if ("[" in s) & ("]" in s)],
-            [s.replace("[", "").replace("]", "") for s in df.columns if ("[" in s) & ("]" in s)]
-        )))
-
-    # rename variables according to map
-    df = df.rename(columns = dict(zip(
-        [map[s] for s in map if map[s] in df.columns],
-        [s for s in map if map[s] in df.columns]
-    )))
+    # remove square brackets from the variable names (if required) & rename variables according to map, in one go
+    dictRename = _schemaRename(list(df.columns), map, bBrackets)
+    dictRename = {s : dictRename[s] for s in dictRename if dictRename[s] != s}
+    if len(dictRename) > 0:
+        df = df.rename(columns = dictRename)
 
     return df
-    
+
+########################################################################################################################
+
+# map the original variable names onto the new ones, private
+# bBrackets is as in dfReshape/akReshape, map is as treeMap (custom names as keys, original names as values)
+# --> return a dictionary { original name : new name }
+def _schemaRename(fields, map, bBrackets):
+    mapInv = {map[s] : s for s in map}
+    dictRename = {}
+    for s in fields:
+        sNew = s.replace("[", "").replace("]", "") if (bBrackets & ("[" in s) & ("]" in s)) else s
+        dictRename[s] = mapInv[sNew] if sNew in mapInv else sNew
+    return dictRename
+
+########################################################################################################################
+
+# schema transforms computed so far, { (fields, map, bBrackets, mirror) : transform }
+_schemaCache = {}
+
+# compute the schema transform (renaming, bracket stripping, mirroring) for a certain record layout, private
+# transforms are cached per schema, so that files with identical layouts reuse them
+# --> return a list of (new name, original name, mirroring boolean), in the output field order
+def _schemaTransform(fields, map, bBrackets, mirror):
+    key = (tuple(fields), tuple(sorted(map.items())), bool(bBrackets), tuple(mirror))
+    if not (key in _schemaCache):
+        dictRename = _schemaRename(fields, map, bBrackets)
+        dictOut = {}
+        for s in fields:  # field positions are kept...
+            dictOut.setdefault(dictRename[s], s)
+        for s in fields:  # ... but renamed fields replace existing fields with the same name (as with df[new] = df[old])
+            if dictRename[s] != s:
+                dictOut[dictRename[s]] = s
+        _schemaCache[key] = [(sNew, dictOut[sNew], sNew in mirror) for sNew in dictOut]
+    return _schemaCache[key]
+
+########################################################################################################################
+
+# apply renaming, bracket stripping and mirroring to an Awkward Array in a single pass, i.e. rebuilding the record
+# only once on top of the existing field arrays (no data copy but for the mirrored fields)
+# map & bBrackets are as in akReshape (no renaming with an empty map & bBrackets = False), mirror as map in akMirror
+# --> return the new Awkward Array
+def akTransform(
+        df,
+        map = {},
+        bBrackets = False,
+        mirror = (),
+):
+
+    if len(df.fields) == 0:
+        return df
+    transform = _schemaTransform(df.fields, map, bBrackets, mirror)
+    if all([(sNew == s) & (not bMirror) for (sNew, s, bMirror) in transform]) & (len(transform) == len(df.fields)):
+        return df  # nothing to do
+    return ak.zip(
+        {sNew : (-df[s] if bMirror else df[s]) for (sNew, s, bMirror) in transform},
+        depth_limit=1,
+    )
+
 ########################################################################################################################
 
 def akMirror(
@@ -40,11 +95,8 @@ def akMirror(
         map
 ):
 
-    for iVar in map:
-        if iVar in df.fields:
-            df[iVar] = -df[iVar]
-    return df
-    
+    return akTransform(df, mirror=map)
+
 ########################################################################################################################
 
 def akReshape(
@@ -53,26 +105,166 @@ def akReshape(
         bBrackets = True,
 ):
 
-    # remove square brackets from the variable names (if required)
-    if bBrackets:
-        fieldsToChange = dict(zip(
-            [s for s in df.columns if ("[" in s) & ("]" in s)],
-            [s.replace("[", "").replace("]", "") for s in df.columns if ("[" in s) & ("]" in s)]
-        ))
-        for fieldOld in fieldsToChange:
-            fieldNew = fieldsToChange[fieldOld]
-            df[fieldNew] = df[fieldOld]
-            df = df[[field for field in ak.fields(df) if field!=fieldOld]]
-
-    # rename variables according to map
-    if bBrackets:
-        fieldsToChange = dict(zip(
-            [map[s] for s in map if map[s] in df.columns],
-            [s for s in map if map[s] in df.columns]
-        ))
-        for fieldOld in fieldsToChange:
-            fieldNew = fieldsToChange[fieldOld]
-            df[fieldNew] = df[fieldOld]
-            df = df[[field for field in ak.fields(df) if field!=fieldOld]]
-
-    return df
\ No newline at end of file
+    return akTransform(df, map, bBrackets)
+
+########################################################################################################################
+
+# build a categorical (i.e. dictionary-encoded) Awkward Array from its integer codes & its table of levels
+# codes is the array of the level indices, levels the list of labels (converted to strings)
+# --> return the categorical Awkward Array
+def akCategorical(
+        codes,
+        levels,
+):
+
+    return ak.Array(ak.contents.IndexedArray(
+        ak.index.Index64(np.asarray(codes, dtype=np.int64)),
+        ak.to_layout(np.array([str(s) for s in levels], dtype=str)),
+        parameters={"__array__" : "categorical"},
+    ))
+
+########################################################################################################################
+
+# check whether an Awkward Array is categorical, private
+def _akIsCategorical(values):
+    return isinstance(values, ak.Array) and values.layout.is_indexed and (not values.layout.is_option)\
+        and (values.layout.parameter("__array__") == "categorical")
+
+########################################################################################################################
+
+# encode an array of labels (Awkward Array, NumPy array, list, ...) as a categorical Awkward Array
+# labels are converted to strings, with the levels sorted -- categorical Awkward Arrays are returned as they are
+# --> return the categorical Awkward Array
+def akToCategorical(
+        values,
+):
+
+    if _akIsCategorical(values):
+        return values
+    labels = np.asarray(ak.to_numpy(values) if isinstance(values, ak.Array) else values).astype(str)
+    levels, codes = np.unique(labels, return_inverse=True)
+    return akCategorical(codes, levels)
+
+########################################################################################################################
+
+# get the integer codes & the table of levels of an array of labels (encoded first, if not categorical), private
+# --> return the NumPy array of codes & the list of levels
+def _akCategoricalParts(values):
+    values = akToCategorical(values)
+    return np.asarray(values.layout.index.data), [str(s) for s in ak.to_list(values.layout.content)]
+
+########################################################################################################################
+
+# categorical Awkward Array with the same label for all the nEv entries (e.g. the fileIndexName column), private
+def _akCategoricalFill(nEv, label):
+    return akCategorical(np.zeros(nEv, dtype=np.int64), [label])
+
+########################################################################################################################
+
+# add (or replace) a field in an Awkward Array of records, keeping the categorical fields categorical, private
+# records behind an index (e.g. after a selection or a sampling) are projected first, as the categorical parameter
+# would be lost otherwise
+# --> return the new Awkward Array
+def _akWithField(df, name, values):
+    if df.layout.is_indexed and (_akIsCategorical(values) | any([_akIsCategorical(df[s]) for s in df.fields])):
+        df = ak.Array(df.layout.project())
+    df[name] = values
+    return df
+
+########################################################################################################################
+
+# add (or replace) several fields in an Awkward Array of records at once, i.e. with a single record rebuild -- the
+# existing fields keeping their order, the new ones being appended, private
+# --> return the new Awkward Array
+def _akWithFields(df, dictValues):
+    if (len(df.fields) == 0) | (len(dictValues) <= 1):  # nothing to rebuild
+        for name in dictValues:
+            df = _akWithField(df, name, dictValues[name])
+        return df
+    if df.layout.is_indexed:
+        df = ak.Array(df.layout.project())
+    dictFields = {s : df[s] for s in df.fields}
+    for name in dictValues:
+        values = dictValues[name]
+        dictFields[name] = values if isinstance(values, (ak.Array, np.ndarray)) else ak.Array(values)
+    return ak.zip(dictFields, depth_limit=1)
+
+########################################################################################################################
+
+# select the entries of an array of labels (typically the fileIndexName column) equal to a label or to any label in a
+# list, comparing the integer codes only, i.e. with no string comparison per event
+# --> return the boolean NumPy array, to be used as a mask
+def akCategoryMask(
+        values,
+        labels,
+):
+
+    codes, levels = _akCategoricalParts(values)
+    labels = set([str(s) for s in ([labels] if isinstance(labels, str) else labels)])
+    return np.isin(codes, [i for i, s in enumerate(levels) if s in labels])
+
+########################################################################################################################
+
+# concatenate Awkward Arrays of records (with the same fields) keeping the categorical fields categorical, i.e.
+# merging their tables of levels & remapping their codes -- which ak.concatenate alone cannot do
+# arrays with no fields at all (e.g. the empty ak.Array([])) are skipped
+# --> return the concatenated Awkward Array
+def akConcatenate(
+        lsDf,
+):
+
+    lsDf = [df for df in lsDf if len(df.fields) > 0]
+    if len(lsDf) <= 1:
+        return lsDf[0] if len(lsDf) == 1 else ak.Array([])
+
+    fields = lsDf[0].fields
+    lsCat = [s for s in fields if all([s in df.fields for df in lsDf]) & any([_akIsCategorical(df[s]) for df in lsDf])]
+    if len(lsCat) == 0:
+        return ak.concatenate(lsDf)
+    lsRest = [s for s in fields if not (s in lsCat)]
+    dfRest = ak.concatenate([df[lsRest] for df in lsDf]) if len(lsRest) > 0 else None
+
+    dictOut = {}
+    for s in fields:
+        if s in lsCat:  # codes remapped onto the merged (sorted) table of levels
+            lsParts = [_akCategoricalParts(df[s]) for df in lsDf]
+            levels = sorted(set([lev for (_, lsLev) in lsParts for lev in lsLev]))
+            dictLevels = {lev : i for i, lev in enumerate(levels)}
+            codes = np.concatenate(
+                [np.array([dictLevels[lev] for lev in lsLev], dtype=np.int64)[codesPart] for (codesPart, lsLev) in lsParts]
+            )
+            dictOut[s] = akCategorical(codes, levels)
+        else:
+            dictOut[s] = dfRest[s]
+    return ak.zip(dictOut, depth_limit=1)
+
+########################################################################################################################
+
+# pandas Categorical with the same label for all the nEv entries (e.g. the fileIndexName column), private
+def _dfCategoricalFill(nEv, label):
+    return pd.Categorical.from_codes(np.zeros(nEv, dtype=np.int8), categories=[str(label)])
+
+########################################################################################################################
+
+# concatenate pandas DataFrames keeping the categorical columns categorical, i.e. merging their categories -- which
+# pd.concat alone does only if all the categories are identical
+# DataFrames with no columns at all are skipped, the index is reset
+# --> return the concatenated DataFrame
+def dfConcatenate(
+        lsDf,
+):
+
+    lsDf = [df for df in lsDf if len(df.columns) > 0]
+    if len(lsDf) <= 1:
+        return lsDf[0] if len(lsDf) == 1 else pd.DataFrame()
+
+    columns = list(lsDf[0].columns)
+    lsCat = [s for s in columns if all([s in df.columns for df in lsDf])
+             & any([isinstance(df[s].dtype, pd.CategoricalDtype) for df in lsDf])]
+    dfOut = pd.concat([df.drop(columns=lsCat) for df in lsDf], ignore_index=True, sort=False)
+    for s in lsCat:
+        dfOut[s] = union_categoricals(
+            [df[s].values if isinstance(df[s].dtype, pd.CategoricalDtype) else pd.Categorical(df[s].astype(str)) for df in lsDf],
+            sort_categories=True,
+        )
+    return dfOut[columns + [s for s in dfOut.columns if not (s in columns)]]
@@ -1,11 +1,64 @@
 import numpy as np
 import glob
 import pandas as pd
+import awkward as ak
 import os
 import time
+import zipfile
 from tqdm.auto import tqdm
 
-from .misc import dfMirror
+from .misc import dfMirror, akMirror, akConcatenate, akToCategorical, _akCategoricalFill, _akWithField, dfConcatenate, _dfCategoricalFill
+from .sampling import _descFracClip, _sampleSel, _sampleApply, _sampleBudget
+from ..profiling.profile_report import _profTimer, _profCount
+
+########################################################################################################################
+
+# open the array stored in a NumPy file, memory-mapping it if possible (i.e. NPY files and uncompressed NPZ files --
+# pages are only read from disk when accessed and copied when written), private
+# fileName is the file to open, arrayName the name of the array (ignored for NPY files)
+# --> return the array (a memory map or, for compressed NPZ files, a fully decompressed array)
+def _npzOpen(fileName, arrayName, profile=None):
+    if fileName.endswith(".npy"):
+        with _profTimer(profile, "read"):
+            return np.load(fileName, mmap_mode="c")
+
+    with zipfile.ZipFile(fileName) as fZip:
+        info = fZip.getinfo(arrayName + ".npy")
+    if info.compress_type == zipfile.ZIP_STORED:
+        with _profTimer(profile, "read"):
+            with open(fileName, "rb") as f:
+                # the array data follows the local file header & the NPY header of the member
+                f.seek(info.header_offset + 26)
+                nName, nExtra = np.frombuffer(f.read(4), dtype="<u2")
+                f.seek(info.header_offset + 30 + int(nName) + int(nExtra))
+                version = np.lib.format.read_magic(f)
+                if version in ((1, 0), (2, 0)):
+                    shape, bFortran, dtype = (np.lib.format.read_array_header_1_0 if version == (1, 0) else
+                                              np.lib.format.read_array_header_2_0)(f)
+                    offset = f.tell()
+            if (version in ((1, 0), (2, 0))) and (not dtype.hasobject):
+                return np.memmap(
+                    fileName, dtype=dtype, mode="c", offset=offset, shape=shape, order="F" if bFortran else "C"
+                )
+
+    with _profTimer(profile, "decompress"):  # compressed NPZ files (or unusual NPY formats), no memory map
+        with np.load(fileName) as data0:
+            return data0[arrayName]
+
+########################################################################################################################
+
+# turn the (lines * columns) table of a file into the (events * variables) one and apply the descaling, as views of
+# the original table (no copy, as long as the table is C-contiguous, as in memory-mapped files), private
+# only complete events are kept (the last incomplete one, if any, is dropped)
+# the random descaling mode (see sampling.py) is the only one requiring a copy (of the events kept only)
+# nEvMax is the maximum nr. of events to return
+# --> return the (events * variables) table
+def _npzTable(table, nLinesEv=1, descFrac=1, descMode="strided", descSeed=0, fileName="", nEvMax=10000000000):
+    table = np.asarray(table) if table.ndim == 2 else np.asarray(table).reshape(len(table), -1)
+    if nLinesEv > 1:
+        nEv = table.shape[0] // nLinesEv
+        table = table[:nEv * nLinesEv].reshape(nEv, nLinesEv * table.shape[1])  # same as hstack of the strided lines
+    return _sampleApply(table, _sampleBudget(_sampleSel(len(table), descFrac, descMode, descSeed, fileName), nEvMax))
 
 ########################################################################################################################
 
@@ -19,23 +72,31 @@ def npzToDf(
         mirrorMap = (),  # this is a tuple here, but a dictionary in npzToDfMulti() (i.e. the "main" function)
         bVerbose = False,
         bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
 ):
 
     t0 = time.time()  # chronometer start
-    names = sorted(glob.glob(nameFormat.replace("YYYYYY", "*")))  # list of all the filenames of the current run
+    with _profTimer(profile, "glob"):
+        names = sorted(glob.glob(nameFormat.replace("YYYYYY", "*")))  # list of all the filenames of the current run
     df = pd.DataFrame()
-    descFrac = 1e-12 if descFrac <= 0 else (descFrac if descFrac <= 1 else 1)
+    ls_df = []
+    descFrac = _descFracClip(descFrac)
     for iName in tqdm((names)) if (bVerbose & bProgress) else names:
         if os.stat(iName).st_size > 0:
-            with np.load(iName) as data0:
-                dataTableTemp0 = data0[arrayName]
-            if nLinesEv == 1:
-                dataTableTemp = dataTableTemp0
-            else:
-                dataTableTemp = np.hstack([dataTableTemp0[i::nLinesEv] for i in range(nLinesEv)])
-            dfTemp = pd.DataFrame(dataTableTemp, columns=npzMap)
-            df = df.append(dfTemp[dfTemp.index % int(1 / descFrac) == 0], ignore_index=True, sort=False)
-            df = dfMirror(df, mirrorMap)
+            _profCount(profile, "bytes_read", os.stat(iName).st_size)
+            dataTableTemp0 = _npzOpen(iName, arrayName, profile)
+            with _profTimer(profile, "reshape"):
+                dataTableTemp = _npzTable(dataTableTemp0, nLinesEv, descFrac, descMode, descSeed, iName)
+            _profCount(profile, "events_read", len(dataTableTemp))
+            dfTemp = pd.DataFrame(dataTableTemp, columns=npzMap, copy=False)
+            with _profTimer(profile, "mirror"):
+                dfTemp = dfMirror(dfTemp, mirrorMap)
+            ls_df.append(dfTemp)
+    if len(ls_df) > 0:
+        with _profTimer(profile, "concat"):
+            df = ls_df[0] if len(ls_df) == 1 else pd.concat(ls_df, ignore_index=True, sort=False)
     t1 = time.time()  # chronometer stop
     dt = t1 - t0
     return df, dt
@@ -53,6 +114,9 @@ def npzToDfMulti(
         mirrorMap = {},
         bVerbose = False,
         bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
 ):
 
     t0 = time.time()  # chronometer start
@@ -62,13 +126,14 @@ def npzToDfMulti(
             descFrac.update({iIndex: 1})  # all the undefined descaling factors are trivially set to 1
         if bVerbose:
             print("(%d/%d) %s -- descaling fraction: %14.12f" % (i+1, len(fileIndex), iIndex, descFrac[iIndex]))
-        dfTemp, _ = npzToDf(nameFormat.replace("XXXXXX", iIndex), npzMap, arrayName, nLinesEv, descFrac[iIndex], bVerbose=bVerbose, bProgress=bProgress)
+        dfTemp, _ = npzToDf(nameFormat.replace("XXXXXX", iIndex), npzMap, arrayName, nLinesEv, descFrac[iIndex], bVerbose=bVerbose, bProgress=bProgress, profile=profile, descMode=descMode, descSeed=descSeed)
 
         # data mirroring according to mirrorMap, which differs from iLayer to iLayer
         if iIndex in mirrorMap:
             if bVerbose:
                 print("mirroring (from mirror map given) "+str(mirrorMap[iIndex]))
-            dfTemp = dfMirror(dfTemp, mirrorMap[iIndex])
+            with _profTimer(profile, "mirror"):
+                dfTemp = dfMirror(dfTemp, mirrorMap[iIndex])
         else:
             if bVerbose:
                 print("no variables to mirror")
@@ -77,12 +142,138 @@ def npzToDfMulti(
         if len(fileIndexName)>0:
             if bVerbose:
                 print("%s also added to df" % fileIndexName)
+            # as a categorical column, i.e. integer codes + table of categories
             if not (fileIndexName in dfTemp.columns):
-                dfTemp[fileIndexName] = str(iIndex)
+                dfTemp[fileIndexName] = _dfCategoricalFill(len(dfTemp), iIndex)
             else:
-                dfTemp[fileIndexName] = dfTemp[fileIndexName].astype(str)
+                dfTemp[fileIndexName] = dfTemp[fileIndexName].astype(str).astype("category")
+
+        with _profTimer(profile, "concat"):
+            df = dfConcatenate((df, dfTemp))
+        _profCount(profile, "bytes_allocated", df.memory_usage(index=False).sum())
+    t1 = time.time()  # chronometer stop
+    dt = t1 - t0
+    return df, dt
+
+########################################################################################################################
+
+# read the events stored in a single NumPy file into an Awkward Array, private
+# the Awkward Array fields are views of the (memory-mapped, if possible) file array, i.e. no copy is made
+# --> return the Awkward Array
+def _npzToAkFile(
+        fileName,
+        npzMap,
+        arrayName,
+        nLinesEv = 1,
+        descFrac = 1,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+        nEvMax = 10000000000,
+):
+
+    dataTableTemp0 = _npzOpen(fileName, arrayName, profile)
+    with _profTimer(profile, "reshape"):
+        dataTableTemp = _npzTable(dataTableTemp0, nLinesEv, descFrac, descMode, descSeed, fileName, nEvMax)
+    _profCount(profile, "events_read", len(dataTableTemp))
+    return ak.Array(dict(zip(npzMap, dataTableTemp.T)))
+
+########################################################################################################################
 
-        df = df.append(dfTemp, ignore_index=True, sort=False)
+# it's best to use npzToAkMulti() (which exploits this npzToAk()) also for single file opening
+def npzToAk(
+        nameFormat,
+        npzMap,
+        arrayName,
+        nLinesEv = 1,
+        descFrac = 1,
+        nEvMax = 10000000000,
+        mirrorMap = (),  # this is a tuple here, but a dictionary in npzToAkMulti() (i.e. the "main" function)
+        bVerbose = False,
+        bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+):
+
+    t0 = time.time()  # chronometer start
+    with _profTimer(profile, "glob"):
+        names = sorted(glob.glob(nameFormat.replace("YYYYYY", "*")))  # list of all the filenames of the current run
+    df = ak.Array([])
+    descFrac = _descFracClip(descFrac)
+    for iName in tqdm((names)) if (bVerbose & bProgress) else names:
+        if os.stat(iName).st_size > 0:
+            _profCount(profile, "bytes_read", os.stat(iName).st_size)
+            dfTemp = _npzToAkFile(iName, npzMap, arrayName, nLinesEv, descFrac, profile, descMode, descSeed, nEvMax - len(df))
+            with _profTimer(profile, "mirror"):
+                dfTemp = akMirror(dfTemp, mirrorMap)
+            with _profTimer(profile, "concat"):
+                df = dfTemp if len(df) == 0 else ak.concatenate((df, dfTemp))
+            if len(df)>=nEvMax:  # read budget exhausted, the remaining files are not even opened
+                df = df[:nEvMax]
+                if bVerbose:
+                    print("event nr. reached nEvMax=%d, breaking" % nEvMax)
+                break
+    t1 = time.time()  # chronometer stop
+    dt = t1 - t0
+    return df, dt
+
+########################################################################################################################
+
+def npzToAkMulti(
+        nameFormat,
+        fileIndex,
+        npzMap,
+        arrayName,
+        nLinesEv = 1,
+        fileIndexName = "iIndex",
+        descFrac = {},
+        nEvMax = 10000000000,
+        mirrorMap = {},
+        bVerbose = False,
+        bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+):
+
+    t0 = time.time()  # chronometer start
+    df = ak.Array([])
+    for i, iIndex in enumerate(sorted(fileIndex)):
+        if not (iIndex in descFrac.keys()):
+            descFrac.update({iIndex: 1})  # all the undefined descaling factors are trivially set to 1
+        if bVerbose:
+            print("(%d/%d) %s -- descaling fraction: %14.12f" % (i+1, len(fileIndex), iIndex, descFrac[iIndex]))
+        dfTemp, _ = npzToAk(nameFormat.replace("XXXXXX", iIndex), npzMap, arrayName, nLinesEv, descFrac[iIndex], nEvMax - len(df), bVerbose=bVerbose, bProgress=bProgress, profile=profile, descMode=descMode, descSeed=descSeed)
+
+        # data mirroring according to mirrorMap, which differs from iLayer to iLayer
+        if iIndex in mirrorMap:
+            if bVerbose:
+                print("mirroring (from mirror map given) "+str(mirrorMap[iIndex]))
+            with _profTimer(profile, "mirror"):
+                dfTemp = akMirror(dfTemp, mirrorMap[iIndex])
+        else:
+            if bVerbose:
+                print("no variables to mirror")
+
+        # fileIndexName column creation (if requested & not already existing)
+        if len(fileIndexName)>0:
+            if bVerbose:
+                print("%s also added to df" % fileIndexName)
+            if len(dfTemp.fields) > 0:  # as a categorical column, i.e. integer codes + table of levels
+                if not (fileIndexName in dfTemp.fields):
+                    dfTemp = _akWithField(dfTemp, fileIndexName, _akCategoricalFill(len(dfTemp), iIndex))
+                else:
+                    dfTemp = _akWithField(dfTemp, fileIndexName, akToCategorical(dfTemp[fileIndexName]))
+
+        with _profTimer(profile, "concat"):
+            df = akConcatenate((df, dfTemp))
+        _profCount(profile, "bytes_allocated", df.nbytes)
+        if len(df)>=nEvMax:  # read budget exhausted, the remaining filesets are not even globbed
+            df = df[:nEvMax]
+            if bVerbose:
+                print("event nr. reached nEvMax=%d, breaking" % nEvMax)
+            break
     t1 = time.time()  # chronometer stop
     dt = t1 - t0
     return df, dt
@@ -0,0 +1,305 @@
+import numpy as np
+import glob
+import awkward as ak
+import operator
+import os
+import time
+from tqdm.auto import tqdm
+
+from .misc import akMirror, akConcatenate, akToCategorical, akCategoryMask, _akCategoricalFill, _akWithField
+from .sampling import _descFracClip, _sampleSel, _sampleSelChunk, _sampleApply, _sampleStop, _sampleBudget
+from ..profiling.profile_report import _profTimer, _profCount
+
+# note: Parquet files are written & read via Awkward, which requires pyarrow (imported by Awkward only when needed)
+
+########################################################################################################################
+
+# simple cuts, i.e. (variable, operator, value) with the operators below -- applied event by event and, for pruning
+# the row groups that cannot contain any selected event, on the row-group statistics (minimum & maximum) of the files
+cutOps = {
+    "<" : operator.lt,
+    "<=" : operator.le,
+    ">" : operator.gt,
+    ">=" : operator.ge,
+    "==" : operator.eq,
+    "!=" : operator.ne,
+}
+
+########################################################################################################################
+
+# check whether a row group might contain events passing a single cut, given the minimum & maximum of the variable
+# in the row group, private
+def _cutMightPass(op, value, vMin, vMax):
+    if op == "<":
+        return vMin < value
+    elif op == "<=":
+        return vMin <= value
+    elif op == ">":
+        return vMax > value
+    elif op == ">=":
+        return vMax >= value
+    elif op == "==":
+        return (vMin <= value) & (value <= vMax)
+    else:  # "!="
+        return not ((vMin == value) & (vMax == value))
+
+########################################################################################################################
+
+# check the cuts format, private
+def _cutsCheck(cuts):
+    for cut in cuts:
+        if (len(cut) != 3) or (not (cut[1] in cutOps)):
+            raise ValueError("invalid cut %s, use (variable, operator, value) with operator among %s" % (str(cut), str(tuple(cutOps.keys()))))
+
+########################################################################################################################
+
+# select the row groups of a Parquet file that might contain events passing all the cuts, from the row-group
+# statistics, private -- row groups with no statistics for a variable (e.g. non-scalar ones) are always kept
+# metadata is the pyarrow file metadata
+# --> return the list of booleans, one per row group
+def _parquetRowGroupsKeep(metadata, cuts):
+    lsKeep = []
+    for i in range(metadata.num_row_groups):
+        rowGroup = metadata.row_group(i)
+        dictStats = {}
+        for j in range(rowGroup.num_columns):
+            stats = rowGroup.column(j).statistics
+            if (not (stats is None)) and stats.has_min_max:
+                dictStats[rowGroup.column(j).path_in_schema] = (stats.min, stats.max)
+        bKeep = True
+        for (var, op, value) in cuts:
+            if var in dictStats:
+                try:
+                    bKeep &= bool(_cutMightPass(op, value, *dictStats[var]))
+                except TypeError:  # value not comparable with the statistics, the row group is kept
+                    pass
+        lsKeep.append(bKeep)
+    return lsKeep
+
+########################################################################################################################
+
+# apply simple cuts event by event, private
+# --> return the Awkward Array with the selected events
+def _akCutApply(df, cuts):
+    if (len(cuts) == 0) | (len(df) == 0):
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for (var, op, value) in cuts:
+        mask &= np.asarray(ak.to_numpy(cutOps[op](df[var], value)), dtype=bool)
+    return df[mask]
+
+########################################################################################################################
+
+# write an Awkward Array of records to a single Parquet file
+# fileName is the output file, chunksize the nr. of events per row group (i.e. per reading chunk)
+# varlist is the list of fields to be written, all of them if empty
+# note: written to a temporary file first, so that an interrupted writing never leaves a corrupted file
+def akToParquet(
+        df,
+        fileName,
+        chunksize = 100000,
+        varlist = [],
+):
+
+    if (not (varlist is None)) and (len(varlist) > 0):
+        df = df[list(varlist)]
+    ak.to_parquet(df, fileName + ".tmp", row_group_size=int(chunksize))
+    os.replace(fileName + ".tmp", fileName)
+
+########################################################################################################################
+
+# write an Awkward Array of records to a set of Parquet files following the XXXXXX/YYYYYY naming
+# nameFormat is the output file name format: XXXXXX is replaced with each fileset ID in fileIndex (the events being
+# split according to their fileIndexName variable, if existing -- otherwise all of them are in each fileset) and
+# YYYYYY with the file nr. (6 digits), each file containing up to nEvPerFile events (all of them if None)
+# chunksize & varlist are as in akToParquet
+# --> return the list of the files written
+def akToParquetMulti(
+        df,
+        nameFormat,
+        fileIndex,
+        fileIndexName = "iIndex",
+        chunksize = 100000,
+        nEvPerFile = None,
+        varlist = [],
+):
+
+    lsNames = []
+    for iIndex in (sorted(fileIndex) if "XXXXXX" in nameFormat else [""]):
+        dfTemp = df
+        if ("XXXXXX" in nameFormat) & (len(fileIndexName) > 0) & (fileIndexName in df.fields):
+            dfTemp = df[akCategoryMask(df[fileIndexName], iIndex)]
+        if len(dfTemp) == 0:
+            continue
+        nEvFile = len(dfTemp) if nEvPerFile is None else int(nEvPerFile)
+        for iFile, iEv0 in enumerate(range(0, len(dfTemp), nEvFile)):
+            name = nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "%06d" % iFile)
+            akToParquet(dfTemp[iEv0:iEv0+nEvFile], name, chunksize, varlist)
+            lsNames.append(name)
+    return lsNames
+
+########################################################################################################################
+
+# read the events stored in a single Parquet file into an Awkward Array, private
+# the file is read row group by row group, skipping the row groups that cannot contain events passing the cuts (from
+# their statistics) and those after the last event needed (due to sampling or to the read budget)
+# varlist is the list of the fields to be read (column projection), all of them if empty
+# cuts is the list of the simple cuts, applied after the sampling, nEvMax counting the events passing them
+# --> return the Awkward Array
+def _parquetToAkFile(
+        fileName,
+        varlist = [],
+        cuts = [],
+        descFrac = 1,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+        nEvMax = 10000000000,
+):
+
+    import pyarrow.parquet as pq
+
+    with _profTimer(profile, "read"):
+        metadata = pq.ParquetFile(fileName).metadata
+    nEv = metadata.num_rows
+    sel = _sampleSel(nEv, descFrac, descMode, descSeed, fileName)
+    if len(cuts) == 0:  # otherwise the read budget is only known after the cuts
+        sel = _sampleBudget(sel, nEvMax)
+    iStop = _sampleStop(sel, nEv)
+    lsKeep = _parquetRowGroupsKeep(metadata, cuts)
+
+    columns = None
+    if (not (varlist is None)) and (len(varlist) > 0):
+        columns = list(varlist) + [var for (var, _, _) in cuts if not (var in varlist)]
+
+    lsChunks = []
+    nEvLeft = nEvMax
+    iStart = 0
+    for i in range(metadata.num_row_groups):
+        iStartGroup, iStart = iStart, iStart + metadata.row_group(i).num_rows
+        if (iStartGroup >= iStop) | (nEvLeft <= 0):
+            break
+        if not lsKeep[i]:
+            _profCount(profile, "row_groups_skipped", 1)
+            continue
+        selChunk = _sampleSelChunk(sel, iStartGroup, iStart)
+        if len(range(iStart - iStartGroup)[selChunk] if isinstance(selChunk, slice) else selChunk) == 0:
+            continue
+        with _profTimer(profile, "read"):
+            chunk = ak.from_parquet(fileName, columns=columns, row_groups=[i])
+        _profCount(profile, "events_read", len(chunk))
+        with _profTimer(profile, "reshape"):
+            chunk = _akCutApply(_sampleApply(chunk, selChunk), cuts)[:nEvLeft]
+        if len(chunk) > 0:
+            lsChunks.append(chunk)
+            nEvLeft -= len(chunk)
+
+    if len(lsChunks) == 0:
+        return ak.Array([])
+    with _profTimer(profile, "concat"):
+        df = lsChunks[0] if len(lsChunks) == 1 else ak.concatenate(lsChunks)
+    if not (columns is None):
+        df = df[list(varlist)]
+    return df
+
+########################################################################################################################
+
+# it's best to use parquetToAkMulti() (which exploits this parquetToAk()) also for single file opening
+def parquetToAk(
+        nameFormat,
+        varlist = [],
+        cuts = [],
+        descFrac = 1,
+        nEvMax = 10000000000,
+        mirrorMap = (),  # this is a tuple here, but a dictionary in parquetToAkMulti() (i.e. the "main" function)
+        bVerbose = False,
+        bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+):
+
+    t0 = time.time()  # chronometer start
+    _cutsCheck(cuts)
+    with _profTimer(profile, "glob"):
+        names = sorted(glob.glob(nameFormat.replace("YYYYYY", "*")))  # list of all the filenames of the current run
+    df = ak.Array([])
+    descFrac = _descFracClip(descFrac)
+    for iName in tqdm((names)) if (bVerbose & bProgress) else names:
+        if os.stat(iName).st_size > 0:
+            _profCount(profile, "bytes_read", os.stat(iName).st_size)
+            dfTemp = _parquetToAkFile(iName, varlist, cuts, descFrac, profile, descMode, descSeed, nEvMax - len(df))
+            if len(dfTemp) == 0:
+                continue
+            with _profTimer(profile, "mirror"):
+                dfTemp = akMirror(dfTemp, mirrorMap)
+            with _profTimer(profile, "concat"):
+                df = dfTemp if len(df) == 0 else ak.concatenate((df, dfTemp))
+            if len(df)>=nEvMax:  # read budget exhausted, the remaining files are not even opened
+                df = df[:nEvMax]
+                if bVerbose:
+                    print("event nr. reached nEvMax=%d, breaking" % nEvMax)
+                break
+    t1 = time.time()  # chronometer stop
+    dt = t1 - t0
+    return df, dt
+
+########################################################################################################################
+
+def parquetToAkMulti(
+        nameFormat,
+        fileIndex,
+        varlist = [],
+        cuts = [],
+        fileIndexName = "iIndex",
+        descFrac = {},
+        nEvMax = 10000000000,
+        mirrorMap = {},
+        bVerbose = False,
+        bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
+):
+
+    t0 = time.time()  # chronometer start
+    df = ak.Array([])
+    for i, iIndex in enumerate(sorted(fileIndex)):
+        if not (iIndex in descFrac.keys()):
+            descFrac.update({iIndex: 1})  # all the undefined descaling factors are trivially set to 1
+        if bVerbose:
+            print("(%d/%d) %s -- descaling fraction: %14.12f" % (i+1, len(fileIndex), iIndex, descFrac[iIndex]))
+        dfTemp, _ = parquetToAk(nameFormat.replace("XXXXXX", iIndex), varlist, cuts, descFrac[iIndex], nEvMax - len(df), bVerbose=bVerbose, bProgress=bProgress, profile=profile, descMode=descMode, descSeed=descSeed)
+
+        # data mirroring according to mirrorMap, which differs from iLayer to iLayer
+        if iIndex in mirrorMap:
+            if bVerbose:
+                print("mirroring (from mirror map given) "+str(mirrorMap[iIndex]))
+            with _profTimer(profile, "mirror"):
+                dfTemp = akMirror(dfTemp, mirrorMap[iIndex])
+        else:
+            if bVerbose:
+                print("no variables to mirror")
+
+        # fileIndexName column creation (if requested & not already existing) -- categorical variables are stored as
+        # strings in Parquet files, hence re-encoded here
+        if len(fileIndexName)>0:
+            if bVerbose:
+                print("%s also added to df" % fileIndexName)
+            if len(dfTemp.fields) > 0:  # as a categorical column, i.e. integer codes + table of levels
+                if not (fileIndexName in dfTemp.fields):
+                    dfTemp = _akWithField(dfTemp, fileIndexName, _akCategoricalFill(len(dfTemp), iIndex))
+                else:
+                    dfTemp = _akWithField(dfTemp, fileIndexName, akToCategorical(dfTemp[fileIndexName]))
+
+        with _profTimer(profile, "concat"):
+            df = akConcatenate((df, dfTemp))
+        _profCount(profile, "bytes_allocated", df.nbytes)
+        if len(df)>=nEvMax:  # read budget exhausted, the remaining filesets are not even globbed
+            df = df[:nEvMax]
+            if bVerbose:
+                print("event nr. reached nEvMax=%d, breaking" % nEvMax)
+            break
+    t1 = time.time()  # chronometer stop
+    dt = t1 - t0
+    return df, dt
@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+
+from ..profiling.profile_report import _profCount
+
+########################################################################################################################
+
+_prefetchEnd = object()  # end-of-iteration marker, private
+
+########################################################################################################################
+
+# put an item into a queue, waiting while the queue is full (i.e. back-pressure) unless stop is set, private
+# --> return the time spent waiting, in seconds
+def _prefetchPut(q, item, stop):
+    t0 = time.perf_counter()
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.05)
+            break
+        except queue.Full:
+            continue
+    return time.perf_counter() - t0
+
+########################################################################################################################
+
+# iterate over the items of an iterable (e.g. the chunks of a dataset, see cAkDataset.iterate) produced in a
+# background thread, up to depth items ahead of the consumer -- so that reading & decoding (producer) overlap with the
+# processing of the current item (consumer); the bounded queue caps the memory to about depth + 2 items
+# profile is the cProfileReport in which to record the producer time ("prefetch") and the consumer waiting time
+# ("prefetch_wait"), if not None
+# stats is a dictionary to be filled with the pipeline statistics (once the iteration is over), if not None:
+#   produce -- total time spent producing the items, in seconds
+#   consume -- total time spent by the consumer on the items, in seconds
+#   wait -- total time the consumer waited for the items, in seconds
+#   blocked -- total time the producer waited for free room in the queue (back-pressure), in seconds
+#   overlap -- production time hidden behind the consumer, i.e. produce - wait, in seconds
+#   overlap_fraction -- overlap / produce, 1 when the consumer never waits
+#   items -- nr. of items, queue_max -- maximum nr. of items waiting in the queue
+# note: the errors raised while producing the items are raised again in the consumer
+# --> yield the items, in order
+def prefetchIter(
+        iterable,
+        depth = 2,
+        profile = None,
+        stats = None,
+):
+
+    q = queue.Queue(maxsize=max(int(depth), 1))
+    stop = threading.Event()
+    dictStats = {"produce" : 0.0, "consume" : 0.0, "wait" : 0.0, "blocked" : 0.0, "items" : 0, "queue_max" : 0}
+    lsErrors = []
+
+    def producer():
+        try:
+            it = iter(iterable)
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                dictStats["produce"] += time.perf_counter() - t0
+                dictStats["blocked"] += _prefetchPut(q, item, stop)
+        except BaseException as e:
+            lsErrors.append(e)
+        finally:
+            _prefetchPut(q, _prefetchEnd, stop)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            dictStats["queue_max"] = max(dictStats["queue_max"], q.qsize())
+            t0 = time.perf_counter()
+            item = q.get()
+            dictStats["wait"] += time.perf_counter() - t0
+            if item is _prefetchEnd:
+                break
+            dictStats["items"] += 1
+            t0 = time.perf_counter()
+            yield item
+            dictStats["consume"] += time.perf_counter() - t0
+        if len(lsErrors) > 0:
+            raise lsErrors[0]
+    finally:  # also when the consumer stops early: the producer is stopped & the queue emptied
+        stop.set()
+        while thread.is_alive():
+            try:
+                q.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        thread.join()
+
+        dictStats["overlap"] = max(dictStats["produce"] - dictStats["wait"], 0.0)
+        dictStats["overlap_fraction"] = dictStats["overlap"] / dictStats["produce"] if dictStats["produce"] > 0 else 0.0
+        if not (profile is None):
+            profile.add_time("prefetch", dictStats["produce"])
+            profile.add_time("prefetch_wait", dictStats["wait"])
+            _profCount(profile, "prefetch_items", dictStats["items"])
+        if not (stats is None):
+            stats.update(dictStats)
@@ -1,11 +1,15 @@
+import numpy as np
 import pandas as pd
 import awkward as ak
 import uproot
 import time
 import glob
+import os
 from tqdm.auto import tqdm
 
-from .misc import dfReshape, dfMirror, akReshape, akMirror
+from .misc import dfReshape, dfMirror, akTransform, akConcatenate, akToCategorical, akCategoryMask, _akCategoricalFill, _akWithField, dfConcatenate, _dfCategoricalFill
+from .sampling import _descFracClip, _sampleSel, _sampleSelChunk, _sampleApply, _sampleStop, _sampleBudget
+from ..profiling.profile_report import _profTimer, _profCount, _profIter
 
 ########################################################################################################################
 
@@ -19,6 +23,8 @@ def rootToDfMulti(
         mirrorMap = {},
         bVerbose = False,
         bProgress = False,
+        descMode = "strided",
+        descSeed = 0,
 ):
 
     t0 = time.time()  # chronometer start
@@ -27,15 +33,19 @@ def rootToDfMulti(
         names = sorted(glob.glob(nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "*")))  # list of all the filenames of the current run
         if not (iIndex in descFrac.keys()):
             descFrac.update({iIndex: 1})  # all the undefined descaling factors are trivially set to 1
-        descFrac[iIndex] = 1e-12 if descFrac[iIndex] <= 0 else (descFrac[iIndex] if descFrac[iIndex] <= 1 else 1)
+        descFrac[iIndex] = _descFracClip(descFrac[iIndex])
 
         dfTemp = pd.DataFrame()
         if bVerbose:
             print("(%d/%d) %s -- descaling fraction: %14.12f" % (i + 1, len(fileIndex), iIndex, descFrac[iIndex]))
+        lsDfTemp = []
         for iName in tqdm((names)) if (bVerbose & bProgress) else names:  # for each value of iIndex, look for all the corresponding files
             with uproot.open(iName)[treeName] as tree:
-                dfTemp0 = tree.arrays(library="pd")
-            dfTemp = dfTemp.append(dfTemp0[dfTemp0.index % int(1 / descFrac[iIndex]) == 0], ignore_index=True, sort=False)
+                sel = _sampleSel(tree.num_entries, descFrac[iIndex], descMode, descSeed, iName)
+                dfTemp0 = tree.arrays(library="pd", entry_stop=_sampleStop(sel, tree.num_entries))  # only what is needed
+            lsDfTemp.append(_sampleApply(dfTemp0, sel))
+        if len(lsDfTemp) > 0:
+            dfTemp = pd.concat(lsDfTemp, ignore_index=True, sort=False)
 
         # data reshaping: removing the square brackets in the names & remapping all the names according to treeMap
         if len(treeMap)>0:
@@ -58,12 +68,13 @@ def rootToDfMulti(
         if len(fileIndexName)>0:
             if bVerbose:
                 print("%s also added to df" % fileIndexName)
+            # as a categorical column, i.e. integer codes + table of categories
             if not (fileIndexName in dfTemp.columns):
-                dfTemp[fileIndexName] = str(iIndex)
+                dfTemp[fileIndexName] = _dfCategoricalFill(len(dfTemp), iIndex)
             else:
-                dfTemp[fileIndexName] = dfTemp[fileIndexName].astype(str)
+                dfTemp[fileIndexName] = dfTemp[fileIndexName].astype(str).astype("category")
 
-        df = df.append(dfTemp, ignore_index=True, sort=False)
+        df = dfConcatenate((df, dfTemp))
     t1 = time.time()  # chronometer stop
     dt = t1 - t0
     return df, dt
@@ -83,58 +94,85 @@ def rootToAkMulti(
         mirrorMap = {},
         bVerbose = False,
         bProgress = False,
+        profile = None,
+        descMode = "strided",
+        descSeed = 0,
 ):
 
     t0 = time.time()  # chronometer start
     df = ak.Array([])
     for i, iIndex in enumerate(sorted(fileIndex)):
-        names = sorted(glob.glob(nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "*")))  # list of all the filenames of the current run
-        dictFiles = {name : treeName for name in names}
+        with _profTimer(profile, "glob"):
+            names = sorted(glob.glob(nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "*")))  # list of all the filenames of the current run
         if not (iIndex in descFrac.keys()):
             descFrac.update({iIndex: 1})  # all the undefined descaling factors are trivially set to 1
-        descFrac[iIndex] = 1e-12 if descFrac[iIndex] <= 0 else (descFrac[iIndex] if descFrac[iIndex] <= 1 else 1)
+        descFrac[iIndex] = _descFracClip(descFrac[iIndex])
         
         dfTemp = ak.Array([])
         if bVerbose:
             print("(%d/%d) %s -- descaling fraction: %14.12f" % (i + 1, len(fileIndex), iIndex, descFrac[iIndex]))    
-        uprootChain = enumerate(uproot.iterate(dictFiles,
-            expressions=varlist, step_size=chunksize, allow_missing=True,
-        ))
-        for ichunk, chunk in tqdm(uprootChain) if (bVerbose & bProgress) else uprootChain:
-            if ichunk==0:
-                dfTemp = chunk[0:int(len(chunk) * descFrac[iIndex])]
-            else:
-                dfTemp = ak.concatenate((dfTemp, chunk[0:int(len(chunk) * descFrac[iIndex])]))
+        lsChunks = []
+        nEvLeft = nEvMax - len(df)  # read budget, i.e. nr. of events still to be read
+        for iName in tqdm((names)) if (bVerbose & bProgress) else names:
+            if nEvLeft <= 0:  # read budget exhausted, the remaining files are not even opened
+                break
+            try:
+                tree = uproot.open(iName)[treeName]
+            except (OSError, KeyError, ValueError):  # missing files/trees are skipped
+                if bVerbose:
+                    print("cannot open %s in %s, skipping it" % (treeName, iName))
+                continue
+            
+            _profCount(profile, "bytes_read", os.stat(iName).st_size)
+            
+            # the events after the last one to keep (due to sampling or to the read budget) are not even read
+            sel = _sampleBudget(_sampleSel(tree.num_entries, descFrac[iIndex], descMode, descSeed, iName), nEvLeft)
+            # note: reading, decompression & deserialisation all happen while iterating, hence all timed as "read"
+            uprootChain = _profIter(profile, "read", tree.iterate(
+                None if (varlist is None) or (len(varlist)==0) else varlist, step_size=chunksize,
+                entry_stop=_sampleStop(sel, tree.num_entries), report=True,
+            ))
+            for chunk, report in uprootChain:
+                _profCount(profile, "events_read", len(chunk))
+                lsChunks.append(_sampleApply(chunk, _sampleSelChunk(sel, report.tree_entry_start, report.tree_entry_stop)))
+                nEvLeft -= len(lsChunks[-1])
+            tree.file.close()
+        if len(lsChunks) > 0:
+            with _profTimer(profile, "concat"):
+                dfTemp = lsChunks[0] if len(lsChunks) == 1 else ak.concatenate(lsChunks)
 
         # data reshaping: removing the square brackets in the names & remapping all the names according to treeMap
         if len(treeMap)>0:
             if bVerbose:
                 print("remapping some ROOT tree variables (from tree map given)")
-            if len(dfTemp) > 0:
-                dfTemp = akReshape(dfTemp, treeMap, True)
 
         # data mirroring according to mirrorMap, which differs from iLayer to iLayer
         if iIndex in mirrorMap:
             if bVerbose:
                 print("mirroring (from mirror map given) "+str(mirrorMap[iIndex]))
-            if dfTemp.shape[0] > 0:
-                dfTemp = akMirror(dfTemp, mirrorMap[iIndex])
         else:
             if bVerbose:
                 print("no variables to mirror")
+                
+        # both applied at once, the record being rebuilt only once
+        if len(dfTemp) > 0:
+            with _profTimer(profile, "reshape"):
+                dfTemp = akTransform(dfTemp, treeMap, len(treeMap)>0, mirrorMap[iIndex] if iIndex in mirrorMap else ())
 
         # fileIndexName column creation (if requested & not already existing -- after the data reshaping)
         if len(fileIndexName)>0:
             if bVerbose:
                 print("%s also added to df" % fileIndexName)
-            if not (fileIndexName in dfTemp.fields):
-                dfTemp[fileIndexName] = str(iIndex)
-            else:
-                akTemp = ak.to_list(dfTemp[fileIndexName])
-                dfTemp[fileIndexName] = ak.Array([str(ind) for ind in akTemp])
+            if len(dfTemp.fields) > 0:  # as a categorical column, i.e. integer codes + table of levels
+                if not (fileIndexName in dfTemp.fields):
+                    dfTemp = _akWithField(dfTemp, fileIndexName, _akCategoricalFill(len(dfTemp), iIndex))
+                else:
+                    dfTemp = _akWithField(dfTemp, fileIndexName, akToCategorical(dfTemp[fileIndexName]))
 
-        df = ak.concatenate((df, dfTemp))
-        if len(df)>nEvMax:
+        with _profTimer(profile, "concat"):
+            df = akConcatenate((df, dfTemp))
+        _profCount(profile, "bytes_allocated", df.nbytes)
+        if len(df)>=nEvMax:  # read budget exhausted, the remaining filesets are not even globbed
             df = df[:nEvMax]
             if bVerbose:
                 print("event nr. reached nEvMax=%d, breaking" % nEvMax)
@@ -142,3 +180,101 @@ def rootToAkMulti(
     t1 = time.time()  # chronometer stop
     dt = t1 - t0
     return df, dt
+
+########################################################################################################################
+
+# read the events stored in the tree of a single ROOT file after a certain entry, private
+# (used to follow filesets that keep growing, e.g. during data taking)
+# --> return the Awkward Array with the new events and the entry after the last one read
+def _rootToAkFrom(
+        fileName,
+        treeName = "t",
+        varlist = [],
+        entryStart = 0,
+):
+
+    with uproot.open(fileName) as f:
+        tree = f[treeName]
+        entryStop = tree.num_entries
+        if entryStop <= entryStart:
+            return ak.Array([]), entryStart
+        df = tree.arrays(None if (varlist is None) or (len(varlist)==0) else varlist, entry_start=entryStart, entry_stop=entryStop)
+    return df, entryStop
+
+########################################################################################################################
+
+# get the nr. of entries in the tree of a single ROOT file, private
+def _rootNumEntries(
+        fileName,
+        treeName = "t",
+):
+
+    with uproot.open(fileName) as f:
+        return f[treeName].num_entries
+
+########################################################################################################################
+
+# select the fields of an Awkward Array of records that can be written to a ROOT tree (via uproot), i.e. all but the
+# string & categorical ones (e.g. the fileIndexName variable, implied by the output file name), private
+# --> return the list of field names
+def _rootWritableFields(df, varlist=[]):
+    fields = df.fields if (varlist is None) or (len(varlist)==0) else list(varlist)
+    return [s for s in fields if not (df[s].layout.parameter("__array__") in ("string", "categorical"))]
+
+########################################################################################################################
+
+# write an Awkward Array of records to the tree of a set of ROOT files following the XXXXXX/YYYYYY naming
+# nameFormat is the output file name format: XXXXXX is replaced with each fileset ID in fileIndex (the events being
+# split according to their fileIndexName variable, if existing -- otherwise all of them are in each fileset) and
+# YYYYYY with the file nr. (6 digits), each file containing up to nEvPerFile events (all of them if None)
+# chunksize is the nr. of events per basket: the events are converted & written one chunk at a time (via uproot
+# extend), i.e. with the memory needed for a single chunk on top of the input array, whatever the nr. of events
+# compression is the uproot compression algorithm (e.g. "ZLIB", "LZ4", "ZSTD", "LZMA", None for no compression) and
+# compressionLevel its level
+# varlist is the list of fields to be written, all of them if empty -- strings & categorical fields are skipped
+# note: each file is written to a temporary file first, so that an interrupted writing never leaves a corrupted file
+# --> return the list of the files written
+def akToRootMulti(
+        df,
+        nameFormat,
+        fileIndex,
+        treeName = "t",
+        fileIndexName = "iIndex",
+        chunksize = 100000,
+        nEvPerFile = None,
+        varlist = [],
+        compression = "ZLIB",
+        compressionLevel = 1,
+        bVerbose = False,
+        profile = None,
+):
+
+    fields = _rootWritableFields(df, varlist)
+    dfOut = df[fields]  # a view, no copy
+    compressionObj = None if compression is None else getattr(uproot, compression)(compressionLevel)
+    chunksize = int(chunksize)
+    lsNames = []
+    for iIndex in (sorted(fileIndex) if "XXXXXX" in nameFormat else [""]):
+        # the fileset events are only addressed via their indices, no copy of the fileset being made
+        if ("XXXXXX" in nameFormat) & (len(fileIndexName) > 0) & (fileIndexName in df.fields):
+            indices = np.flatnonzero(akCategoryMask(df[fileIndexName], iIndex))
+        else:
+            indices = np.arange(len(df))
+        if len(indices) == 0:
+            continue
+        nEvFile = len(indices) if nEvPerFile is None else int(nEvPerFile)
+        for iFile, iEv0 in enumerate(range(0, len(indices), nEvFile)):
+            name = nameFormat.replace("XXXXXX", iIndex).replace("YYYYYY", "%06d" % iFile)
+            indicesFile = indices[iEv0:iEv0+nEvFile]
+            with uproot.recreate(name + ".tmp", compression=compressionObj) as f:
+                f.mktree(treeName, {s : df[s].type.content for s in fields})
+                for iChunk in range(0, len(indicesFile), chunksize):
+                    with _profTimer(profile, "write"):
+                        chunk = dfOut[indicesFile[iChunk:iChunk+chunksize]]
+                        f[treeName].extend({s : chunk[s] for s in fields})
+            os.replace(name + ".tmp", name)
+            _profCount(profile, "bytes_written", os.stat(name).st_size)
+            lsNames.append(name)
+            if bVerbose:
+                print("%s: %d events written" % (name, len(indicesFile)))
+    return lsNames
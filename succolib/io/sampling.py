@@ -0,0 +1,83 @@
+import numpy as np
+import os
+import zlib
+
+########################################################################################################################
+
+# event sampling (i.e. descaling) shared by all the input functions, private
+# descFrac is the fraction of events to keep, descMode the sampling mode:
+# - "strided": 1 event every int(1/descFrac), starting from the first one
+# - "random": round(nEv*descFrac) events randomly chosen (without repetitions, in their original order), the choice
+#   depending only on descSeed and on the file name (without path & extension), hence reproducible across formats
+# - "prefix": the first int(nEv*descFrac) events
+# all the modes only depend on the file content, not e.g. on the chunk size used to read it
+
+descModes = ("strided", "random", "prefix")
+
+# --> return descFrac clipped to ]0, 1], as done in the input functions since ever
+def _descFracClip(descFrac):
+    return 1e-12 if descFrac <= 0 else (descFrac if descFrac <= 1 else 1)
+
+########################################################################################################################
+
+# select the events to keep out of the nEv events of a file, private
+# fileName is only used (as a random seed component) in the "random" mode
+# --> return the selection, either a slice (strided & prefix, i.e. views) or a sorted array of indices (random)
+def _sampleSel(nEv, descFrac, descMode="strided", descSeed=0, fileName=""):
+    descFrac = _descFracClip(descFrac)
+    if descFrac >= 1:
+        return slice(0, nEv)
+    if descMode == "strided":
+        return slice(0, nEv, int(1 / descFrac))
+    elif descMode == "prefix":
+        return slice(0, int(nEv * descFrac))
+    elif descMode == "random":
+        fileKey = os.path.splitext(os.path.basename(str(fileName)))[0]
+        rng = np.random.default_rng([int(descSeed), zlib.crc32(fileKey.encode())])
+        return np.sort(rng.choice(nEv, size=int(round(nEv * descFrac)), replace=False))
+    else:
+        raise ValueError("unknown descaling mode %s, use one among %s" % (descMode, str(descModes)))
+
+########################################################################################################################
+
+# restrict a selection (from _sampleSel) to the events between iStart (included) and iStop (excluded), e.g. to a chunk
+# of a file being read chunk by chunk, private
+# --> return the selection, with indices relative to iStart
+def _sampleSelChunk(sel, iStart, iStop):
+    if isinstance(sel, slice):
+        step = 1 if sel.step is None else sel.step
+        iFirst = max(sel.start, iStart)
+        iFirst += (sel.start - iFirst) % step  # first selected index in the chunk
+        return slice(iFirst - iStart, max(min(sel.stop, iStop) - iStart, iFirst - iStart), step)
+    else:
+        return sel[np.searchsorted(sel, iStart):np.searchsorted(sel, iStop)] - iStart
+
+########################################################################################################################
+
+# apply a selection (from _sampleSel) to an array, DataFrame, Awkward Array or list, private
+# --> return the selected events (views of the original ones for slices)
+def _sampleApply(data, sel):
+    if isinstance(data, list) & (not isinstance(sel, slice)):
+        return [data[i] for i in sel]
+    return data.iloc[sel] if hasattr(data, "iloc") else data[sel]
+
+########################################################################################################################
+
+# --> return the nr. of events actually needed from the file start, i.e. the read limit to push down to the readers
+def _sampleStop(sel, nEv):
+    if isinstance(sel, slice):
+        return min(sel.stop, nEv)
+    else:
+        return int(sel[-1]) + 1 if len(sel) > 0 else 0
+
+########################################################################################################################
+
+# restrict a selection (from _sampleSel) to its first nEvBudget events, i.e. apply the nEvMax read budget, private
+# --> return the selection
+def _sampleBudget(sel, nEvBudget):
+    nEvBudget = max(int(nEvBudget), 0)
+    if isinstance(sel, slice):
+        step = 1 if sel.step is None else sel.step
+        return slice(sel.start, min(sel.stop, sel.start + nEvBudget * step), step)
+    else:
+        return sel[:nEvBudget]
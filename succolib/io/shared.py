@@ -0,0 +1,159 @@
+import numpy as np
+import awkward as ak
+import multiprocessing
+import weakref
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+########################################################################################################################
+
+# Awkward Arrays in shared memory: all the buffers of the array in a single multiprocessing.shared_memory segment,
+# described by a lightweight (picklable) descriptor, i.e. a dictionary with
+#   name -- the segment name
+#   form -- the Awkward form (JSON) of the array, length -- its length
+#   buffers -- { buffer key : (offset in the segment, dtype, nr. of items) }
+# any process can then attach to the segment & rebuild the array as views of it, with no copy nor serialisation
+
+_sharedAlign = 64  # alignment of the buffers in the segment, in bytes
+
+_sharedAttached = {}  # segments attached to in the current process, { name : SharedMemory }, private
+_sharedCreated = set()  # names of the segments created in the current process, private
+
+########################################################################################################################
+
+# release a shared memory segment, private (also called at exit, for the segments created in the process)
+# bUnlink is a boolean: if True the segment is also destroyed (by its creator), otherwise only detached
+def _sharedRelease(shm, bUnlink):
+    try:
+        shm.close()
+    except BufferError:  # views still in use in this process, the mapping is released when they are
+        pass
+    if bUnlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:  # already destroyed
+            pass
+
+########################################################################################################################
+
+# copy an Awkward Array into a new shared memory segment
+# --> return the descriptor (see above) & the SharedMemory object, which owns the segment: the segment is destroyed
+# with sharedRelease(descriptor, shm, bUnlink=True), or at exit at the latest
+def akToShared(
+        df,
+):
+
+    form, length, container = ak.to_buffers(ak.to_packed(df))
+    dictBuffers = {}
+    nbytes = 0
+    for key in container:
+        buffer = np.ascontiguousarray(container[key])
+        nbytes = ((nbytes + _sharedAlign - 1) // _sharedAlign) * _sharedAlign
+        dictBuffers[key] = (nbytes, buffer.dtype.str, buffer.size)
+        nbytes += buffer.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    _sharedCreated.add(shm.name)
+    for key in container:
+        offset, dtype, n = dictBuffers[key]
+        np.ndarray(n, dtype=dtype, buffer=shm.buf, offset=offset)[:] = np.ascontiguousarray(container[key]).reshape(-1)
+    weakref.finalize(shm, _sharedRelease, shm, True)
+    descriptor = {"name" : shm.name, "form" : form.to_json(), "length" : length, "buffers" : dictBuffers}
+    return descriptor, shm
+
+########################################################################################################################
+
+# attach to a shared memory segment created by another process, private
+# note: the segment must not be destroyed by the resource tracker of this process at exit -- child processes (e.g.
+# pool workers) share the tracker of their parent, in which the segment is registered already, whereas independent
+# processes have their own tracker, from which the segment is unregistered -- unless they created it, the tracker
+# then being the one destroying it at exit if not released before
+def _sharedAttach(name):
+    if name in _sharedAttached:
+        return _sharedAttached[name]
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if (multiprocessing.parent_process() is None) and not (name in _sharedCreated):
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+    _sharedAttached[name] = shm
+    return shm
+
+########################################################################################################################
+
+# rebuild an Awkward Array from its shared memory descriptor (from akToShared) in another process, as views of the
+# segment -- i.e. with no copy (the segment stays attached to until sharedRelease(descriptor) is called in the process)
+# --> return the Awkward Array
+def sharedToAk(
+        descriptor,
+):
+
+    return _sharedViews(descriptor, _sharedAttach(descriptor["name"]))
+
+########################################################################################################################
+
+# rebuild an Awkward Array from its shared memory descriptor & segment, private
+def _sharedViews(descriptor, shm):
+    container = {
+        key : np.ndarray(n, dtype=dtype, buffer=shm.buf, offset=offset)
+        for (key, (offset, dtype, n)) in descriptor["buffers"].items()
+    }
+    return ak.from_buffers(ak.forms.from_json(descriptor["form"]), descriptor["length"], container, highlevel=True)
+
+########################################################################################################################
+
+# release a shared memory segment from its descriptor: detach from it (in the processes which attached to it) or
+# destroy it (in the process which created it, with bUnlink=True) -- the arrays rebuilt from it must not be used after
+def sharedRelease(
+        descriptor,
+        shm = None,
+        bUnlink = False,
+):
+
+    if shm is None:
+        shm = _sharedAttached.pop(descriptor["name"], None)
+    if not (shm is None):
+        _sharedRelease(shm, bUnlink)
+
+########################################################################################################################
+
+# process pool initialiser: attach to the shared dataset once per worker process, private
+def _init_worker_shared(descriptor):
+    import matplotlib
+    matplotlib.use("Agg")
+    global _sharedDataset
+    from .datasets import cAkDataset
+    _sharedDataset = cAkDataset.from_shared(descriptor)
+
+########################################################################################################################
+
+# execute a function on the shared dataset, private (executed in the worker processes)
+def _shared_worker(func, args):
+    return func(_sharedDataset, *args)
+
+########################################################################################################################
+
+# run a function on a dataset in shared memory in a pool of processes, once per set of arguments -- e.g. the
+# per-channel or per-event-range calculations of a collection -- each worker process attaching to the dataset (with
+# no copy) only once
+# func is the top-level function (for pickling), called as func(dataset, *args)
+# descriptor is the descriptor of the shared dataset (from cAkDataset.to_shared)
+# lsArgs is the list of the argument tuples, nproc the nr. of worker processes (if None the nr. of CPUs)
+# --> return the list of the function outputs, in the order of lsArgs
+def sharedMap(
+        func,
+        descriptor,
+        lsArgs,
+        nproc = None,
+):
+
+    with ProcessPoolExecutor(
+        max_workers=nproc, mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker_shared, initargs=(descriptor,),
+    ) as executor:
+        futures = [executor.submit(_shared_worker, func, tuple(args)) for args in lsArgs]
+        return [future.result() for future in futures]
@@ -0,0 +1,23 @@
+import importlib
+
+########################################################################################################################
+
+# lazy loading of the package objects (PEP 562), to be used in the module-level __getattr__ of the (sub)packages
+# the module defining an object, and all its dependencies (e.g. matplotlib, uproot), are only imported the first
+# time the object is accessed -- then the object is stored in the (sub)package namespace, not to be looked up again
+# packageName is the (sub)package __name__, packageGlobals its globals()
+# lazyMap is a dictionary { object name : module name (relative to the (sub)package) }
+# --> return the requested object
+def _lazyGetattr(packageName, packageGlobals, lazyMap, name):
+    if name in lazyMap:
+        obj = getattr(importlib.import_module("." + lazyMap[name], packageName), name)
+        packageGlobals[name] = obj
+        return obj
+    raise AttributeError("module %s has no attribute %s" % (packageName, name))
+
+########################################################################################################################
+
+# list the (sub)package namespace, including the objects not imported yet, to be used in the module-level __dir__
+# --> return the sorted list of names
+def _lazyDir(packageGlobals, lazyMap):
+    return sorted(set(packageGlobals.keys()) | set(lazyMap.keys()))
@@ -1,4 +1,17 @@
-from .gaussian import fGaus
-from .landau import fLandau, fLandauMirror
-from .mcs import fMCS
-from .gamma import fGammaAbsExp
+from ..lazy import _lazyGetattr, _lazyDir
+
+# objects of the subpackage, imported only when first accessed (see lazy.py)
+_lazyMap = {
+    "fGaus" : "gaussian",
+    "fLandau" : "landau",
+    "fLandauMirror" : "landau",
+    "fMCS" : "mcs",
+    "fGammaAbsExp" : "gamma",
+}
+__all__ = list(_lazyMap.keys())
+
+def __getattr__(name):
+    return _lazyGetattr(__name__, globals(), _lazyMap, name)
+
+def __dir__():
+    return _lazyDir(globals(), _lazyMap)
@@ -0,0 +1,13 @@
+from ..lazy import _lazyGetattr, _lazyDir
+
+# objects of the subpackage, imported only when first accessed (see lazy.py)
+_lazyMap = {
+    "cProfileReport" : "profile_report",
+}
+__all__ = list(_lazyMap.keys())
+
+def __getattr__(name):
+    return _lazyGetattr(__name__, globals(), _lazyMap, name)
+
+def __dir__():
+    return _lazyDir(globals(), _lazyMap)
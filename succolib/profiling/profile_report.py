@@ -0,0 +1,136 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+########################################################################################################################
+
+class cProfileReport:
+    # per-stage timing & counters of the data input and analysis steps, e.g. glob, read, decompress, parse, reshape,
+    # mirror, concat, compute, histogram, fit, render (stages) and bytes read, events read/processed, bytes allocated
+    # (counters) -- the stage & counter names are free, the ones above being those filled by succolib itself
+    def __init__(
+        self,
+        name = "",
+        hooks = [],
+    ):
+
+        # attributes set via input:
+
+        self.name = name
+        self.hooks = list(hooks)  # functions called on each new record as func(kind, key, value), kind = "time" or "count"
+
+        # calculated attributes:
+
+        self.stages = {}  # { stage : {"time" : total time in seconds, "calls" : nr. of calls} }
+        self.counters = {}  # { counter : total value }
+
+    # add a function to forward the records to (e.g. to an external monitoring)
+    def add_hook(self, func):
+        self.hooks.append(func)
+
+    # call all the hooks, private
+    def __call_hooks(self, kind, key, value):
+        for func in self.hooks:
+            func(kind, key, value)
+
+    # context manager timing a stage, to be used as "with profile.timer(stage):"
+    @contextmanager
+    def timer(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(stage, time.perf_counter() - t0)
+
+    # add a time interval (in seconds) to a stage
+    def add_time(self, stage, dt):
+        if not (stage in self.stages):
+            self.stages[stage] = {"time" : 0.0, "calls" : 0}
+        self.stages[stage]["time"] += dt
+        self.stages[stage]["calls"] += 1
+        self.__call_hooks("time", stage, dt)
+
+    # increase a counter
+    def count(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+        self.__call_hooks("count", counter, value)
+
+    # --> return the total time (in seconds) spent in a stage, 0 if never recorded
+    def get_time(self, stage):
+        return self.stages[stage]["time"] if stage in self.stages else 0.0
+
+    # --> return the nr. of times a stage has been recorded
+    def get_calls(self, stage):
+        return self.stages[stage]["calls"] if stage in self.stages else 0
+
+    # --> return the value of a counter, 0 if never recorded
+    def get_counter(self, counter):
+        return self.counters.get(counter, 0)
+
+    # add the records of another report to this one (e.g. from a parallel job) --> return the instance
+    def merge(self, other):
+        for stage in other.stages:
+            if not (stage in self.stages):
+                self.stages[stage] = {"time" : 0.0, "calls" : 0}
+            self.stages[stage]["time"] += other.stages[stage]["time"]
+            self.stages[stage]["calls"] += other.stages[stage]["calls"]
+        for counter in other.counters:
+            self.counters[counter] = self.counters.get(counter, 0) + other.counters[counter]
+        return self
+
+    # clear all the records
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+
+    # --> return a dictionary with all the records, e.g. to be dumped to JSON
+    def to_dict(self):
+        return {
+            "name" : self.name,
+            "stages" : {stage : dict(self.stages[stage]) for stage in self.stages},
+            "counters" : dict(self.counters),
+        }
+
+    # print a summary table, stages sorted by total time
+    def print_summary(self):
+        ttot = sum(self.stages[stage]["time"] for stage in self.stages)
+        print("profile report %s" % self.name)
+        for stage in sorted(self.stages, key=lambda s: -self.stages[s]["time"]):
+            print("  %-16s %10.4f s %6.1f%% %8d calls" % (
+                stage, self.stages[stage]["time"],
+                100 * self.stages[stage]["time"] / ttot if ttot > 0 else 0, self.stages[stage]["calls"],
+            ))
+        for counter in sorted(self.counters):
+            print("  %-16s %14g" % (counter, self.counters[counter]))
+
+########################################################################################################################
+
+# time a stage if a profile report is given, do nothing otherwise, private
+# --> return the context manager
+def _profTimer(profile, stage):
+    return nullcontext() if profile is None else profile.timer(stage)
+
+########################################################################################################################
+
+# increase a counter if a profile report is given, do nothing otherwise, private
+def _profCount(profile, counter, value=1):
+    if not (profile is None):
+        profile.count(counter, value)
+
+########################################################################################################################
+
+# wrap an iterable so that the time spent producing each item is added to a stage, if a profile report is given
+# (e.g. for lazy readers, like uproot.iterate, whose reading happens while iterating), private
+# --> return the (wrapped) iterable
+def _profIter(profile, stage, iterable):
+    if profile is None:
+        return iterable
+    def iter_timed():
+        it = iter(iterable)
+        while True:
+            with profile.timer(stage):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+    return iter_timed()
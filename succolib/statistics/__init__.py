@@ -1,3 +1,24 @@
-from .profile import hist2dToProfile
-from .smearing import eventSmear
-from .collections import cCollection, cTracksCollection, cWaveFormsCollection
+from ..lazy import _lazyGetattr, _lazyDir
+
+# objects of the subpackage, imported only when first accessed (see lazy.py)
+_lazyMap = {
+    "hist2dToProfile" : "profile",
+    "eventSmear" : "smearing",
+    "cCollection" : "collections",
+    "cTracksCollection" : "collections",
+    "cWaveFormsCollection" : "collections",
+    "effClopperPearson" : "efficiency",
+    "effWilson" : "efficiency",
+    "cReport" : "reports",
+    "cRunDriver" : "runs",
+    "histsSave" : "hists_io",
+    "histsLoad" : "hists_io",
+    "histsMerge" : "hists_io",
+}
+__all__ = list(_lazyMap.keys())
+
+def __getattr__(name):
+    return _lazyGetattr(__name__, globals(), _lazyMap, name)
+
+def __dir__():
+    return _lazyDir(globals(), _lazyMap)
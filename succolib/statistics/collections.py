@@ -1,19 +1,67 @@
 from matplotlib.colors import LogNorm
+from matplotlib.collections import LineCollection
 import matplotlib.pyplot as plt
 import numpy as np
 from scipy.optimize import curve_fit
 import awkward as ak
-from copy import deepcopy
+from copy import copy, deepcopy
+import hashlib
+
+from ..profiling.profile_report import cProfileReport, _profTimer, _profCount
+from ..math_tools.gaussian import fGaus
+from ..math_tools.landau import fLandau
+from ..tracking.straight_2d import cTrack
+from ..waveforms.wf_analysis_base import cWaveForm
+from ..waveforms.wf_persistence import cWfPersistenceMap
+from ..waveforms.wf_compact import cWfCompact, _wfCompactDtype
+from ..io.cuts import _cutWindow
 
 ########################################################################################################################
 
 class cCollection:
     # note: this is just a dependency for actual event collections
     def __init__(self):
-        sl = __import__(__name__)
-        self.fGaus = getattr(sl, "fGaus")
-        self.fLandau = getattr(sl, "fLandau")
-        pass
+        self.fGaus = fGaus
+        self.fLandau = fLandau
+    
+    # create a lightweight copy of the collection, without dataset and event-by-event output, protected
+    # (e.g. to render plots from precomputed histograms in other processes)
+    # --> return the copy
+    def _copy_for_rendering(self):
+        collection_new = copy(self)
+        collection_new.dataset = None
+        collection_new.profile = None  # hooks might not be picklable
+        return collection_new
+    
+    # turn a cut expression (see cAkDataset.mask) into the array of booleans, protected -- any other boolean is
+    # returned as it is
+    def _boolean(self, boolean):
+        return self.dataset.mask(boolean)
+    
+    # apply a boolean to an event array (no selection if the boolean is a scalar, as in cut_copy), protected
+    # --> return the selected events
+    def _apply_boolean(self, data, boolean):
+        boolean = self._boolean(boolean)
+        return data if np.isscalar(boolean) else data[boolean]
+    
+    # run the collection calculations (full_calculations_output) on another dataset, e.g. the new events found by
+    # cAkDataset.update() (see cAkDataset.add_watch_collection), adding the output variables to it
+    # dataset_new is the dataset to process
+    # dict_attrs = { attribute : value, or function of dataset_new } with the event-by-event inputs of the collection
+    # to be replaced for dataset_new, e.g. x0 & y0 for the tracks collection
+    # note: the collection is restored afterwards, except for its event-by-event output, which refers to dataset_new
+    def update_output(self, dataset_new, dict_attrs={}):
+        dict_old = {s : getattr(self, s) for s in dict_attrs}
+        dataset_old = self.dataset
+        try:
+            self.dataset = dataset_new
+            for s in dict_attrs:
+                setattr(self, s, dict_attrs[s](dataset_new) if callable(dict_attrs[s]) else dict_attrs[s])
+            self.full_calculations_output()
+        finally:
+            self.dataset = dataset_old
+            for s in dict_old:
+                setattr(self, s, dict_old[s])
     
     # tool to turn a (M*N)-dimensional array into (N*M), protected
     # array_mn is the original (M*N) array
@@ -34,14 +82,16 @@ class cCollection:
     ):
         # * if an entire variable array is given, the loaded dataset is overridden
         
-        dataset_temp = self.dataset.cut_copy(boolean)
-        nevs = dataset_temp.shape[0]
-        hist0 = np.histogram(
-            np.array(dataset_temp.data[var]) if\
-                np.isscalar(var) else\
-                (np.array(var) if np.isscalar(boolean) else np.array(var[boolean])),
-            bins=bins, range=range, density=density, weights=weights,
-        )
+        with _profTimer(self.profile, "histogram"):
+            boolean = self._boolean(boolean)
+            dataset_temp = self.dataset.cut_copy(boolean)
+            nevs = dataset_temp.shape[0]
+            hist0 = np.histogram(
+                np.array(dataset_temp[var]) if\
+                    np.isscalar(var) else\
+                    (np.array(var) if np.isscalar(boolean) else np.array(var[boolean])),
+                bins=bins, range=range, density=density, weights=weights,
+            )
         
         hist = [
             hist0[1][:-1] + 0.5 * (hist0[1][1]-hist0[1][0]),
@@ -68,17 +118,19 @@ class cCollection:
             if ((range[0] is None) & (range[1] is None)):
                 range=None
         
-        dataset_temp = self.dataset.cut_copy(boolean)
-        nevs = dataset_temp.shape[0]
-        hist0 = np.histogram2d(
-            np.array(dataset_temp.data[varx]) if\
-                np.isscalar(varx) else\
-                (np.array(varx) if np.isscalar(boolean) else np.array(varx[boolean])),
-            np.array(dataset_temp.data[vary]) if\
-                np.isscalar(vary) else\
-                (np.array(vary) if np.isscalar(boolean) else np.array(vary[boolean])),
-            bins=bins, range=range, density=density, weights=weights,
-        )
+        with _profTimer(self.profile, "histogram"):
+            boolean = self._boolean(boolean)
+            dataset_temp = self.dataset.cut_copy(boolean)
+            nevs = dataset_temp.shape[0]
+            hist0 = np.histogram2d(
+                np.array(dataset_temp[varx]) if\
+                    np.isscalar(varx) else\
+                    (np.array(varx) if np.isscalar(boolean) else np.array(varx[boolean])),
+                np.array(dataset_temp[vary]) if\
+                    np.isscalar(vary) else\
+                    (np.array(vary) if np.isscalar(boolean) else np.array(vary[boolean])),
+                bins=bins, range=range, density=density, weights=weights,
+            )
         
         hist = [
             hist0[1][:-1] + 0.5 * (hist0[1][1]-hist0[1][0]),
@@ -146,14 +198,15 @@ class cCollection:
         )
         
         fit_ok = False
-        try:
-            fit_par, _ = curve_fit(
-                fit_func, hist[0], hist[1], p0=fit_par0, bounds=((0, -np.inf, 0), np.inf)
-            )
-            fit_ok = True
-        except:
-            fit_par = fit_par0
-            fit_ok = False
+        with _profTimer(self.profile, "fit"):
+            try:
+                fit_par, _ = curve_fit(
+                    fit_func, hist[0], hist[1], p0=fit_par0, bounds=((0, -np.inf, 0), np.inf)
+                )
+                fit_ok = True
+            except:
+                fit_par = fit_par0
+                fit_ok = False
         
         fit_plot_x = np.linspace(hist[0][0], hist[0][-1], 1000)
         fit_plot_y = fit_func(fit_plot_x, *fit_par)
@@ -190,14 +243,15 @@ class cCollection:
         )
         
         fit_ok = False
-        try:
-            fit_par, _ = curve_fit(
-                fit_func, hist[0], hist[1], p0=fit_par0
-            )
-            fit_ok = True
-        except:
-            fit_par = fit_par0
-            fit_ok = False
+        with _profTimer(self.profile, "fit"):
+            try:
+                fit_par, _ = curve_fit(
+                    fit_func, hist[0], hist[1], p0=fit_par0
+                )
+                fit_ok = True
+            except:
+                fit_par = fit_par0
+                fit_ok = False
             
         fit_plot_x = np.linspace(hist[0][0], hist[0][-1], 1000)
         fit_plot_y = fit_func(fit_plot_x, *fit_par)
@@ -213,11 +267,12 @@ class cCollection:
     
     # sum all the histograms of an array of collections into a single output collection, static
     # ls_in_hists_collections is the input array, it should contain at least 1 collection
+    # note: the bin centres are copied from the first input collection, the counts computed anew (no deep copy)
     # --> returns the output collection
     @staticmethod
     def sum_hists_collections(ls_in_hists_collections):
         if len(ls_in_hists_collections)>0:
-            out_hists_collection = deepcopy(ls_in_hists_collections[0])
+            out_hists_collection = {}
             for key in ls_in_hists_collections[0].keys():
                 if "hist_" in key:
                     ind_y = 1
@@ -225,6 +280,9 @@ class cCollection:
                 elif "hist2d_" in key:
                     ind_y = 2
                     ind_nevs = 3
+                out_hists_collection[key] = [
+                    np.copy(v) for v in ls_in_hists_collections[0][key][:ind_y]
+                ] + [None, None]
                 out_hists_collection[key][ind_y] =\
                     np.sum([ls_in_hists_collections[bunch][key][ind_y]\
                     for bunch in range(len(ls_in_hists_collections))], axis=0)
@@ -247,12 +305,12 @@ class cTracksCollection(cCollection):
     ):
         super().__init__()
 
-        sl = __import__(__name__)
-        self.cTrack = getattr(sl, "cTrack")
+        self.cTrack = cTrack
         
         # attributes set via input:
         
         self.dataset = dataset
+        self.profile = dataset.profile if hasattr(dataset, "profile") else cProfileReport("collection")  # shared
         self.x0 = x0
         self.y0 = y0
         
@@ -284,8 +342,17 @@ class cTracksCollection(cCollection):
         self.__dictTrackParams_before = deepcopy(self.dictTrackParams)
                 
         self.__hists_collection_latest = {}
+        self.__output_vars = {}  # output variables to be added to the dataset, see the output wrappers
                 
         self.__outfig_dpi = 200
+        
+    # create a lightweight copy of the collection, without dataset and event-by-event output, protected
+    # --> return the copy
+    def _copy_for_rendering(self):
+        collection_new = super()._copy_for_rendering()
+        collection_new.__output_collection = {}
+        collection_new.__hists_collection_latest = {}
+        return collection_new
     
     # create the 1d beam profile and 2d beam spot histograms at a single long. point of the track
     # name is a string with the two variables in hists_collection to use - replace x/y with *
@@ -330,18 +397,19 @@ class cTracksCollection(cCollection):
         return hists_collection_temp
         
     # wrappers for output fiels in the dataset, private - x4
+    # (the output variables are collected in __output_vars & added to the dataset all at once)
     # outds_var is the output dataset field name, string
     # outcol_var_x is the name of the horizontal component in hists_collection, string
     # outcol_var_y is the name of the vertical component in hists_collection, string
     def __output_dataset_wrapper_x4_4(self, outds_var, outcol_var_x, outcol_var_y):
-        self.dataset.add_vars({outds_var : np.array([
+        self.__output_vars.update({outds_var : np.array([
                 self._array_transpose(self.__output_collection[outcol_var_x])[0],
                 self._array_transpose(self.__output_collection[outcol_var_y])[0],
                 self._array_transpose(self.__output_collection[outcol_var_x])[1],
                 self._array_transpose(self.__output_collection[outcol_var_y])[1]
             ]).T})
     def __output_dataset_wrapper_x4_2(self, outds_var, outcol_var_x, outcol_var_y):
-        self.dataset.add_vars({outds_var : np.array([
+        self.__output_vars.update({outds_var : np.array([
                 self.__output_collection[outcol_var_x],
                 self.__output_collection[outcol_var_y],
             ]).T})
@@ -350,11 +418,11 @@ class cTracksCollection(cCollection):
     # outds_var is the output dataset field name, string
     # outcol_var is the corresponding name in hists_collection, string
     def __output_dataset_wrapper_x2y2_2(self, outds_var, outcol_var):
-        self.dataset.add_vars(
+        self.__output_vars.update(
             {outds_var : np.array(self.__output_collection[outcol_var])}
         )
     def __output_dataset_wrapper_x2y2_1(self, outds_var, outcol_var):
-        self.dataset.add_vars(
+        self.__output_vars.update(
             {outds_var : self.__output_collection[outcol_var]}
         )
         
@@ -366,7 +434,7 @@ class cTracksCollection(cCollection):
         if outcol_index==None:
             self.__output_dataset_wrapper_x2y2_1(outds_var, outcol_var)
         else:
-            self.dataset.add_vars(
+            self.__output_vars.update(
                 {outds_var : np.array(self.__output_collection[outcol_var]).T[outcol_index]}
             )
             
@@ -442,22 +510,25 @@ class cTracksCollection(cCollection):
         
     # process all the tracks and add results to the dataset
     def full_calculations_output(self):                    
-        for iev_data, ev_data in enumerate(self.dataset.data):
-            if self.bVerbose:
-                if iev_data%1000==0: print("doing event #%d" % (iev_data))
+        with _profTimer(self.profile, "compute"):
+            for iev_data, ev_data in enumerate(self.dataset.data):
+                if self.bVerbose:
+                    if iev_data%1000==0: print("doing event #%d" % (iev_data))
 
-            track_temp = self.cTrack(
-                self.x0[iev_data], self.y0[iev_data], **self.dictTrackParams
-            )
-            track_temp.full_analysis()
+                track_temp = self.cTrack(
+                    self.x0[iev_data], self.y0[iev_data], **self.dictTrackParams
+                )
+                track_temp.full_analysis()
 
-            for out_var in self.__output_collection:
-                attr_temp = track_temp.__getattribute__(out_var)
-                if iev_data==0:
-                    self.__output_collection[out_var] = [attr_temp]
-                else:
-                    self.__output_collection[out_var] += [attr_temp]
+                for out_var in self.__output_collection:
+                    attr_temp = track_temp.__getattribute__(out_var)
+                    if iev_data==0:
+                        self.__output_collection[out_var] = [attr_temp]
+                    else:
+                        self.__output_collection[out_var] += [attr_temp]
+        _profCount(self.profile, "events_processed", len(self.dataset.data))
                     
+        self.__output_vars = {}
         if self.outtype=="x4":
             self.__output_dataset_wrapper_x4_4("xRawMirrored", "x0", "y0")
             self.__output_dataset_wrapper_x4_4("x", "x", "y")
@@ -500,6 +571,9 @@ class cTracksCollection(cCollection):
                 self.__output_dataset_wrapper_x1x1y1y1("yRaw"+hitproj, "y"+hitproj+"0", None)
                 self.__output_dataset_wrapper_x1x1y1y1("x"+hitproj, "x"+hitproj, None)
                 self.__output_dataset_wrapper_x1x1y1y1("y"+hitproj, "y"+hitproj, None)
+        
+        self.dataset.add_vars(self.__output_vars)
+        self.__output_vars = {}
                     
     # create all the main (e.g. beam profiles and angles) histograms
     # --> return a dictionary with the histogram collection
@@ -750,22 +824,28 @@ class cWaveFormsCollection(cCollection):
         dictWfParams,
         bVerbose = False,
         bOutWfs = False,
+        bOutWfsCompact = False,
     ):
         super().__init__()
 
-        sl = __import__(__name__)
-        self.cWaveForm = getattr(sl, "cWaveForm")
+        self.cWaveForm = cWaveForm
+        self.cWfPersistenceMap = cWfPersistenceMap
+        self.cWfCompact = cWfCompact
         
         # attributes set via input:
         
         self.dataset = dataset
+        self.profile = dataset.profile if hasattr(dataset, "profile") else cProfileReport("collection")  # shared
         self.varlist = varlist
         self.dictWfParams = dictWfParams
         self.bVerbose = bVerbose
         self.bOutWfs = bOutWfs
+        self.bOutWfsCompact = bOutWfsCompact  # if True, the output waveforms are stored as raw samples (see cWfCompact)
         
         # calculated attributes:
         
+        self.wfs_x = {}  # { channel : time axis } of the output waveforms, compact storage only (see _get_wfs_x)
+        
         self.__output_collection = {}
         for var in self.varlist:
             self.__output_collection.update({var : {
@@ -776,37 +856,102 @@ class cWaveFormsCollection(cCollection):
                 "charge" : [],
                 "snr" : [],
             }})
-            if self.bOutWfs:
+            if self.bOutWfs & (not self.bOutWfsCompact):
                 self.__output_collection[var].update({
                     "x" : [],
                     "y" : [],
                 })
                 
         self.__hists_collection_latest = {}
+        self.__persistence_cache = {}
                 
         self.__outfig_dpi = 200
         
+    # create a lightweight copy of the collection, without dataset and event-by-event output, protected
+    # --> return the copy
+    def _copy_for_rendering(self):
+        collection_new = super()._copy_for_rendering()
+        collection_new.__output_collection = {}
+        collection_new.__hists_collection_latest = {}
+        collection_new.__persistence_cache = {}
+        return collection_new
+        
     # process all the waveforms and add results to the dataset
     def full_calculations_output(self):                    
+            dict_vars = {}  # output variables of all the channels, added to the dataset all at once
             for isch, sch in enumerate(self.varlist):
 
-                for iev_data, ev_data in enumerate(self.dataset.data):
-                    if self.bVerbose:
-                        if iev_data%1000==0: print("doing channel %s, event #%d" % (sch, iev_data))
+                with _profTimer(self.profile, "compute"):
+                    for iev_data, ev_data in enumerate(self.dataset.data):
+                        if self.bVerbose:
+                            if iev_data%1000==0: print("doing channel %s, event #%d" % (sch, iev_data))
 
-                    wf_temp = self.cWaveForm(
-                        y0 = ev_data[sch], **self.dictWfParams[sch]
-                    )
-                    wf_temp.full_analysis()
+                        wf_temp = self.cWaveForm(
+                            y0 = ev_data[sch], **self.dictWfParams[sch]
+                        )
+                        wf_temp.full_analysis()
 
-                    for out_var in self.__output_collection[sch]:
-                        attr_temp = wf_temp.__getattribute__(out_var)
-                        if iev_data==0:
-                            self.__output_collection[sch][out_var] = [attr_temp]
-                        else:
-                            self.__output_collection[sch][out_var] += [attr_temp]
+                        for out_var in self.__output_collection[sch]:
+                            attr_temp = wf_temp.__getattribute__(out_var)
+                            if iev_data==0:
+                                self.__output_collection[sch][out_var] = [attr_temp]
+                            else:
+                                self.__output_collection[sch][out_var] += [attr_temp]
+                _profCount(self.profile, "events_processed", len(self.dataset.data))
                             
-                self.dataset.add_vars({sch+"_out_"+k : ak.Array(v) for (k, v) in self.__output_collection[sch].items()})
+                dict_vars.update({sch+"_out_"+k : ak.Array(v) for (k, v) in self.__output_collection[sch].items()})
+                if self.bOutWfs & self.bOutWfsCompact:
+                    dict_vars.update(self.__output_wfs_compact(sch))
+            self.dataset.add_vars(dict_vars)
+                
+            self.__persistence_cache = {}  # waveforms have been recomputed, cached persistence maps are outdated
+    
+    # store the raw samples of a channel into the dataset as a single contiguous (events * samples) matrix of the
+    # smallest integer type holding them, private -- if the raw samples are integers already, the raw variable is just
+    # referenced (i.e. its buffers are shared, with no copy)
+    # (the calibrated signals are then computed when needed, see get_wfs_compact)
+    # --> return the dictionary with the output variable, to be added to the dataset
+    def __output_wfs_compact(self, channel):
+        try:
+            adc = ak.to_numpy(self.dataset.data[channel])
+        except ValueError:
+            raise ValueError("compact waveform output requires the same nr. of samples in all the events (%s)" % channel)
+        adc = adc.reshape(len(adc), -1) if adc.ndim != 2 else adc
+        self._get_wfs_x(channel, adc.shape[1])
+        if adc.dtype.kind in "iu":
+            return {channel+"_out_adc" : self.dataset.data[channel]}
+        return {channel+"_out_adc" : ak.Array(adc.astype(_wfCompactDtype(adc), copy=False))}
+    
+    # get the time axis of the output waveforms of a channel, protected -- computed from the channel parameters (as
+    # in the event-by-event analysis) and cached, so that it is available also for datasets reopened from files or cut
+    # nsamples is the nr. of samples per waveform
+    # --> return the time axis (1d array)
+    def _get_wfs_x(self, channel, nsamples):
+        if (not (channel in self.wfs_x)) or (len(self.wfs_x[channel]) != nsamples):
+            wf_temp = self.cWaveForm(y0=np.zeros(nsamples), **self.dictWfParams[channel])
+            wf_temp.calibrate_x()
+            self.wfs_x[channel] = wf_temp.x
+        return self.wfs_x[channel]
+    
+    # get the analysed waveforms of a set of events in compact form, protected
+    # data is the event array (e.g. the data attribute of a dataset), containing the <channel>_out_adc variable
+    # --> return the cWfCompact object
+    def _get_wfs_compact(self, data, channel):
+        params = self.dictWfParams[channel]
+        adc = ak.to_numpy(data["%s_out_adc"%channel])
+        adc = adc.reshape(len(adc), -1 if len(adc) > 0 else 0) if adc.ndim != 2 else adc
+        return self.cWfCompact(
+            adc, self._get_wfs_x(channel, adc.shape[1]), params["bPositive"],
+            ak.to_numpy(data["%s_out_base_mean"%channel]),
+            params.get("nbit", 12), params.get("rangeVpp", 4096), params.get("unitY", 1),  # cWaveForm defaults
+        )
+    
+    # get the analysed waveforms of a channel in compact form (bOutWfs & bOutWfsCompact only)
+    # channel is the (waveform) variable among the loaded ones, string
+    # boolean is the boolean to be applied to the dataset
+    # --> return the cWfCompact object, whose get_xy() returns the time axis and the signal matrix
+    def get_wfs_compact(self, channel, boolean=True):
+        return self._get_wfs_compact(self._apply_boolean(self.dataset.data, boolean), channel)
     
     # create all the main (ph, time, charge) histograms --> return a dictionary with the histogram collection
     def analyse_main_distributions(
@@ -829,6 +974,7 @@ class cWaveFormsCollection(cCollection):
         range_charge = None,  # range for charge distributions, 2-entry array or None
     ):
         
+        boolean = self._boolean(boolean)
         dataset_temp = self.dataset.cut_copy(boolean)
         x0_base_range = self.dictWfParams[channel]["x0BaseRange"]
         sign_base = 1 if self.dictWfParams[channel]["bPositive"] else -1
@@ -858,9 +1004,10 @@ class cWaveFormsCollection(cCollection):
         hists_collection["hist_charge"] =\
             self.create_histo_1d("%s_out_charge"%(channel), boolean, bins=bins_charge, range=range_charge)
         
-        boolean_bkg = boolean &\
-            (self.dataset.data["%s_out_%s"%(channel, time_var)] > range_time_bkg[0]) &\
-            (self.dataset.data["%s_out_%s"%(channel, time_var)] < range_time_bkg[1])
+        # time window masks via the cut engine, i.e. cached & reused by later calls on the same channel
+        boolean_bkg = boolean & self.dataset.mask(
+            _cutWindow("%s_out_%s"%(channel, time_var), range_time_bkg[0], range_time_bkg[1])
+        )
         hists_collection["hist_time_bkg"] =\
             self.create_histo_1d("%s_out_%s"%(channel, time_var), boolean_bkg, bins=bins_time, range=range_time)
         hists_collection["hist_ph_bkg0"] =\
@@ -868,9 +1015,9 @@ class cWaveFormsCollection(cCollection):
         hists_collection["hist_charge_bkg0"] =\
             self.create_histo_1d("%s_out_charge"%(channel), boolean_bkg, bins=bins_charge, range=range_charge)
         
-        boolean_sig = boolean &\
-            (self.dataset.data["%s_out_%s"%(channel, time_var)] > range_time_sig[0]) &\
-            (self.dataset.data["%s_out_%s"%(channel, time_var)] < range_time_sig[1])
+        boolean_sig = boolean & self.dataset.mask(
+            _cutWindow("%s_out_%s"%(channel, time_var), range_time_sig[0], range_time_sig[1])
+        )
         hists_collection["hist_time_sig"] =\
             self.create_histo_1d("%s_out_%s"%(channel, time_var), boolean_sig, bins=bins_time, range=range_time)
         hists_collection["hist_ph_sig0"] =\
@@ -968,6 +1115,70 @@ class cWaveFormsCollection(cCollection):
                 label="signal (selection)" if blegend else None,
             )
                     
+    # get the analysed waveforms of a set of events as a common time axis and an (events * samples) matrix, protected
+    # data is the event array (e.g. the data attribute of a dataset), containing the <channel>_out_x/y variables (or,
+    # with compact output, the <channel>_out_adc one)
+    # channel is the (waveform) variable among the loaded ones, string
+    # --> return the time axis (1d array) and the signal matrix (2d array, NaN-padded if lengths differ)
+    def _get_wfs_xy(self, data, channel):
+        if not ("%s_out_x"%channel in data.fields):
+            return self._get_wfs_compact(data, channel).get_xy()
+        wfs_x = data["%s_out_x"%channel]
+        wfs_y = data["%s_out_y"%channel]
+        if len(wfs_x)==0:
+            return np.zeros(0), np.zeros((0, 0))
+        nsamples_ev = ak.to_numpy(ak.num(wfs_x, axis=1))
+        nsamples = int(np.max(nsamples_ev))
+        x = np.array(wfs_x[int(np.argmax(nsamples_ev))], dtype=float)  # the time axis is the same for all the events
+        y = ak.to_numpy(ak.fill_none(ak.pad_none(wfs_y, nsamples, clip=True), np.nan)).astype(float)
+        return x, y
+
+    # reduce the waveform matrix to min/max pairs per horizontal pixel (the curves envelope is preserved), protected
+    # x is the common time axis (1d array), y is the signal matrix (2d array)
+    # npix is the number of horizontal pixels
+    # --> return the decimated time axis and signal matrix, each pixel yielding 2 points
+    def _decimate_wfs_minmax(self, x, y, npix):
+        if (npix is None) or (len(x) <= 2*npix):
+            return x, y
+        starts = np.linspace(0, len(x), npix, endpoint=False).astype(int)
+        y_min = np.fmin.reduceat(y, starts, axis=1)
+        y_max = np.fmax.reduceat(y, starts, axis=1)
+        x_dec = np.repeat(x[starts], 2)
+        y_dec = np.empty((y.shape[0], 2*npix))
+        y_dec[:, 0::2] = y_min
+        y_dec[:, 1::2] = y_max
+        return x_dec, y_dec
+
+    # compute the average baseline mean and RMS of the analysed waveforms
+    # channel is the (waveform) variable among the loaded ones, string
+    # boolean is the boolean to be applied to the dataset
+    # --> return the (mean, RMS) pair
+    def compute_base_stats(self, channel, boolean=True):
+        base_mean = np.mean(self._apply_boolean(self.dataset.data["%s_out_base_mean"%channel], boolean))
+        base_rms = np.mean(self._apply_boolean(self.dataset.data["%s_out_base_rms"%channel], boolean))
+        return base_mean, base_rms
+    
+    # draw the baseline calculation info onto a waveform plot, protected
+    # ax is the destination axis in a figure
+    # x0_base_range is the baseline calculation range, sign_base is the original signal polarity (+-1)
+    # base_stats is the (mean, RMS) pair, created by compute_base_stats
+    def _draw_base_stats(self, ax, x0_base_range, sign_base, base_stats):
+        base_mean, base_rms = base_stats
+        ax.axvline(x0_base_range[0], color="red", lw=1)
+        ax.axvline(x0_base_range[1], color="red", lw=1)
+        ax.plot(
+            x0_base_range, base_mean*np.ones(2) * sign_base,
+            color="red", lw=1, label="(mean) baseline calculation"
+        )
+        ax.plot(
+            x0_base_range, (base_mean + base_rms)*np.ones(2) * sign_base,
+            color="red", lw=1, ls=":"
+        )
+        ax.plot(
+            x0_base_range, (base_mean - base_rms)*np.ones(2) * sign_base,
+            color="red", lw=1, ls=":"
+        )
+        
     # plot waveforms as individual curves, with boolean --> create figure
     def plot_wfs_curves(
         self,
@@ -979,57 +1190,69 @@ class cWaveFormsCollection(cCollection):
         figtitle = "",  # string with the figure title
         bsave = False,  # boolean: if True (False), (don't) save the figure
         outname  = "./out.jpg",  # path and name of the figure output file, string
+        bcollection = False,  # boolean: if True, draw all the curves at once as a single LineCollection (much faster)
+        npix_decim = None,  # nr. of horiz. pixels for min/max decimation (bcollection only), integer or None (no decim.)
+        nev_max_curves = None,  # above this nr. of selected events, plot_wfs_hist2d is used instead, integer or None
+        wfs_xy = None,  # the (time axis, signal matrix) pair can be directly fed in this method*
+        base_stats = None,  # the (mean) baseline (mean, RMS) pair can be directly fed in this method*
     ):
-        
-        dataset_temp = self.dataset.cut_copy(boolean)
+        # * wfs_xy can be created elsewhere with _get_wfs_xy (and _decimate_wfs_minmax), base_stats with
+        #   compute_base_stats; note that boolean is then overwritten and bcollection is set to True
+        
+        if not (nev_max_curves is None):
+            nevs_temp = len(self._apply_boolean(self.dataset.data, boolean)) if wfs_xy is None else len(wfs_xy[1])
+            if nevs_temp > nev_max_curves:
+                if self.bVerbose: print("%d events > %d, drawing the 2d histogram instead" % (nevs_temp, nev_max_curves))
+                self.plot_wfs_hist2d(
+                    channel, boolean=boolean, plot_lims=plot_lims, bbaseline=bbaseline,
+                    figsize=figsize, figtitle=figtitle, bsave=bsave, outname=outname, base_stats=base_stats,
+                )
+                return
+
         x0_base_range = self.dictWfParams[channel]["x0BaseRange"]
         unit_x = self.dictWfParams[channel]["unitX"]
         unit_y = self.dictWfParams[channel]["unitY"]
         sign_base = 1 if self.dictWfParams[channel]["bPositive"] else -1
         
-        plot_lims = np.array(plot_lims, dtype=object)
+        plot_lims = np.array((None, None) if plot_lims is None else plot_lims, dtype=object)
         
         fig, ax = plt.subplots(figsize=figsize)
         ax.grid(True)
         ax.set_xlabel("time [%.2e s]" % unit_x)
         ax.set_ylabel("voltage [%.2e V]" % unit_y)
         
-        for iev_data, ev_data in enumerate(dataset_temp.data):
-            ax.plot(
-                ev_data["%s_out_x"%channel], 
-                ev_data["%s_out_y"%channel],
-                color="C0", lw=0.2
-            )
+        if bcollection | (not (wfs_xy is None)):
+            if wfs_xy is None:
+                wfs_xy = self._decimate_wfs_minmax(*self._get_wfs_xy(self._apply_boolean(self.dataset.data, boolean), channel), npix_decim)
+            wfs_x, wfs_y = wfs_xy
+            segments = np.empty((wfs_y.shape[0], wfs_y.shape[1], 2))
+            segments[:, :, 0] = wfs_x
+            segments[:, :, 1] = wfs_y
+            ax.add_collection(LineCollection(segments, colors="C0", lw=0.2))
+            ax.autoscale_view()
+        elif not ("%s_out_x"%channel in self.dataset.data.fields):  # compact output
+            wfs_x, wfs_y = self._get_wfs_xy(self._apply_boolean(self.dataset.data, boolean), channel)
+            for y_ev in wfs_y:
+                ax.plot(wfs_x, y_ev, color="C0", lw=0.2)
+        else:
+            for iev_data, ev_data in enumerate(self._apply_boolean(self.dataset.data, boolean)):
+                ax.plot(
+                    ev_data["%s_out_x"%channel], 
+                    ev_data["%s_out_y"%channel],
+                    color="C0", lw=0.2
+                )
 
         ax.axvline(0, color="k", lw=1, ls=":")
         
         if bbaseline:
-            ax.axvline(x0_base_range[0], color="red", lw=1)
-            ax.axvline(x0_base_range[1], color="red", lw=1)
-            ax.plot(
-                x0_base_range, np.mean(dataset_temp.data["%s_out_base_mean"%channel])*np.ones(2) * sign_base,
-                color="red", lw=1, label="(mean) baseline calculation"
-            )
-            ax.plot(
-                x0_base_range,
-                (
-                    np.mean(dataset_temp.data["%s_out_base_mean"%channel]) +\
-                    np.mean(dataset_temp.data["%s_out_base_rms"%channel])
-                )*np.ones(2) * sign_base,
-                color="red", lw=1, ls=":"
-            )
-            ax.plot(
-                x0_base_range,
-                (
-                    np.mean(dataset_temp.data["%s_out_base_mean"%channel]) -\
-                    np.mean(dataset_temp.data["%s_out_base_rms"%channel])
-                )*np.ones(2) * sign_base,
-                color="red", lw=1, ls=":"
+            self._draw_base_stats(
+                ax, x0_base_range, sign_base, self.compute_base_stats(channel, boolean) if base_stats is None else base_stats
             )
             ax.legend()
 
-        if not (plot_lims is None):
+        if not (plot_lims[0] is None):
             ax.set_xlim(plot_lims[0])
+        if not (plot_lims[1] is None):
             ax.set_ylim(plot_lims[1])
             
         fig.suptitle(figtitle)
@@ -1038,6 +1261,60 @@ class cWaveFormsCollection(cCollection):
         if bsave:
             fig.savefig(outname, dpi=self.__outfig_dpi)
             
+    # hash a selection, to be used as a key for cached quantities, protected
+    # boolean is the selection (as in cut_copy)
+    # --> return a string
+    def _hash_boolean(self, boolean):
+        if np.isscalar(boolean):
+            return str(boolean)
+        return hashlib.sha1(np.packbits(np.asarray(boolean, dtype=bool)).tobytes()).hexdigest()
+
+    # compute the persistence map of the analysed waveforms, i.e. the 2d histogram of all their (time, signal) samples
+    # maps are memoised by (channel, selection, binning, dataset state), so that redrawing them is just a matter of
+    # rendering
+    # --> return the cWfPersistenceMap object
+    def compute_wfs_persistence(
+        self,
+        channel,  # (waveform) variable to deal with among the loaded one, string
+        boolean = True,  # boolean to be applied to the dataset
+        nbins = (100, 100),  # nr. of bins, integer or (integer, integer)
+        hist_range = None,  # histogram range, (2-entry array or None, 2-entry array or None) or None (from data)
+        chunksize = 10000,  # nr. of events per filling step, integer
+    ):
+        boolean = self._boolean(boolean)
+        data_temp = self.dataset.data if np.isscalar(boolean) else self._apply_boolean(self.dataset.data, boolean)
+        
+        hist_range = [None, None] if hist_range is None else list(hist_range)
+        if not ("%s_out_x"%channel in data_temp.fields):  # compact output, signals computed chunk by chunk
+            wfs_compact = self._get_wfs_compact(data_temp, channel)
+            if hist_range[0] is None:
+                hist_range[0] = (float(np.min(wfs_compact.x)), float(np.max(wfs_compact.x)))
+            if hist_range[1] is None:
+                hist_range[1] = tuple(float(y) for y in wfs_compact.get_y_range(chunksize))
+        if hist_range[0] is None:
+            hist_range[0] = (float(ak.min(data_temp["%s_out_x"%channel])), float(ak.max(data_temp["%s_out_x"%channel])))
+        if hist_range[1] is None:
+            hist_range[1] = (float(ak.min(data_temp["%s_out_y"%channel])), float(ak.max(data_temp["%s_out_y"%channel])))
+        
+        nbins = (nbins, nbins) if np.isscalar(nbins) else tuple(nbins)
+        # the dataset state is part of the key, so that maps are recomputed after open, update or add_vars
+        field_versions = getattr(self.dataset, "field_versions", {})
+        key = (
+            channel, self._hash_boolean(boolean), nbins, tuple(tuple(lims) for lims in hist_range),
+            getattr(self.dataset, "data_version", 0), len(self.dataset.data),
+            tuple([field_versions.get("%s_out_%s"%(channel, s), 0) for s in ["x", "y", "adc"]]),
+        )
+        if not (key in self.__persistence_cache):
+            map_temp = self.cWfPersistenceMap(nbins, hist_range)
+            with _profTimer(self.profile, "histogram"):
+                for iev_start in range(0, len(data_temp), chunksize):
+                    map_temp.fill(*self._get_wfs_xy(data_temp[iev_start:iev_start+chunksize], channel))
+            self.__persistence_cache[key] = map_temp
+        elif self.bVerbose:
+            print("persistence map for %s found in cache" % channel)
+            
+        return self.__persistence_cache[key]
+
     # plot waveforms in a single 2d histogram, with boolean --> create figure
     def plot_wfs_hist2d(
         self,
@@ -1051,63 +1328,43 @@ class cWaveFormsCollection(cCollection):
         blog = False,  # blog is a boolean: if True, toggle z log scale
         bsave = False,  # boolean: if True (False), (don't) save the figure
         outname  = "./out.jpg",  # path and name of the figure output file, string
+        hist_range = None,  # histogram range, (2-entry array, 2-entry array) or None (plot_lims, if given, or data)*
+        persistence_map = None,  # a cWfPersistenceMap can be directly fed in this method**
+        base_stats = None,  # the (mean) baseline (mean, RMS) pair can be directly fed in this method**
     ):
+        # * if hist_range is given, changing plot_lims does not require the histogram to be recomputed
+        # ** persistence_map can be created elsewhere with compute_wfs_persistence (and maps can be summed),
+        #    base_stats with compute_base_stats; note that boolean, nbins and hist_range are then overwritten
         
-        dataset_temp = self.dataset.cut_copy(boolean)
         x0_base_range = self.dictWfParams[channel]["x0BaseRange"]
         unit_x = self.dictWfParams[channel]["unitX"]
         unit_y = self.dictWfParams[channel]["unitY"]
         sign_base = 1 if self.dictWfParams[channel]["bPositive"] else -1
         
-        plot_lims = np.array(plot_lims, dtype=object)
-        _, plot_lims[0] = self._tweak_bins_range(
-            dataset_temp.data["%s_out_x"%channel], None, plot_lims[0]
-        )
-        _, plot_lims[1] = self._tweak_bins_range(
-            dataset_temp.data["%s_out_y"%channel], None, plot_lims[1]
-        )
+        plot_lims = np.array((None, None) if plot_lims is None else plot_lims, dtype=object)
+        if persistence_map is None:
+            persistence_map = self.compute_wfs_persistence(
+                channel, boolean, nbins=nbins, hist_range=plot_lims if hist_range is None else hist_range,
+            )
         
         fig, ax = plt.subplots(figsize=figsize)
         ax.grid(True)
         ax.set_xlabel("time [%.2e s]" % unit_x)
         ax.set_ylabel("voltage [%.2e V]" % unit_y)
         
-        hist_temp = self.create_histo_2d(
-            ak.flatten(dataset_temp.data["%s_out_x"%channel]),
-            ak.flatten(dataset_temp.data["%s_out_y"%channel]),
-            bins=nbins, range=plot_lims,
-        )
-        self._draw_hist2d(hist_temp, ax=ax, blog=blog)
+        self._draw_hist2d(persistence_map.get_hist2d(), ax=ax, blog=blog)
 
         ax.axvline(0, color="k", lw=1, ls=":")
         
         if bbaseline:
-            ax.axvline(x0_base_range[0], color="red", lw=1)
-            ax.axvline(x0_base_range[1], color="red", lw=1)
-            ax.plot(
-                x0_base_range, np.mean(dataset_temp.data["%s_out_base_mean"%channel])*np.ones(2) * sign_base,
-                color="red", lw=1, label="(mean) baseline calculation"
-            )
-            ax.plot(
-                x0_base_range,
-                (
-                    np.mean(dataset_temp.data["%s_out_base_mean"%channel]) +\
-                    np.mean(dataset_temp.data["%s_out_base_rms"%channel])
-                )*np.ones(2) * sign_base,
-                color="red", lw=1, ls=":"
-            )
-            ax.plot(
-                x0_base_range,
-                (
-                    np.mean(dataset_temp.data["%s_out_base_mean"%channel]) -\
-                    np.mean(dataset_temp.data["%s_out_base_rms"%channel])
-                )*np.ones(2) * sign_base,
-                color="red", lw=1, ls=":"
+            self._draw_base_stats(
+                ax, x0_base_range, sign_base, self.compute_base_stats(channel, boolean) if base_stats is None else base_stats
             )
             ax.legend()
 
-        if not (plot_lims is None):
+        if not (plot_lims[0] is None):
             ax.set_xlim(plot_lims[0])
+        if not (plot_lims[1] is None):
             ax.set_ylim(plot_lims[1])
         
         fig.suptitle(figtitle)
@@ -1154,23 +1411,23 @@ class cWaveFormsCollection(cCollection):
         # * hists_collection is can be created elsewhere with analyse_main_distributions;
         #   note that some of the other arguments are overwritten
         
-        dataset_temp = self.dataset.cut_copy(boolean)
         x0_base_range = self.dictWfParams[channel]["x0BaseRange"]
         unit_ph = self.dictWfParams[channel]["unitY"]
         unit_time = self.dictWfParams[channel]["unitX"]
         unit_charge = unit_ph * unit_time
         
-        bins_time, range_time = self._tweak_bins_range(
-            dataset_temp.data["%s_out_%s"%(channel, time_var)], bins_time, range_time
-        )
-        bins_ph, range_ph = self._tweak_bins_range(
-            dataset_temp.data["%s_out_ph"%(channel)], bins_ph, range_ph
-        )
-        bins_charge, range_charge = self._tweak_bins_range(
-            dataset_temp.data["%s_out_charge"%(channel)], bins_charge, range_charge
-        )
-        
         if hists_collection is None:
+            dataset_temp = self.dataset.cut_copy(boolean)
+            bins_time, range_time = self._tweak_bins_range(
+                dataset_temp.data["%s_out_%s"%(channel, time_var)], bins_time, range_time
+            )
+            bins_ph, range_ph = self._tweak_bins_range(
+                dataset_temp.data["%s_out_ph"%(channel)], bins_ph, range_ph
+            )
+            bins_charge, range_charge = self._tweak_bins_range(
+                dataset_temp.data["%s_out_charge"%(channel)], bins_charge, range_charge
+            )
+        
             hists_collection = self.analyse_main_distributions(
                 channel=channel, boolean=boolean,
                 range_time_sig=range_time_sig, range_time_bkg=range_time_bkg, time_var=time_var, 
@@ -1293,25 +1550,25 @@ class cWaveFormsCollection(cCollection):
         # * hists_collection is can be created elsewhere with analyse_main_distributions;
         #   note that some of the other arguments are overwritten
         
-        dataset_temp = self.dataset.cut_copy(boolean)
         unit_ph = self.dictWfParams[channel]["unitY"]
         unit_time = self.dictWfParams[channel]["unitX"]
         unit_charge = unit_ph * unit_time
         
-        bins_time, range_time = self._tweak_bins_range(
-            dataset_temp.data["%s_out_%s"%(channel, time_var)], bins_time, range_time
-        )
-        bins_ph, range_ph = self._tweak_bins_range(
-            dataset_temp.data["%s_out_ph"%(channel)], bins_ph, range_ph
-        )
-        bins_charge, range_charge = self._tweak_bins_range(
-            dataset_temp.data["%s_out_charge"%(channel)], bins_charge, range_charge
-        )
-        bins_nev, _ = self._tweak_bins_range(
-            dataset_temp.data["index"], bins_nev, 0
-        )
-        
         if hists_collection is None:
+            dataset_temp = self.dataset.cut_copy(boolean)
+            bins_time, range_time = self._tweak_bins_range(
+                dataset_temp.data["%s_out_%s"%(channel, time_var)], bins_time, range_time
+            )
+            bins_ph, range_ph = self._tweak_bins_range(
+                dataset_temp.data["%s_out_ph"%(channel)], bins_ph, range_ph
+            )
+            bins_charge, range_charge = self._tweak_bins_range(
+                dataset_temp.data["%s_out_charge"%(channel)], bins_charge, range_charge
+            )
+            bins_nev, _ = self._tweak_bins_range(
+                dataset_temp.data["index"], bins_nev, 0
+            )
+        
             hists_collection = self.analyse_main_distributions(
                 channel=channel, boolean=boolean,
                 range_time_sig=range_time_sig, range_time_bkg=range_time_bkg, time_var=time_var, 
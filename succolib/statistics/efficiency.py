@@ -0,0 +1,53 @@
+import numpy as np
+from scipy.stats import beta, norm
+
+########################################################################################################################
+
+# binomial efficiency k/n with Clopper-Pearson (exact) confidence interval, vectorised over arrays of any shape
+# k (n) are the numerator (denominator) counts, cl is the confidence level (default 1 sigma)
+# --> return 3 arrays: efficiency, lower and upper interval edges (NaN where n = 0)
+def effClopperPearson(
+        k,
+        n,
+        cl = 0.682689492137,
+):
+
+    k = np.asarray(k, dtype=float)
+    n = np.asarray(n, dtype=float)
+    alpha = 1 - cl
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eff = k / n
+        effLow = np.where(k > 0, beta.ppf(0.5 * alpha, k, n - k + 1), 0.0)
+        effUp = np.where(k < n, beta.ppf(1 - 0.5 * alpha, k + 1, n - k), 1.0)
+
+    # empty bins are undefined, consistently with hist2dRatio()
+    eff = np.where(n > 0, eff, np.nan)
+    effLow = np.where(n > 0, effLow, np.nan)
+    effUp = np.where(n > 0, effUp, np.nan)
+    return eff, effLow, effUp
+
+########################################################################################################################
+
+# binomial efficiency k/n with Wilson score confidence interval, vectorised over arrays of any shape
+# k (n) are the numerator (denominator) counts, cl is the confidence level (default 1 sigma)
+# --> return 3 arrays: efficiency, lower and upper interval edges (NaN where n = 0)
+def effWilson(
+        k,
+        n,
+        cl = 0.682689492137,
+):
+
+    k = np.asarray(k, dtype=float)
+    n = np.asarray(n, dtype=float)
+    z = norm.ppf(1 - 0.5 * (1 - cl))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eff = k / n
+        centre = (k + 0.5 * z**2) / (n + z**2)
+        halfWidth = z * np.sqrt(k * (n - k) / n + 0.25 * z**2) / (n + z**2)
+        effLow = np.clip(centre - halfWidth, 0, 1)
+        effUp = np.clip(centre + halfWidth, 0, 1)
+
+    eff = np.where(n > 0, eff, np.nan)
+    effLow = np.where(n > 0, effLow, np.nan)
+    effUp = np.where(n > 0, effUp, np.nan)
+    return eff, effLow, effUp
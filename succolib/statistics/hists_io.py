@@ -0,0 +1,148 @@
+import numpy as np
+import json
+import os
+import zipfile
+
+from ..io.npz import _npzOpen
+
+########################################################################################################################
+
+# histogram collections on disk: a single uncompressed NPZ file, with, for each histogram key, the arrays
+#   key.x (and key.y, 2d only) -- the bin centres, as in the collection
+#   key.counts -- the bin contents
+#   key.sumw2 -- the sums of the squared weights, equal to the bin contents for unweighted histograms
+#   key.nevs -- the nr. of events
+# plus the JSON-encoded metadata (binning, selection, ...) as __metadata__
+# being uncompressed, the arrays can be memory-mapped when loading (see _npzOpen in io/npz.py)
+
+########################################################################################################################
+
+# binning of a histogram from its bin centres (uniform bins, as in create_histo_1d/create_histo_2d), private
+# --> return a dictionary with the nr. of bins and the range (edges) along each axis
+def _histsBinning(lsCentres):
+    dictBinning = {"nbins" : [], "range" : []}
+    for centres in lsCentres:
+        centres = np.asarray(centres, dtype=float)
+        dx = (centres[1] - centres[0]) if len(centres) > 1 else 0
+        dictBinning["nbins"].append(len(centres))
+        dictBinning["range"].append([float(centres[0] - 0.5 * dx), float(centres[-1] + 0.5 * dx)] if len(centres) > 0 else [])
+    return dictBinning
+
+########################################################################################################################
+
+# nr. of bin centre arrays (i.e. dimension) of a histogram of a collection, from its key, private
+def _histsDim(key):
+    return 2 if "hist2d_" in key else 1
+
+########################################################################################################################
+
+# save a histogram collection (e.g. from analyse_main_distributions) to a single NPZ file
+# fileName is the output file, hists_collection the dictionary with the histograms
+# metadata is a dictionary with further information (e.g. selection, run list, ...), to be JSON-serialisable
+# sumw2 is a dictionary with the sums of the squared weights per key, None (or missing keys) for unweighted histograms
+def histsSave(
+        fileName,
+        hists_collection,
+        metadata = {},
+        sumw2 = None,
+):
+
+    sumw2 = {} if sumw2 is None else sumw2
+    dictArrays = {}
+    dictBinning = {}
+    for key in hists_collection:
+        nDim = _histsDim(key)
+        hist = hists_collection[key]
+        for i, s in enumerate(["x", "y"][:nDim]):
+            dictArrays["%s.%s" % (key, s)] = np.asarray(hist[i])
+        dictArrays["%s.counts" % key] = np.asarray(hist[nDim])
+        dictArrays["%s.sumw2" % key] = np.asarray(sumw2[key] if key in sumw2 else hist[nDim], dtype=float)
+        dictArrays["%s.nevs" % key] = np.asarray(hist[nDim + 1])
+        dictBinning[key] = _histsBinning(hist[:nDim])
+
+    dictMetadata = dict(metadata)
+    dictMetadata["binning"] = dictBinning
+    dictArrays["__metadata__"] = np.array(json.dumps(dictMetadata))
+
+    # written to a temporary file first, so that an interrupted writing never leaves a corrupted file
+    with open(fileName + ".tmp", "wb") as f:
+        np.savez(f, **dictArrays)
+    os.replace(fileName + ".tmp", fileName)
+
+########################################################################################################################
+
+# load a histogram collection saved with histsSave
+# fileName is the input file
+# bMmap is a boolean: if True, the arrays are memory-mapped (i.e. only read from disk when accessed)
+# --> return the histogram collection (same format as analyse_main_distributions), the dictionary of the sums of the
+# squared weights per key and the metadata dictionary
+def histsLoad(
+        fileName,
+        bMmap = True,
+):
+
+    with zipfile.ZipFile(fileName) as fZip:
+        lsNames = [s[:-len(".npy")] for s in fZip.namelist() if s.endswith(".npy")]
+    if bMmap:
+        dictArrays = {s : _npzOpen(fileName, s) for s in lsNames}
+    else:
+        with np.load(fileName) as data0:
+            dictArrays = {s : data0[s] for s in lsNames}
+
+    metadata = json.loads(str(np.asarray(dictArrays["__metadata__"])[()]))
+    hists_collection = {}
+    sumw2 = {}
+    for key in metadata["binning"]:  # in the order of the original collection
+        nDim = _histsDim(key)
+        hists_collection[key] = [dictArrays["%s.%s" % (key, s)] for s in ["x", "y"][:nDim]] + [
+            dictArrays["%s.counts" % key],
+            np.asarray(dictArrays["%s.nevs" % key])[()],
+        ]
+        sumw2[key] = dictArrays["%s.sumw2" % key]
+    return hists_collection, sumw2, metadata
+
+########################################################################################################################
+
+# merge the histogram collections saved in several files, one file at a time (i.e. with the memory needed for a single
+# collection, whatever the nr. of files) -- all the collections must have the same keys & binning
+# lsFileNames is the list of input files
+# outName is the output file, None for no output file
+# metadata is a dictionary with further information for the merged collection
+# --> return the merged histogram collection, the sums of the squared weights and the metadata (as histsLoad), the
+# latter with the metadata of each input file in "inputs" and the list of the input files in "files"
+def histsMerge(
+        lsFileNames,
+        outName = None,
+        metadata = {},
+):
+
+    hists_collection, sumw2, metadata0 = None, None, None
+    lsMetadata = []
+    for fileName in lsFileNames:
+        hists_temp, sumw2_temp, metadata_temp = histsLoad(fileName, bMmap=True)
+        if hists_collection is None:  # accumulators, in memory
+            hists_collection = {key : [np.array(h) if np.ndim(h) > 0 else h for h in hists_temp[key]] for key in hists_temp}
+            sumw2 = {key : np.array(sumw2_temp[key]) for key in sumw2_temp}
+            metadata0 = metadata_temp
+        else:
+            if list(hists_temp.keys()) != list(hists_collection.keys()):
+                raise ValueError("%s: histogram keys differ from those of %s" % (fileName, lsFileNames[0]))
+            for key in hists_collection:
+                nDim = _histsDim(key)
+                for i in range(nDim):
+                    if not np.array_equal(hists_temp[key][i], hists_collection[key][i]):
+                        raise ValueError("%s: binning of %s differs from that of %s" % (fileName, key, lsFileNames[0]))
+                hists_collection[key][nDim] = hists_collection[key][nDim] + hists_temp[key][nDim]
+                hists_collection[key][nDim + 1] = hists_collection[key][nDim + 1] + hists_temp[key][nDim + 1]
+                sumw2[key] += sumw2_temp[key]
+        lsMetadata.append({s : metadata_temp[s] for s in metadata_temp if s != "binning"})
+    if hists_collection is None:
+        return None, None, None
+
+    metadata_out = dict(metadata)
+    metadata_out["files"] = [os.path.basename(s) for s in lsFileNames]
+    metadata_out["inputs"] = lsMetadata
+    if not (outName is None):
+        histsSave(outName, hists_collection, metadata_out, sumw2)
+    metadata_out["binning"] = metadata0["binning"]
+    return hists_collection, sumw2, metadata_out
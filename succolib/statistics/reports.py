@@ -0,0 +1,236 @@
+import numpy as np
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ..profiling.profile_report import cProfileReport, _profCount
+
+########################################################################################################################
+
+# process pool initialiser: headless rendering, private
+def _init_worker_render():
+    import matplotlib
+    matplotlib.use("Agg")
+
+########################################################################################################################
+
+# render a single figure with a collection plotting method, private (executed in the worker processes)
+# collection is the lightweight collection copy, method is the name of the plotting method
+# kwargs are the plotting method arguments, with the precomputed inputs
+# outname is the output image file (png) or None (pdf, the figure itself being returned pickled)
+# --> return the pickled figure or None
+def _render_figure(collection, method, kwargs, outname, dpi):
+    import matplotlib.pyplot as plt
+    plt.close("all")
+    getattr(collection, method)(**kwargs)
+    fig = plt.gcf()
+    if outname is None:
+        out = pickle.dumps(fig)
+    else:
+        fig.savefig(outname, dpi=dpi)
+        out = None
+    plt.close(fig)
+    return out
+
+########################################################################################################################
+
+# update a hash object with the content of (nested) dictionaries, lists, arrays and objects, private
+def _hash_update(h, obj):
+    if isinstance(obj, dict):
+        h.update(b"{")
+        for key in sorted(obj.keys(), key=str):
+            h.update(str(key).encode())
+            _hash_update(h, obj[key])
+        h.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for el in obj:
+            _hash_update(h, el)
+        h.update(b"]")
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            _hash_update(h, obj.tolist())
+        else:
+            h.update(("%s%s" % (obj.dtype.str, obj.shape)).encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif callable(obj):
+        h.update(("%s.%s" % (getattr(obj, "__module__", ""), getattr(obj, "__qualname__", repr(obj)))).encode())
+    elif hasattr(obj, "__dict__"):
+        h.update(type(obj).__name__.encode())
+        _hash_update(h, vars(obj))
+    else:
+        h.update(repr(obj).encode())
+
+########################################################################################################################
+
+class cReport:
+    # batch (headless) report with the figures from the collection plotting methods
+    # the histograms are computed in the main process when figures are added, whereas figures are rendered in a pool of
+    # processes when the report is written; figures whose inputs are unchanged since the last report are not rendered
+    def __init__(
+        self,
+        outname,
+        outformat = "pdf",
+        dpi = 200,
+        nproc = None,
+        bVerbose = False,
+        profile = None,
+    ):
+
+        # attributes set via input:
+
+        self.outname = outname  # path of the multi-page file (pdf) or of the output directory (png)
+        self.outformat = outformat  # either "pdf" or "png"
+        self.dpi = dpi
+        self.nproc = nproc  # nr. of rendering processes, if None the nr. of CPUs
+        self.bVerbose = bVerbose
+        self.profile = cProfileReport("report") if profile is None else profile
+
+        # calculated attributes:
+
+        self.cachedir = (outname + ".cache") if outformat == "pdf" else os.path.join(outname, ".cache")
+        self.figures = []
+        self.rendertime = 0
+
+    # compute the inputs of a plotting method (i.e. histograms, persistence maps, waveform matrices), private
+    # --> return the plotting method arguments, with the inputs in place of the selections
+    def __compute_inputs(self, collection, method, kwargs):
+        kwargs = dict(kwargs)
+
+        # arguments of the histogram-computing method that are also in the plotting method arguments
+        def kwargs_for(func):
+            return {k: v for (k, v) in kwargs.items() if k in inspect.signature(func).parameters}
+
+        if method in ("plot_distributions_tracking", "plot_distributions_summary", "plot_distribution_trends"):
+            if kwargs.get("hists_collection") is None:
+                kwargs_analyse = kwargs_for(collection.analyse_main_distributions)
+                kwargs_analyse["boolean"] = kwargs.get("boolean", True)
+                kwargs["hists_collection"] = collection.analyse_main_distributions(**kwargs_analyse)
+            kwargs.pop("boolean", None)
+        elif method == "plot_distributions_spot2d":
+            kwargs_analyse = kwargs_for(collection.analyse_main_distributions)
+            for s in ("d", "n"):
+                if kwargs.get("hists_collection_%s" % s) is None:
+                    kwargs_analyse["boolean"] = kwargs.get("boolean_%s" % s, True)
+                    kwargs["hists_collection_%s" % s] = collection.analyse_main_distributions(**kwargs_analyse)
+                kwargs.pop("boolean_%s" % s, None)
+        elif method == "plot_wfs_hist2d":
+            if kwargs.get("persistence_map") is None:
+                plot_lims = kwargs.get("plot_lims")
+                kwargs["persistence_map"] = collection.compute_wfs_persistence(
+                    kwargs["channel"], kwargs.get("boolean", True), nbins=kwargs.get("nbins", (100, 100)),
+                    hist_range=plot_lims if kwargs.get("hist_range") is None else kwargs["hist_range"],
+                )
+        elif method == "plot_wfs_curves":
+            if kwargs.get("wfs_xy") is None:
+                kwargs["wfs_xy"] = collection._decimate_wfs_minmax(
+                    *collection._get_wfs_xy(
+                        collection._apply_boolean(collection.dataset.data, kwargs.get("boolean", True)), kwargs["channel"]
+                    ),
+                    kwargs.get("npix_decim"),
+                )
+        else:
+            raise ValueError("plotting method %s not supported in reports" % method)
+
+        if method in ("plot_wfs_hist2d", "plot_wfs_curves"):
+            if kwargs.get("bbaseline", False) & (kwargs.get("base_stats") is None):
+                kwargs["base_stats"] = collection.compute_base_stats(kwargs["channel"], kwargs.get("boolean", True))
+            kwargs.pop("boolean", None)
+
+        kwargs["bsave"] = False
+        return kwargs
+
+    # add a figure to the report, computing its inputs
+    # name is the figure name (i.e. the file name without extension for png), string
+    # collection is the collection object, method is the name of its plotting method (e.g. "plot_wfs_hist2d")
+    # kwargs are the plotting method arguments (hists_collection & similar are computed if not given)
+    def add(self, name, collection, method, **kwargs):
+        with self.profile.timer("compute"):
+            kwargs_render = self.__compute_inputs(collection, method, kwargs)
+        collection_render = collection._copy_for_rendering()
+
+        h = hashlib.sha1()
+        _hash_update(h, [method, self.outformat, self.dpi, collection_render, kwargs_render])
+
+        self.figures.append({
+            "name" : name,
+            "collection" : collection_render,
+            "method" : method,
+            "kwargs" : kwargs_render,
+            "hash" : h.hexdigest(),
+        })
+
+    # render all the figures and write the output file(s)
+    # --> return the list of the names of the figures actually rendered (i.e. not found unchanged)
+    def write(self):
+        t0 = time.time()  # chronometer start
+        os.makedirs(self.cachedir, exist_ok=True)
+        if self.outformat == "png":
+            os.makedirs(self.outname, exist_ok=True)
+
+        # hashes of the figures written in the last report, if any
+        hashfile = os.path.join(self.cachedir, "hashes.json")
+        hashes_old = {}
+        if os.path.isfile(hashfile):
+            with open(hashfile, "r") as f:
+                hashes_old = json.load(f)
+
+        ls_todo = []
+        for fig in self.figures:
+            if self.outformat == "png":
+                fig["outname"] = os.path.join(self.outname, fig["name"] + ".png")
+                bdone = os.path.isfile(fig["outname"])
+            else:
+                fig["outname"] = None
+                bdone = os.path.isfile(os.path.join(self.cachedir, fig["hash"] + ".pkl"))
+            if not ((hashes_old.get(fig["name"]) == fig["hash"]) & bdone):
+                ls_todo.append(fig)
+        if self.bVerbose:
+            print("%d figures in report, %d to be rendered" % (len(self.figures), len(ls_todo)))
+
+        if len(ls_todo) > 0:
+            t0_render = time.perf_counter()
+            with ProcessPoolExecutor(
+                max_workers=self.nproc, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker_render,
+            ) as executor:
+                futures = [executor.submit(
+                    _render_figure, fig["collection"], fig["method"], fig["kwargs"], fig["outname"], self.dpi
+                ) for fig in ls_todo]
+                for fig, future in zip(ls_todo, futures):
+                    out = future.result()
+                    if not (out is None):
+                        with open(os.path.join(self.cachedir, fig["hash"] + ".pkl"), "wb") as f:
+                            f.write(out)
+                    if self.bVerbose:
+                        print("figure %s rendered" % fig["name"])
+            self.profile.add_time("render", time.perf_counter() - t0_render)  # wall time of the whole pool
+            _profCount(self.profile, "figures_rendered", len(ls_todo))
+
+        # multi-page output from the (new or cached) pickled figures, in the order they have been added
+        if (self.outformat == "pdf") & ((len(ls_todo) > 0) | (not os.path.isfile(self.outname))
+                                        | (list(hashes_old.keys()) != [fig["name"] for fig in self.figures])):
+            import matplotlib.pyplot as plt
+            from matplotlib.backends.backend_pdf import PdfPages
+            with PdfPages(self.outname) as pdf:
+                for fig in self.figures:
+                    with open(os.path.join(self.cachedir, fig["hash"] + ".pkl"), "rb") as f:
+                        fig_temp = pickle.load(f)
+                    pdf.savefig(fig_temp, dpi=self.dpi)
+                    plt.close(fig_temp)
+
+        # cached figures not in the current report are removed
+        for cachename in os.listdir(self.cachedir):
+            if cachename.endswith(".pkl") & (not (cachename[:-4] in [fig["hash"] for fig in self.figures])):
+                os.remove(os.path.join(self.cachedir, cachename))
+
+        with open(hashfile, "w") as f:
+            json.dump({fig["name"]: fig["hash"] for fig in self.figures}, f, indent=1)
+
+        t1 = time.time()  # chronometer stop
+        self.rendertime = t1 - t0
+        return [fig["name"] for fig in ls_todo]
@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+import traceback
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from ..profiling.profile_report import cProfileReport, _profCount
+from .collections import cCollection
+from .reports import _hash_update
+
+########################################################################################################################
+
+# process pool initialiser: headless plotting & bounded memory, private
+# memmax is the maximum address space of each worker process, in bytes (None for no limit -- Unix only)
+def _init_worker_run(memmax):
+    import matplotlib
+    matplotlib.use("Agg")
+    if not (memmax is None):
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (int(memmax), int(memmax)))
+        except (ImportError, ValueError, OSError):  # e.g. on Windows, the limit is simply not applied
+            pass
+
+########################################################################################################################
+
+# default per-run pipeline, private (executed in the worker processes)
+# dataset is the dictionary of the cAkDataset arguments
+# collection is the function (or class) that builds the collection out of the opened dataset, e.g.
+# lambda-free top-level functions like def f(dataset): return cWaveFormsCollection(dataset, ...), for pickling
+# analyse is the dictionary of the analyse_main_distributions arguments
+# --> return the histogram collection and the run summary, a dictionary
+def _run_pipeline(dataset, collection, analyse={}):
+    from ..io.datasets import cAkDataset
+    dataset_run = cAkDataset(**dataset).open()
+    collection_run = collection(dataset_run)
+    collection_run.full_calculations_output()
+    hists_collection = collection_run.analyse_main_distributions(**analyse)
+    summary = {
+        "nevs" : dataset_run.nevs,
+        "loadtime" : dataset_run.loadtime,
+        "profile" : dataset_run.profile,
+    }
+    return hists_collection, summary
+
+########################################################################################################################
+
+# execute the pipeline of a single run, private (executed in the worker processes)
+# all the errors (memory exhaustion included) are caught, so that a failed run does not affect the others
+# --> return a dictionary with the run status, the histogram collection and summary (if successful) or the error
+def _run_worker(pipeline, spec):
+    t0 = time.perf_counter()
+    try:
+        hists_collection, summary = pipeline(**spec)
+    except BaseException:
+        return {"status" : "failed", "error" : traceback.format_exc(), "time" : time.perf_counter() - t0}
+    if isinstance(summary.get("profile"), cProfileReport):
+        summary["profile"].hooks = []  # hooks might not be picklable
+    return {"status" : "ok", "hists" : hists_collection, "summary" : summary, "time" : time.perf_counter() - t0}
+
+########################################################################################################################
+
+class cRunDriver:
+    # parallel per-run processing: each run (e.g. dataset opening, collection calculations & histogramming) is
+    # executed in a pool of processes, one fresh process per run, and the histogram collections of all the runs are
+    # merged; the output of each run is checkpointed to disk, so that runs already done are not computed again
+    def __init__(
+        self,
+        checkpointdir = None,
+        pipeline = None,
+        nproc = None,
+        memmax = None,
+        nretries = 1,
+        bVerbose = False,
+        profile = None,
+    ):
+
+        # attributes set via input:
+
+        self.checkpointdir = checkpointdir  # directory of the per-run checkpoint files, if None no checkpointing
+        self.pipeline = _run_pipeline if pipeline is None else pipeline  # top-level function, for pickling
+        self.nproc = nproc  # nr. of worker processes, if None the nr. of CPUs
+        self.memmax = memmax  # maximum memory (address space) per worker process, in bytes, if None no limit
+        self.nretries = nretries  # nr. of retries of the runs whose worker process died (e.g. killed)
+        self.bVerbose = bVerbose
+        self.profile = cProfileReport("runs") if profile is None else profile
+
+        # calculated attributes:
+
+        self.runs = []
+        self.summaries = {}  # { run name : run summary }
+        self.runtime = 0
+
+    # checkpoint file of a run, private
+    def __checkpoint_name(self, run):
+        return os.path.join(self.checkpointdir, "%s.pkl" % run["name"])
+
+    # load the checkpoint of a run, if existing and computed with the same pipeline & specifications, private
+    # --> return the checkpointed output, None if not available
+    def __checkpoint_load(self, run):
+        if self.checkpointdir is None:
+            return None
+        if not os.path.isfile(self.__checkpoint_name(run)):
+            return None
+        try:
+            with open(self.__checkpoint_name(run), "rb") as f:
+                out = pickle.load(f)
+        except Exception:  # e.g. truncated file, the run is computed again
+            return None
+        return out if out.get("hash") == run["hash"] else None
+
+    # write the checkpoint of a run, private
+    # note: written to a temporary file first, so that an interrupted writing never leaves a corrupted checkpoint
+    def __checkpoint_write(self, run, out):
+        if self.checkpointdir is None:
+            return
+        os.makedirs(self.checkpointdir, exist_ok=True)
+        out = dict(out)
+        out["hash"] = run["hash"]
+        with open(self.__checkpoint_name(run) + ".tmp", "wb") as f:
+            pickle.dump(out, f)
+        os.replace(self.__checkpoint_name(run) + ".tmp", self.__checkpoint_name(run))
+
+    # add a run
+    # name is the run name (also the checkpoint file name, without extension), string
+    # spec are the pipeline arguments -- with the default pipeline: dataset (dictionary of the cAkDataset arguments),
+    # collection (top-level function or class building the collection from the dataset) and, optionally, analyse
+    # (dictionary of the analyse_main_distributions arguments)
+    def add(self, name, **spec):
+        if name in [run["name"] for run in self.runs]:
+            raise ValueError("run %s already added" % name)
+        h = hashlib.sha1()
+        _hash_update(h, [self.pipeline, spec])
+        self.runs.append({"name" : name, "spec" : spec, "hash" : h.hexdigest()})
+
+    # store the output of a run into the summaries & merge its histogram collection, private
+    # --> return the updated merged histogram collection
+    def __collect(self, run, out, status, hists_collection):
+        summary = dict(out.get("summary", {}))
+        summary.update({"status" : status, "time" : out["time"], "attempts" : run.get("attempts", 0)})
+        if status == "failed":
+            summary["error"] = out["error"]
+            if self.bVerbose:
+                print("run %s failed:\n%s" % (run["name"], out["error"]))
+        else:
+            if isinstance(summary.get("profile"), cProfileReport):
+                self.profile.merge(summary["profile"])
+            if self.bVerbose:
+                print("run %s %s" % (run["name"], "loaded from checkpoint" if status == "cached" else "done"))
+            hists_collection = out["hists"] if hists_collection is None else\
+                cCollection.sum_hists_collections([hists_collection, out["hists"]])
+        self.summaries[run["name"]] = summary
+        return hists_collection
+
+    # execute a set of runs in a pool of processes & merge the results, private
+    # an attempt is counted for the runs with a result and, if the pool broke, for the run executed alone in it
+    # --> return the list of the runs with no result due to the pool breaking & the updated merged histogram collection
+    def __run_pool(self, ls_runs, hists_collection, nproc):
+        kwargs_pool = {"max_tasks_per_child" : 1} if sys.version_info >= (3, 11) else {}  # fresh process per run
+        ls_broken = []
+        with ProcessPoolExecutor(
+            max_workers=nproc, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker_run, initargs=(self.memmax,), **kwargs_pool,
+        ) as executor:
+            futures = [executor.submit(_run_worker, self.pipeline, run["spec"]) for run in ls_runs]
+            for run, future in zip(ls_runs, futures):
+                try:
+                    out = future.result()
+                except BrokenProcessPool:
+                    if len(ls_runs) == 1:
+                        run["attempts"] += 1
+                    ls_broken.append(run)
+                    continue
+                run["attempts"] += 1
+                if out["status"] == "ok":
+                    self.__checkpoint_write(run, out)
+                hists_collection = self.__collect(run, out, out["status"], hists_collection)
+        return ls_broken, hists_collection
+
+    # execute all the runs (but the checkpointed ones) and merge the results
+    # note: the histogram collections are merged as soon as available, never all kept in memory at once
+    # --> return the merged histogram collection (None if no run succeeded) and the run summaries, the latter being a
+    # dictionary { run name : summary } with the pipeline summary plus status ("ok", "cached" or "failed"), time (in
+    # seconds), attempts and, for failed runs, the error traceback
+    def run(self):
+        t0 = time.time()  # chronometer start
+        self.summaries = {}
+        hists_collection = None
+
+        ls_todo = []
+        for run in self.runs:
+            run["attempts"] = 0
+            out = self.__checkpoint_load(run)
+            if out is None:
+                ls_todo.append(run)
+            else:
+                hists_collection = self.__collect(run, out, "cached", hists_collection)
+        if self.bVerbose:
+            print("%d runs, %d to be processed" % (len(self.runs), len(ls_todo)))
+
+        # a worker process dying breaks the whole pool, and all the runs still pending in it with no result: as the
+        # crashing run is unknown, those are then executed one by one, each in its own pool, where a broken pool is
+        # charged to the run alone -- and retried up to nretries times
+        t0_pool = time.perf_counter()
+        ls_broken, hists_collection = self.__run_pool(ls_todo, hists_collection, self.nproc)
+        for run in ls_broken:
+            while True:
+                ls_broken_run, hists_collection = self.__run_pool([run], hists_collection, 1)
+                if len(ls_broken_run) == 0:
+                    break
+                if run["attempts"] > self.nretries:
+                    out = {"error" : "worker process died", "time" : 0}
+                    hists_collection = self.__collect(run, out, "failed", hists_collection)
+                    break
+        self.profile.add_time("runs", time.perf_counter() - t0_pool)  # wall time of all the pools
+
+        self.summaries = {run["name"] : self.summaries[run["name"]] for run in self.runs}  # in the order of addition
+        _profCount(self.profile, "runs_failed", sum([self.summaries[s]["status"] == "failed" for s in self.summaries]))
+
+        t1 = time.time()  # chronometer stop
+        self.runtime = t1 - t0
+        return hists_collection, self.summaries
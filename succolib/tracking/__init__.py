@@ -1,2 +1,16 @@
-from .misc import dz
-from .straight_2d import zProj, zAngle, cTrack
+from ..lazy import _lazyGetattr, _lazyDir
+
+# objects of the subpackage, imported only when first accessed (see lazy.py)
+_lazyMap = {
+    "dz" : "misc",
+    "zProj" : "straight_2d",
+    "zAngle" : "straight_2d",
+    "cTrack" : "straight_2d",
+}
+__all__ = list(_lazyMap.keys())
+
+def __getattr__(name):
+    return _lazyGetattr(__name__, globals(), _lazyMap, name)
+
+def __dir__():
+    return _lazyDir(globals(), _lazyMap)
@@ -1 +1,14 @@
-from .hist2d_tools import hist2dRatio
\ No newline at end of file
+from ..lazy import _lazyGetattr, _lazyDir
+
+# objects of the subpackage, imported only when first accessed (see lazy.py)
+_lazyMap = {
+    "hist2dRatio" : "hist2d_tools",
+    "cEffMap2d" : "hist2d_tools",
+}
+__all__ = list(_lazyMap.keys())
+
+def __getattr__(name):
+    return _lazyGetattr(__name__, globals(), _lazyMap, name)
+
+def __dir__():
+    return _lazyDir(globals(), _lazyMap)
@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
+from ..statistics.efficiency import effClopperPearson, effWilson
+
 ########################################################################################################################
 
 def hist2dRatio(
@@ -38,3 +40,130 @@ def hist2dRatio(
             plt.imshow(histRatioPlot, origin="lower", extent=[min(histDen[1]), max(histDen[1]), min(histDen[2]), max(histDen[2])], norm=norm, cmap=cmap, aspect="auto")
 
     return histRatio, histDen[1], histDen[2]  # output matrix is always computed and returned
+
+########################################################################################################################
+
+class cEffMap2d:
+    # efficiency map, i.e. ratio between 2d histograms, with numerator & denominator accumulated over chunks of data
+    # the binning is fixed and shared: on each axis, unless the bin edges are explicit arrays or the range is given,
+    # the latter is set from the first denominator chunk (as in hist2dRatio), which must then be filled first
+    def __init__(
+        self,
+        bins = 10,
+        range = None,
+    ):
+
+        # attributes set via input:
+
+        self.bins = bins
+        self.range = range
+
+        # calculated attributes:
+
+        self.edgesx = None
+        self.edgesy = None
+        self.num = None
+        self.den = None
+        self.nfills = 0
+
+        if self.__binning_explicit():
+            self.__set_binning(np.zeros(0), np.zeros(0))
+
+    # check whether the binning is fully defined by the input bins & range, with no need for data, private
+    # (bins as in np.histogram2d: nr. of bins or edges, either for both axes or as a pair, one per axis)
+    def __binning_explicit(self):
+        lsBins = [self.bins, self.bins] if np.isscalar(self.bins) or (len(self.bins) != 2) else list(self.bins)
+        lsRange = [None, None] if self.range is None else list(self.range)
+        return all([(not np.isscalar(lsBins[i])) or (not (lsRange[i] is None)) for i in [0, 1]])
+
+    # check that the map has been filled (or its binning fixed), private
+    def __check_binning(self):
+        if self.den is None:
+            raise ValueError("efficiency map with no binning yet, fill the denominator first")
+
+    # get the efficiency function of an interval type (see ratio), private
+    def __eff_function(self, errType):
+        if errType == "wilson":
+            return effWilson
+        elif errType == "clopper-pearson":
+            return effClopperPearson
+        raise ValueError("unknown interval type %s, either wilson or clopper-pearson" % errType)
+
+    # fix the binning once and for all, private
+    def __set_binning(self, x, y):
+        counts, self.edgesx, self.edgesy = np.histogram2d(x, y, bins=self.bins, range=self.range)
+        self.num = np.zeros(counts.shape)
+        self.den = np.zeros(counts.shape)
+
+    # fill the numerator with a chunk of (array-like) data
+    # note: if the binning is not fixed yet, the denominator must be filled first
+    def fill_num(self, xNum, yNum):
+        self.__check_binning()
+        self.num += np.histogram2d(xNum, yNum, bins=(self.edgesx, self.edgesy))[0]
+
+    # fill the denominator with a chunk of (array-like) data
+    def fill_den(self, xDen, yDen):
+        if self.den is None:
+            self.__set_binning(xDen, yDen)
+        self.den += np.histogram2d(xDen, yDen, bins=(self.edgesx, self.edgesy))[0]
+
+    # fill both numerator and denominator with a chunk of (array-like) data, denominator first
+    def fill(self, xNum, yNum, xDen, yDen):
+        self.fill_den(xDen, yDen)
+        self.fill_num(xNum, yNum)
+        self.nfills += 1
+
+    # compute the efficiency with its confidence interval in each bin
+    # errType is the interval type, either "wilson" or "clopper-pearson"
+    # cl is the confidence level (default 1 sigma)
+    # --> return efficiency, lower and upper interval edges (same orientation as hist2dRatio) and the bin edges
+    def ratio(self, errType="wilson", cl=0.682689492137):
+        self.__check_binning()
+        funcEff = self.__eff_function(errType)
+        eff, effLow, effUp = funcEff(self.num, self.den, cl)
+        return eff.T, effLow.T, effUp.T, self.edgesx, self.edgesy
+
+    # merge groups of adjacent bins, without revisiting the data
+    # nx (ny) is the number of adjacent bins to merge along x (y), it must divide the number of bins
+    # --> return a new (rebinned) map
+    def rebin(self, nx=1, ny=1):
+        self.__check_binning()
+        nbx, nby = self.den.shape
+        if (nbx % nx != 0) | (nby % ny != 0):
+            raise ValueError("rebinning factors (%d, %d) incompatible with %d x %d bins" % (nx, ny, nbx, nby))
+        map_new = cEffMap2d(bins=(self.edgesx[::nx], self.edgesy[::ny]))
+        map_new.num = self.num.reshape(nbx // nx, nx, nby // ny, ny).sum(axis=(1, 3))
+        map_new.den = self.den.reshape(nbx // nx, nx, nby // ny, ny).sum(axis=(1, 3))
+        map_new.nfills = self.nfills
+        return map_new
+
+    # project the accumulated counts onto one axis and compute the corresponding 1d efficiency
+    # axis is the axis to project onto, either "x" or "y"
+    # errType and cl are as in ratio()
+    # --> return efficiency, lower and upper interval edges and the bin edges
+    def project(self, axis="x", errType="wilson", cl=0.682689492137):
+        self.__check_binning()
+        if not (axis in ["x", "y"]):
+            raise ValueError("unknown axis %s, either x or y" % axis)
+        funcEff = self.__eff_function(errType)
+        iaxis = 1 if axis == "x" else 0
+        eff, effLow, effUp = funcEff(self.num.sum(axis=iaxis), self.den.sum(axis=iaxis), cl)
+        return eff, effLow, effUp, self.edgesx if axis == "x" else self.edgesy
+
+    # sum two maps with the same binning (e.g. from different runs) --> return a new map
+    def __add__(self, other):
+        self.__check_binning()
+        other.__check_binning()
+        if not (np.array_equal(self.edgesx, other.edgesx) & np.array_equal(self.edgesy, other.edgesy)):
+            raise ValueError("efficiency maps with different binning cannot be summed")
+        map_new = cEffMap2d(bins=(self.edgesx, self.edgesy))
+        map_new.num = self.num + other.num
+        map_new.den = self.den + other.den
+        map_new.nfills = self.nfills + other.nfills
+        return map_new
+
+    # draw the efficiency map, with the same graphical settings as hist2dRatio
+    def draw(self, ax=None, norm=None, cmap=None):
+        histRatioPlot = np.nan_to_num(self.ratio()[0], nan=0.0)
+        extent = [self.edgesx[0], self.edgesx[-1], self.edgesy[0], self.edgesy[-1]]
+        (ax if ax!=None else plt).imshow(histRatioPlot, origin="lower", extent=extent, norm=norm, cmap=cmap, aspect="auto")
@@ -1 +1,15 @@
-from .wf_analysis_base import cWaveForm
\ No newline at end of file
+from ..lazy import _lazyGetattr, _lazyDir
+
+# objects of the subpackage, imported only when first accessed (see lazy.py)
+_lazyMap = {
+    "cWaveForm" : "wf_analysis_base",
+    "cWfPersistenceMap" : "wf_persistence",
+    "cWfCompact" : "wf_compact",
+}
+__all__ = list(_lazyMap.keys())
+
+def __getattr__(name):
+    return _lazyGetattr(__name__, globals(), _lazyMap, name)
+
+def __dir__():
+    return _lazyDir(globals(), _lazyMap)
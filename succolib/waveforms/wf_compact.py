@@ -0,0 +1,86 @@
+import numpy as np
+
+########################################################################################################################
+
+# choose the smallest integer type that holds a set of raw waveform samples exactly, private
+# y0 is the (events * samples) raw sample matrix
+# --> return the NumPy type (int16 or int32), or the original one if the samples are not (small) integers
+def _wfCompactDtype(y0):
+    y0 = np.asarray(y0)
+    if y0.size == 0:
+        return np.dtype(np.int16)
+    if np.issubdtype(y0.dtype, np.floating) and (not np.all(y0 == np.round(y0))):
+        return y0.dtype
+    for dtype in (np.int16, np.int32):
+        if (np.min(y0) >= np.iinfo(dtype).min) & (np.max(y0) <= np.iinfo(dtype).max):
+            return np.dtype(dtype)
+    return y0.dtype
+
+########################################################################################################################
+
+class cWfCompact:
+    # compact storage of a set of waveforms with the same nr. of samples: the raw (ADC) samples in a single contiguous
+    # (events * samples) integer matrix, a single time axis for all the events, and the signal calibration, polarity
+    # and baseline subtraction applied lazily, i.e. only when the signal values are accessed
+    # the signal values are the same as cWaveForm.y after full_analysis()
+
+    def __init__(
+        self,
+        adc,
+        x,
+        bPositive = True,
+        base = 0,
+        nbit = 12,
+        rangeVpp = 4096,
+        unitY = 1,
+    ):
+
+        # attributes set via input:
+
+        self.adc = np.ascontiguousarray(adc)  # raw samples, (events * samples) matrix -- a view if already contiguous
+        self.x = np.asarray(x, dtype=float)  # time axis, the same for all the events
+        self.bPositive = bPositive  # as in cWaveForm, negative waveforms being made positive
+        self.base = np.broadcast_to(np.asarray(base, dtype=float), (len(self.adc),))  # baseline mean per event
+        self.nbit = nbit  # as in cWaveForm
+        self.rangeVpp = rangeVpp  # as in cWaveForm
+        self.unitY = unitY  # as in cWaveForm
+
+    # --> return the nr. of waveforms
+    def __len__(self):
+        return len(self.adc)
+
+    # select a subset of the waveforms (boolean mask, indices or slice) --> return a new object
+    def __getitem__(self, sel):
+        return cWfCompact(self.adc[sel], self.x, self.bPositive, self.base[sel], self.nbit, self.rangeVpp, self.unitY)
+
+    # --> return the memory taken by the raw samples, the time axis and the baselines, in bytes
+    @property
+    def nbytes(self):
+        return self.adc.nbytes + self.x.nbytes + self.base.nbytes
+
+    # compute the calibrated, positive, baseline-subtracted signal values
+    # sel is the selection of the events to compute (boolean mask, indices or slice), None for all of them
+    # --> return the (events * samples) signal matrix
+    def get_y(self, sel=None):
+        adc = self.adc if sel is None else self.adc[sel]
+        base = self.base if sel is None else self.base[sel]
+        # same operations (and order) as in cWaveForm, for identical values
+        y = adc.astype(float) * self.rangeVpp / (2**int(self.nbit) * self.unitY)
+        if not self.bPositive:
+            y = -y
+        return y - base[:, np.newaxis]
+
+    # --> return the time axis and the signal matrix, as _get_wfs_xy in cWaveFormsCollection
+    def get_xy(self, sel=None):
+        return self.x, self.get_y(sel)
+
+    # --> return the minimum and maximum signal values, computed in chunks (i.e. with no full signal matrix in memory)
+    def get_y_range(self, chunksize=10000):
+        if len(self) == 0:
+            return np.nan, np.nan
+        lsMin, lsMax = [], []
+        for i in range(0, len(self), chunksize):
+            y = self.get_y(slice(i, i+chunksize))
+            lsMin.append(np.nanmin(y))
+            lsMax.append(np.nanmax(y))
+        return min(lsMin), max(lsMax)
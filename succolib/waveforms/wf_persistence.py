@@ -0,0 +1,67 @@
+import numpy as np
+
+########################################################################################################################
+
+class cWfPersistenceMap:
+    # persistence map, i.e. 2d histogram of all the (time, signal) samples of a set of waveforms, filled incrementally
+    # the binning is fixed (uniform) at creation, so that maps can be filled chunk by chunk and summed
+
+    def __init__(
+        self,
+        nbins = (100, 100),
+        range = ((0, 1), (0, 1)),
+    ):
+
+        # attributes set via input:
+
+        self.nbins = (int(nbins), int(nbins)) if np.isscalar(nbins) else (int(nbins[0]), int(nbins[1]))
+        self.range = ((float(range[0][0]), float(range[0][1])), (float(range[1][0]), float(range[1][1])))
+
+        # calculated attributes:
+
+        self.edgesx = np.linspace(self.range[0][0], self.range[0][1], self.nbins[0]+1)
+        self.edgesy = np.linspace(self.range[1][0], self.range[1][1], self.nbins[1]+1)
+        self.counts = np.zeros(self.nbins)
+        self.nevs = 0
+
+    # compute the (flat) bin index of each value along one axis, -1 if out of range or not finite, private
+    def __bin_index(self, values, iaxis):
+        lo, hi = self.range[iaxis]
+        with np.errstate(invalid="ignore"):
+            ind = np.floor((values - lo) * (self.nbins[iaxis] / (hi - lo)))
+            ind[values == hi] = self.nbins[iaxis] - 1  # last bin edge included, as in np.histogram
+            ind[~((ind >= 0) & (ind < self.nbins[iaxis]))] = -1
+        return ind.astype(np.int64)
+
+    # add a chunk of waveforms
+    # x is the time axis (1d array, common to all the waveforms), y is the (events * samples) signal matrix
+    def fill(self, x, y):
+        y = np.asarray(y, dtype=float)
+        if y.size == 0:
+            return
+        indx = self.__bin_index(np.asarray(x, dtype=float), 0)  # same for all the events, computed once
+        indy = self.__bin_index(y, 1)
+        indflat = (indx * self.nbins[1])[np.newaxis, :] + indy
+        bok = (indx >= 0)[np.newaxis, :] & (indy >= 0)
+        self.counts += np.bincount(
+            indflat[bok], minlength=self.nbins[0]*self.nbins[1]
+        ).reshape(self.nbins)
+        self.nevs += y.shape[0]
+
+    # sum two maps with the same binning (e.g. from different runs) --> return a new map
+    def __add__(self, other):
+        if (self.nbins != other.nbins) | (self.range != other.range):
+            raise ValueError("persistence maps with different binning cannot be summed")
+        map_new = cWfPersistenceMap(self.nbins, self.range)
+        map_new.counts = self.counts + other.counts
+        map_new.nevs = self.nevs + other.nevs
+        return map_new
+
+    # --> return the map as a 2d histogram, with the same format as cCollection.create_histo_2d
+    def get_hist2d(self):
+        return [
+            self.edgesx[:-1] + 0.5 * (self.edgesx[1]-self.edgesx[0]),
+            self.edgesy[:-1] + 0.5 * (self.edgesy[1]-self.edgesy[0]),
+            self.counts,
+            self.nevs,
+        ]